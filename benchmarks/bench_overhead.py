@@ -0,0 +1,233 @@
+# neurtu, BSD 3 clause license
+# Authors: Roman Yurchak
+"""
+Overhead of neurtu
+==================
+
+Measure the time added by neurtu itself, compared to plain :mod:`timeit`:
+
+ - per iteration, when evaluating delayed chains of increasing depth, with
+   and without environment variables,
+ - per case, when running benchmarks with an increasing number of cases
+   (timed with neurtu itself).
+
+Overheads are normalized by the time of an empty function call (measured
+in a loop of 1000 calls, before and after the other measurements), so that
+they can be compared across machines, and checked against the stored
+baseline::
+
+    python benchmarks/bench_overhead.py                 # check
+    python benchmarks/bench_overhead.py --save-baseline # update baseline
+
+The script exits with a non-zero status when an overhead regressed by more
+than the tolerance (25% by default). Timings depend on the machine and its
+load, so CI only reports the overheads (``--report-only``) and never
+fails on them.
+"""
+
+from __future__ import division
+
+import argparse
+import gc
+import json
+import os
+import sys
+import timeit as cpython_timeit
+from collections import OrderedDict
+
+from neurtu import Benchmark, delayed
+from neurtu.metrics import measure_wall_time
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             'baseline.json')
+
+CHAIN_DEPTHS = [1, 2, 5, 10, 20, 50]
+N_CASES = [10, 100, 1000, 10000, 100000]
+
+
+class Node(object):
+    """Object with an attribute pointing to itself, used to build chains
+    of arbitrary depth"""
+    def __init__(self):
+        self.child = self
+
+    def __call__(self):
+        return None
+
+
+def noop():
+    return None
+
+
+def _noop_loop(n_calls=1000):
+    for _ in range(n_calls):
+        noop()
+
+
+def _chain(depth, env=None):
+    """Delayed chain ``node.child.child...()`` with ``depth`` operations,
+    and the equivalent plain function"""
+    node = Node()
+    obj = delayed(node, env=env)
+    for _ in range(depth - 1):
+        obj = obj.child
+    obj = obj()
+    plain = eval('lambda: node%s()' % ('.child' * (depth - 1)),
+                 {'node': node})
+    return obj, plain
+
+
+def _min_time(func, number, repeat=7):
+    """Minimum time per evaluation of ``func`` in s"""
+    gc.collect()
+    return min(func(number) for _ in range(repeat))
+
+
+def iteration_overhead(number=10000):
+    """Overhead per evaluation of a delayed object, in s"""
+    res = OrderedDict()
+    for name, depths, env in [('iteration_depth_%s', CHAIN_DEPTHS, None),
+                              ('iteration_env_depth_%s', [1],
+                               {'NEURTU_BENCH': '1'})]:
+        for depth in depths:
+            obj, plain = _chain(depth, env=env)
+            t_neurtu = _min_time(
+                lambda n: measure_wall_time(obj, number=n), number)
+            t_plain = _min_time(
+                lambda n: cpython_timeit.timeit(plain, number=n) / n, number)
+            res[name % depth] = t_neurtu - t_plain
+    return res
+
+
+def _run_cases(bench, cases):
+    return bench(cases)
+
+
+def case_overhead(n_cases=N_CASES):
+    """Overhead per case of :class:`neurtu.Benchmark`, in s
+
+    Cases are measured with a metric that does not evaluate them, so that
+    only the orchestration is timed. Unless mentioned otherwise, garbage
+    collection before each metric is disabled. Metadata are not collected,
+    as their cost (e.g. of the ``git`` subprocesses) does not depend on the
+    number of cases. Other parameters are the defaults.
+    """
+    def metric(obj):
+        return 0.0
+
+    configs = [('case_n_%s' % n, n, {'gc': 'enabled'}) for n in n_cases]
+    configs.append(('case_gc_collect_n_100', 100, {}))
+    try:
+        import pandas  # noqa
+        configs.append(('case_dataframe_n_10000', 10000,
+                        {'gc': 'enabled', 'to_dataframe': True}))
+    except ImportError:  # pragma: no cover
+        pass
+
+    # the best of several runs, excluding one-off initializations (e.g.
+    # of the static metadata)
+    timer = Benchmark(wall_time=True, progress_bar=False, metadata=False,
+                      repeat=3, aggregate='min')
+    Benchmark(progress_bar=False, metadata=False,
+              metric=metric)(delayed(noop)())
+    res = OrderedDict()
+    for name, n, params in configs:
+        bench = Benchmark(progress_bar=False, metadata=False, metric=metric,
+                          **params)
+        cases = [delayed(noop, tags={'idx': idx})() for idx in range(n)]
+        row = timer(delayed(_run_cases)(bench, cases))[0]
+        res[name] = row['wall_time'] / n
+        # keep the heap small, as it impacts garbage collection
+        del cases
+    return res
+
+
+def reference_time(n_calls=1000, repeat=30):
+    """Time of an empty function call in s, measured in a loop to amortize
+    the timer overhead"""
+    return _min_time(
+        lambda n: cpython_timeit.timeit(_noop_loop, number=n) / n / n_calls,
+        100, repeat=repeat)
+
+
+def run(n_cases=N_CASES):
+    """Measure all overheads
+
+    Returns
+    -------
+    res : dict
+      overheads in s, and ``reference``, the time of an empty function call
+    """
+    res = OrderedDict()
+    reference = reference_time()
+    res.update(iteration_overhead())
+    res.update(case_overhead(n_cases))
+    # the fastest of both, less affected by the load of the machine
+    res['reference'] = min(reference, reference_time())
+    return res
+
+
+def check(res, baseline, tolerance):
+    """Compare normalized overheads with the baseline
+
+    Returns
+    -------
+    regressions : list of str
+    """
+    regressions = []
+    print('%-28s %12s %12s %12s'
+          % ('overhead', 'time (us)', 'relative', 'baseline'))
+    for key, val in res.items():
+        if key == 'reference':
+            continue
+        relative = val / res['reference']
+        ref = baseline.get(key)
+        print('%-28s %12.3f %12.1f %12s'
+              % (key, val * 1e6, relative,
+                 '%.1f' % ref if ref is not None else '-'))
+        # overheads within one empty call are within the measurement noise
+        if ref is not None and relative > ref * (1 + tolerance) + 1:
+            regressions.append(key)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Measure the overhead of neurtu')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='store the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed relative increase of the overheads '
+                             '(default: 0.25)')
+    parser.add_argument('--max-cases', type=int, default=max(N_CASES),
+                        help='largest number of cases in the sweeps')
+    parser.add_argument('--report-only', action='store_true',
+                        help='report regressions without failing, e.g. on '
+                             'shared CI machines')
+    args = parser.parse_args(argv)
+
+    res = run([n for n in N_CASES if n <= args.max_cases])
+    if args.save_baseline:
+        baseline = OrderedDict((key, round(val / res['reference'], 1))
+                               for key, val in res.items()
+                               if key != 'reference')
+        with open(BASELINE_PATH, 'w') as fh:
+            json.dump(baseline, fh, indent=2)
+            fh.write('\n')
+        print('Baseline saved to %s' % BASELINE_PATH)
+        return 0
+
+    baseline = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH) as fh:
+            baseline = json.load(fh)
+    regressions = check(res, baseline, args.tolerance)
+    if regressions:
+        print('Overhead regressions: %s' % ', '.join(regressions))
+        if not args.report_only:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -33,7 +33,7 @@ def benchmark_cases():
             yield model.fit(X[:N], y[:N])
 
 
-bench = Benchmark(wall_time=True, peak_memory=True)
+bench = Benchmark(wall_time=True, peak_memory=True, to_dataframe=True)
 df = bench(benchmark_cases())
 
 print(df.tail())
@@ -16,6 +16,7 @@ rng = np.random.RandomState(42)
 df = timeit(delayed(np.sort, tags={'N': N, 'kind': kind})(rng.rand(N), kind=kind)
             for N in np.logspace(2, 5, num=5).astype('int')
             for kind in ["quicksort", "mergesort", "heapsort"])
+df = df.to_pandas()
 
 print(df.to_string())
 
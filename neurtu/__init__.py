@@ -1,4 +1,9 @@
 from .base import Benchmark, timeit, memit  # noqa
-from .delayed import delayed, Delayed # noqa
+from .delayed import delayed, precompute, Delayed # noqa
+from .metrics import MemoryTimeline  # noqa
+from .resultset import ResultSet  # noqa
+from .compare import compare_impls  # noqa
+from .grid import grid  # noqa
+from .instrument import instrument  # noqa
 
 __version__ = '0.3.0'
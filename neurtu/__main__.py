@@ -0,0 +1,133 @@
+# neurtu, BSD 3 clause license
+# Authors: Roman Yurchak
+"""Command line interface: ``neurtu <command>``"""
+
+import argparse
+import json
+import sys
+
+
+def _worker(args):
+    from .executors import serve, serve_stdio
+    if args.stdio:
+        serve_stdio()
+        return
+    authkey = args.authkey.encode('utf-8') if args.authkey else None
+    try:
+        serve(host=args.host, port=args.port, authkey=authkey,
+              heartbeat=args.heartbeat)
+    except ValueError as exc:
+        sys.exit('neurtu worker: %s' % exc)
+
+
+def _replay(args):
+    from .base import Benchmark
+    from .serialize import load, read_header
+
+    header = read_header(args.path)
+    obj = load(args.path)
+    metrics = dict((name, True) for name in args.metric or ['wall_time'])
+    bench = Benchmark(repeat=args.repeat, progress_bar=False, **metrics)
+    res = bench(obj)
+    rows = [res] if isinstance(res, dict) else [dict(row) for row in res]
+    if args.json:
+        print(json.dumps(rows, default=str))
+        return
+    print('%s' % header['repr'])
+    print('saved with neurtu %s, Python %s on %s'
+          % (header['neurtu_version'], header['python'], header['created']))
+    for row in rows:
+        for key, val in row.items():
+            print('  %s: %s' % (key, val))
+
+
+def _history(args):
+    from .history import detect_changes, history_report
+    from .store import ResultStore
+
+    store = ResultStore(args.store)
+    params = dict(metric=args.metric, method=args.method,
+                  penalty=args.penalty, min_size=args.min_size,
+                  min_change=args.min_change)
+    if args.output:
+        changes = history_report(store, args.output, **params)
+    else:
+        changes = detect_changes(store, **params)
+    if len(changes):
+        print(changes)
+    else:
+        print('No changes detected in %s runs.' % len(store.runs()))
+    if args.output:
+        print('Report written to %s' % args.output)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='neurtu')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    worker = subparsers.add_parser(
+        'worker', help='run a worker evaluating benchmark cases sent by a '
+                       'RemoteExecutor')
+    worker.add_argument('--host', default='127.0.0.1',
+                        help='address to listen on (default: 127.0.0.1)')
+    worker.add_argument('--port', type=int, default=0,
+                        help='port to listen on (default: a free port)')
+    worker.add_argument('--authkey', default=None,
+                        help='secret authentication key, required unless '
+                             'the NEURTU_AUTHKEY environment variable is '
+                             'set. Anyone knowing it can run arbitrary code '
+                             'on the worker.')
+    worker.add_argument('--heartbeat', type=float, default=1.0,
+                        help='interval between heartbeats in s')
+    worker.add_argument('--stdio', action='store_true',
+                        help='evaluate cases received on the standard input '
+                             'instead of listening on a socket')
+    worker.set_defaults(func=_worker)
+
+    replay = subparsers.add_parser(
+        'replay', help='benchmark a case saved with neurtu.serialize.dump')
+    replay.add_argument('path', help='path of the .nrt case file')
+    replay.add_argument('--metric', action='append',
+                        choices=['wall_time', 'cpu_time', 'peak_memory',
+                                 'gc_time', 'io_counters'],
+                        help='metric to measure, can be repeated '
+                             '(default: wall_time)')
+    replay.add_argument('--repeat', type=int, default=1,
+                        help='number of repeated measurements')
+    replay.add_argument('--json', action='store_true',
+                        help='print the results as JSON')
+    replay.set_defaults(func=_replay)
+
+    history = subparsers.add_parser(
+        'history', help='detect changes in the runs of a result store')
+    history.add_argument('store', help='path of the neurtu.store.ResultStore '
+                                       'directory')
+    history.add_argument('--metric', default='wall_time',
+                         help='metric to analyze (default: wall_time)')
+    history.add_argument('--method', default='mean',
+                         choices=['mean', 'min', 'max', 'sum'],
+                         help='aggregation of the samples of each run '
+                              '(default: mean)')
+    history.add_argument('--penalty', type=float, default=None,
+                         help='penalty of the changepoint detection '
+                              '(default: 3 log(number of runs))')
+    history.add_argument('--min-size', type=int, default=2,
+                         help='minimum number of runs between changes')
+    history.add_argument('--min-change', type=float, default=0.01,
+                         help='minimum relative change to report '
+                              '(default: 0.01)')
+    history.add_argument('--output', '-o', default=None,
+                         help='path of the HTML report')
+    history.set_defaults(func=_history)
+
+    args = parser.parse_args(argv)
+    try:
+        args.func(args)
+    except KeyboardInterrupt:
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,9 +2,15 @@
 # Authors: Roman Yurchak
 
 import sys
+import itertools
 from collections.abc import Iterable
 import timeit as cpython_timeit
 import gc
+import threading
+import time
+import traceback
+import warnings
+from collections import OrderedDict
 
 try:
     from tqdm.auto import tqdm
@@ -12,19 +18,38 @@ except ImportError:  # pragma: no cover
     tqdm = None
 
 
-from .delayed import _is_delayed
-from .utils import import_or_none
+from .delayed import _is_delayed, _environ
+from .executors import LocalExecutor, IsolatedExecutor, EnvironmentExecutor
+from .grid import Grid
+from .resultset import ResultSet, _get_aggregation, _AGGREGATION_PRESETS
+from .roofline import machine_peaks, throughput
+from .cache import detect_files, evict_files, flush_cpu_caches
 from .metrics import measure_wall_time, measure_cpu_time
-from .metrics import measure_peak_memory
+from .metrics import measure_peak_memory, measure_memory_timeline
+from .metrics import measure_gc_time, measure_io
+from .incremental import IncrementalCache
+from .metadata import collect_metadata, _code_under_test
+from .metadata import _package_version, _static_metadata
+from .system import Isolation, loadavg
 
+GC_POLICIES = ('disabled', 'enabled', 'collect-before')
+CACHE_MODES = ('warm', 'cold', 'both')
 
-def _validate_timer_precision(res_mean, func, obj_el, params):
+_PANDAS_AGGREGATIONS = ('count', 'sum', 'mean', 'median', 'var', 'std',
+                        'min', 'max')
+
+
+def _validate_timer_precision(res_mean, func, obj_el, params,
+                              collect=gc.collect):
     """For timing measurements, increase the number of iterations
-    if the precision is unsufficient"""
+    if the precision is unsufficient
+
+    Returns the measurement and the number of iterations used."""
     if sys.platform in ['win32', 'darwin']:
         timer_threashold = 0.5
     else:
         timer_threashold = 0.1
+    number = params.get('number', 1)
     if res_mean < timer_threashold:
         # if the measured timeing is below the threashold,
         # it won't be very accurate. Increase the
@@ -37,12 +62,81 @@ def _validate_timer_precision(res_mean, func, obj_el, params):
         else:
             corrected_number = int(timer_threashold / res_mean)
         if corrected_number == 1:
-            return res_mean
+            return res_mean, number
         params = params.copy()
-        params['number'] = corrected_number
-        gc.collect()
+        params['number'] = number = corrected_number
+        if collect is not None:
+            collect()
         res_mean = func(obj_el, **params)
-    return res_mean
+    return res_mean, number
+
+
+def _pandas_aggregation(methods):
+    """Convert aggregation methods not supported by pandas to functions"""
+    if isinstance(methods, str) and methods in _AGGREGATION_PRESETS:
+        methods = _AGGREGATION_PRESETS[methods]
+    if isinstance(methods, str) or callable(methods):
+        return _pandas_aggregation([methods])[0]
+    res = []
+    for method in methods:
+        if isinstance(method, str) and method not in _PANDAS_AGGREGATIONS:
+            name, func = _get_aggregation(method)
+
+            def method(values, func=func):
+                return func(list(values))
+            method.__name__ = name
+        res.append(method)
+    return res
+
+
+class _GarbageCollector(object):
+    """Amortized garbage collection before measurements
+
+    The youngest generation is collected each time, while full collections,
+    whose duration grows with the size of the heap, are spaced so that they
+    take at most ``ratio`` of the total time.
+    """
+    def __init__(self, ratio=0.1):
+        self.ratio = ratio
+        self.last_end = None
+        self.last_duration = 0.0
+
+    def __call__(self):
+        t0 = cpython_timeit.default_timer()
+        if (self.last_end is None or
+                t0 - self.last_end >= self.last_duration / self.ratio):
+            gc.collect()
+            self.last_end = cpython_timeit.default_timer()
+            self.last_duration = self.last_end - t0
+        else:
+            gc.collect(0)
+
+
+def _with_runid(rows, n_rows_per_run):
+    """Add the ``runid`` to result rows"""
+    for idx, row in enumerate(rows):
+        row['runid'] = idx // n_rows_per_run
+        yield row
+
+
+def _to_run_order(rows, n_cases, repeat, n_rows_per_case):
+    """Reorder result rows evaluated case by case (all runs of the first
+    case, then of the second case, ...) run by run"""
+    rows = list(rows)
+    chunk = n_rows_per_case
+    return [row for run in range(repeat) for idx in range(n_cases)
+            for row in rows[(idx * repeat + run) * chunk:
+                            (idx * repeat + run + 1) * chunk]]
+
+
+class _NullContext(object):
+    """Context manager doing nothing (``contextlib.nullcontext`` requires
+    Python 3.7)"""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
 
 
 class _ProgressBar(object):
@@ -64,11 +158,11 @@ class _ProgressBar(object):
         self.idx = 0
         self.pbar = None
 
-    def increment(self):
+    def increment(self, n=1):
         """
         Decide whether to print a progress bar, update it if necessary
         """
-        self.idx += 1
+        self.idx += n
         if tqdm is None or not self.delay:
             pass
         elif self.pbar is None:
@@ -77,7 +171,7 @@ class _ProgressBar(object):
                 self.pbar = tqdm(total=self.N, leave=False)
                 self.pbar.update(self.idx)
         else:
-            self.pbar.update(1)
+            self.pbar.update(n)
 
     def close(self):
         if self.pbar is not None:
@@ -99,37 +193,163 @@ class Benchmark(object):
     peak_memory : {bool, dict}, default=False
       measure peak memory usage. When a dictionary, it is passed as parameters
       to the :func:`measure_peak_memory` function.
+    memory_timeline : {bool, dict}, default=False
+      record the memory usage over time as a :class:`MemoryTimeline`. When a
+      dictionary, it is passed as parameters to the
+      :func:`measure_memory_timeline` function. Timelines are not numeric
+      and are only kept when repeated runs are not aggregated.
+    gc_time : {bool, dict}, default=False
+      measure the time spent in garbage collection and the number of
+      collections per generation. When a dictionary, it is passed as
+      parameters to the :func:`measure_gc_time` function.
+    io_counters : bool, default=False
+      measure I/O, page faults and context switches with the
+      :func:`measure_io` function.
     repeat : int, default=1
         number of repeated measurements
-    aggregate : {collection, False}, default=('mean', 'max', 'std')
+    aggregate : {collection, str, False}, default=('mean', 'max', 'std')
        when repeat > 1, different runs are indexed by the ``runid`` key.
-       If pandas is installed and aggregate is a collection, aggregate repeated
-       runs with the provided methods.
+       If aggregate is a collection, aggregate repeated runs with the
+       provided methods (see :meth:`GroupBy.agg`). Use ``'robust'`` for
+       the median, median absolute deviation, bootstrap confidence interval
+       and number of outliers.
     to_dataframe : bool, default=None
-      whether to convert parametric results to a daframe. By default convert to
-      dataframe is pandas is installed.
+      format of parametric results. By default return a
+      :class:`ResultSet`. If True, convert the results to a
+      ``pandas.DataFrame``, if False return a list of dictionaries.
     progress_bar : {bool, float}, default=5.0
       if a number, and tqdm is installed, display the progress bar when the
       estimated benchmark time is larger than the given number of seconds.
       If False, the progress bar will not be displayed.
+    gc : {'disabled', 'enabled', 'collect-before'}, default='disabled'
+      garbage collection policy. With ``'disabled'``, garbage is collected
+      before each metric, and the garbage collector is disabled while
+      measuring wall and CPU time. With ``'collect-before'``, garbage is
+      collected before each metric, but the garbage collector stays
+      enabled. With ``'enabled'``, the garbage collector is left untouched,
+      as in production code. Full collections before metrics are amortized
+      (only the youngest generation is collected otherwise), so that they
+      take at most 10% of the benchmark time with large heaps.
+    roofline : {bool, dict}, default=False
+      when wall time is measured, throughputs are computed for delayed
+      objects with declared work counts (see :func:`delayed`). If True,
+      also report the ``roofline_fraction`` of the attainable performance,
+      using machine peaks estimated by
+      :func:`neurtu.roofline.machine_peaks`. A dictionary of
+      ``peak_gflops`` and ``bandwidth_gbs`` can also be provided.
+    executor : object, default=None
+      backend evaluating the cases, e.g. a
+      :class:`neurtu.executors.RemoteExecutor`. By default, cases are
+      evaluated sequentially in the calling process.
+    timeout : float, default=None
+      if provided, evaluate each case in a child process killed after
+      ``timeout`` seconds. See :class:`neurtu.executors.IsolatedExecutor`.
+    memory_limit : float, default=None
+      if provided, evaluate each case in a child process that can allocate
+      at most ``memory_limit`` MB. See
+      :class:`neurtu.executors.IsolatedExecutor`.
+    environments : {list, dict}, default=None
+      if provided, evaluate each case in each of the given Python
+      interpreters or virtual environments, with an additional
+      ``environment`` index. See
+      :class:`neurtu.executors.EnvironmentExecutor`.
+    cache : {'warm', 'cold', 'both'}, default='warm'
+      cache state for the measurements. With ``'warm'``, cases are
+      evaluated as is, typically with data in the OS page cache and CPU
+      caches after the first evaluation. With ``'cold'``, the files used by
+      the case are evicted from the page cache and the CPU caches are
+      flushed before each metric, and wall and CPU time are measured on a
+      single evaluation. With ``'both'``, cold metrics are reported next to
+      warm metrics, with a ``_cold`` suffix.
+    cache_files : {list, callable}, default=None
+      files to evict from the page cache in cold mode, or a callable taking
+      the tags dictionary and returning them. By default, use the existing
+      files passed as arguments to the delayed object.
+    events : list of callable, default=None
+      telemetry hooks called with each event of the run (case started,
+      calibration done, measurement, case finished, error) as a
+      dictionary. See :mod:`neurtu.events` for the events and the
+      built-in JSON lines, Prometheus and statsd emitters. With other
+      executors than the default one, events are emitted by the calling
+      process once results are received, and ``calibration_done`` events
+      are not emitted.
+    system : {None, 'isolated', dict}, default=None
+      with ``'isolated'``, report the frequency scaling settings of the
+      CPUs available to the process in ``res.metadata['system']``, and
+      record the 1 minute load average before and after each case in the
+      ``loadavg_before`` and ``loadavg_after`` columns (Linux only). A
+      warning is raised for noisy settings that can be fixed with the
+      permissions of the process (e.g. powersave governor, turbo boost),
+      for settings that changed during the benchmark, and for a high
+      load. The process is not pinned by default, so that multi-threaded
+      cases keep all their CPUs: to pin it (and the child processes it
+      creates) or raise its priority, provide a dictionary of parameters
+      of :class:`neurtu.system.Isolation`, e.g.
+      ``{'cpus': [3], 'priority': True}``.
+    metadata : bool, default=True
+      collect the environment and hardware metadata of the run (CPU model,
+      cores, caches, memory, kernel, Python build, versions of the
+      packages under test, BLAS and OpenMP thread pools, git commit) once,
+      and store it in ``res.metadata`` (or ``df.attrs`` for dataframes).
+      See :func:`neurtu.metadata.collect_metadata`.
+    incremental : str, default=None
+      path of a cache file enabling incremental benchmarks. The source
+      files executed by each case are recorded after its measurement (with
+      :func:`sys.settrace`), and on the following runs, cases are only
+      measured again if one of these files changed, or if the benchmark
+      parameters changed. Cached results are reused for the other cases.
+      Cases are identified by their tags, env and a fingerprint of the
+      delayed computation; grids are converted to a list of cases. Only
+      supported with the default local executor. See
+      :mod:`neurtu.incremental`.
+    include_children : bool, default=False
+      account for the whole process tree in the ``cpu_time``,
+      ``peak_memory`` and ``memory_timeline`` metrics, for code running
+      in subprocesses (e.g. with joblib or multiprocessing). Memory usage
+      is the sum of the memory of all processes, and the largest and
+      summed peak memory of the child processes are reported in the
+      ``peak_memory_child_max`` and ``peak_memory_child_sum`` columns.
     **kwargs : dict
       custom evaluation metrics of the form ``key=func``,
       where ``key`` is the metric name, and the ``func`` is the evaluation
-      metric that accepts a ``Delayed`` object: ``func(obj)``.
+      metric that accepts a ``Delayed`` object: ``func(obj)``. Metrics
+      returning a dictionary produce one column per key.
     """
     def __init__(self, wall_time=None, cpu_time=False, peak_memory=False,
-                 repeat=1, aggregate=('mean', 'max', 'std'), to_dataframe=None,
-                 progress_bar=5.0, **kwargs):
+                 memory_timeline=False, gc_time=False, io_counters=False,
+                 repeat=1,
+                 aggregate=('mean', 'max', 'std'), to_dataframe=None,
+                 progress_bar=5.0, gc='disabled', roofline=False,
+                 executor=None, timeout=None, memory_limit=None,
+                 environments=None, cache='warm', cache_files=None,
+                 include_children=False, events=None, system=None,
+                 metadata=True, incremental=None, **kwargs):
+        if cache not in CACHE_MODES:
+            raise ValueError('cache=%s should be one of %s'
+                             % (cache, ', '.join(CACHE_MODES)))
+        if gc not in GC_POLICIES:
+            raise ValueError('gc=%s should be one of %s'
+                             % (gc, ', '.join(GC_POLICIES)))
         metrics = {}
         for name, params, func in [
                 ('wall_time', wall_time, measure_wall_time),
                 ('cpu_time', cpu_time, measure_cpu_time),
-                ('peak_memory', peak_memory, measure_peak_memory)]:
+                ('peak_memory', peak_memory, measure_peak_memory),
+                ('memory_timeline', memory_timeline,
+                 measure_memory_timeline),
+                ('gc_time', gc_time, measure_gc_time),
+                ('io_counters', io_counters, measure_io)]:
             if params:
                 if params is True:
                     params = {}
                 else:
                     params = params.copy()
+                if name in ['wall_time', 'cpu_time']:
+                    params.setdefault('disable_gc', gc == 'disabled')
+                if (include_children and
+                        name in ['cpu_time', 'peak_memory',
+                                 'memory_timeline']):
+                    params.setdefault('include_children', True)
                 params['func'] = func
                 metrics[name] = params
         for name, params in kwargs.items():
@@ -142,12 +362,67 @@ class Benchmark(object):
 
         if not metrics:
             # if no metrics were explicitly enabled, measure wall_time
-            metrics['wall_time'] = {'func': measure_wall_time}
+            metrics['wall_time'] = {'func': measure_wall_time,
+                                    'disable_gc': gc == 'disabled'}
         self.metrics = metrics
+        # metric functions and parameters, prepared once for all cases
+        self._metric_funcs = [
+            (name, params['func'],
+             dict((key, val) for key, val in params.items() if key != 'func'))
+            for name, params in metrics.items()]
+        self._collect = _GarbageCollector() if gc != 'enabled' else None
+        # number of remaining cases depending on each precomputed node
+        self._refcounts = {}
         self.repeat = repeat
         self.aggregate = aggregate
         self.to_dataframe = to_dataframe
         self.progress_bar = progress_bar
+        self.gc = gc
+        self.roofline = roofline
+        self.cache = cache
+        self.cache_files = cache_files
+        if environments is not None:
+            if executor is not None:
+                raise ValueError('environments cannot be used with a custom '
+                                 'executor!')
+            executor = EnvironmentExecutor(environments)
+        if executor is None:
+            if timeout is not None or memory_limit is not None:
+                executor = IsolatedExecutor(timeout=timeout,
+                                            memory_limit=memory_limit)
+            else:
+                executor = LocalExecutor()
+        elif timeout is not None or memory_limit is not None:
+            raise ValueError('timeout and memory_limit cannot be used with '
+                             'a custom executor!')
+        self.executor = executor
+        self.events = list(events or [])
+        if system is None:
+            self._isolation = None
+        elif system == 'isolated':
+            self._isolation = Isolation()
+        elif isinstance(system, dict):
+            self._isolation = Isolation(**system)
+        else:
+            raise ValueError("system=%s should be one of None, 'isolated' "
+                             "or a dict" % system)
+        self.system = system
+        self.metadata = metadata
+        if incremental is not None and \
+                not isinstance(self.executor, LocalExecutor):
+            # dependencies are traced in the calling process
+            raise ValueError('incremental benchmarks can only be evaluated '
+                             'with the default local executor, got %s'
+                             % type(self.executor).__name__)
+        self.incremental = incremental
+        self._events_lock = threading.Lock()
+
+    def __getstate__(self):
+        # events are emitted by the calling process
+        state = self.__dict__.copy()
+        state['events'] = []
+        state['_events_lock'] = None
+        return state
 
     def __call__(self, obj):
         """Evaluate metrics on the delayed object
@@ -155,12 +430,16 @@ class Benchmark(object):
         Parameters
         ----------
         obj: :class:`Delayed` or iterable of :class:`Delayed`
-          a delayed computation or an iterable of delayed computations
+          a delayed computation or an iterable of delayed computations.
+          A :class:`neurtu.grid.Grid` is evaluated lazily, without holding
+          all cases in memory.
         """
 
         if _is_delayed(obj):
             obj = [obj]
-        if isinstance(obj, list) and len(obj) == 1 and self.repeat == 1:
+        n_rows_per_case = getattr(self.executor, 'n_rows_per_case', 1)
+        if isinstance(obj, list) and len(obj) == 1 and self.repeat == 1 \
+                and n_rows_per_case == 1:
             iterable_input = False
         else:
             iterable_input = True
@@ -169,14 +448,158 @@ class Benchmark(object):
             raise ValueError(('obj=%s must be either a Delayed object or a '
                               'iterable of delayed objects!') % obj)
 
-        # convert the iterable to list
-        obj = list(obj)
+        if isinstance(obj, Grid) and self.incremental is None:
+            # grids are evaluated as a stream, and have unique tags
+            index = obj.tag_names
+        else:
+            # convert the iterable to list
+            obj = list(obj)
+            self._check_unique_tags(obj)
+            index = list(obj[0].get_tags().keys())
+        index = index + list(getattr(self.executor, 'index', ()))
+        n_cases = len(obj)
+
+        if self.incremental is not None:
+            incremental = IncrementalCache(
+                self.incremental,
+                self._incremental_config(n_rows_per_case, obj))
+            keys = [incremental.key(el) for el in obj]
+            evaluated = [el for el, key in zip(obj, keys)
+                         if not incremental.is_fresh(key)]
+        else:
+            incremental = None
+            evaluated = obj
+        if not isinstance(evaluated, Grid) and \
+                isinstance(self.executor, LocalExecutor):
+            self._refcounts = self._count_precomputed(evaluated)
+        else:
+            # node ids are meaningless in the processes of other executors,
+            # where prefixes are computed with each case
+            self._refcounts = {}
+
+        if self.roofline is True:
+            self._peaks = machine_peaks()
+        elif self.roofline:
+            self._peaks = self.roofline
+        else:
+            self._peaks = None
 
-        tags_all = list(set([self._hash_tags_env(el) for el in obj]))
+        pbar = _ProgressBar(
+                len(evaluated)*self._n_metrics_per_case()*self.repeat,
+                self.progress_bar
+        )
+        if self.repeat > 1:
+            index.append('runid')
+        metadata = OrderedDict()
+        if self.metadata and iterable_input and self.to_dataframe is not False:
+            packages, path = _code_under_test(obj)
+            metadata.update(collect_metadata(packages, path))
+        if self._isolation is not None:
+            isolation = self._isolation
+        else:
+            isolation = _NullContext()
+        with isolation:
+            if self._isolation is not None:
+                metadata['system'] = report = self._isolation.report()
+                for issue in report['warnings']:
+                    warnings.warn('Noisy system: %s' % issue)
+            if self._refcounts and self.repeat > 1:
+                # repeated runs of a case are evaluated consecutively, so
+                # that prefixes can be released after their last case
+                cases = itertools.chain.from_iterable(
+                        itertools.repeat(el, self.repeat) for el in evaluated)
+                rows = _to_run_order(self.executor.map(self, cases, pbar),
+                                     len(evaluated), self.repeat,
+                                     n_rows_per_case)
+            else:
+                cases = itertools.chain.from_iterable(
+                        itertools.repeat(evaluated, self.repeat))
+                rows = (self.executor.map(self, cases, pbar)
+                        if evaluated else [])
+            if incremental is not None:
+                rows = incremental.merge(obj, keys, rows, self.repeat,
+                                         n_rows_per_case)
+            if self.repeat > 1:
+                rows = _with_runid(rows, n_cases * n_rows_per_case)
+
+            if not iterable_input or self.to_dataframe is False:
+                db = list(rows)
+            else:
+                # rows are accumulated in columns as they are evaluated
+                res = ResultSet.from_records(rows, index=index,
+                                             metadata=metadata)
+            if self._isolation is not None:
+                for issue in self._isolation.changes():
+                    report['warnings'].append(issue)
+                    warnings.warn('Noisy system: %s' % issue)
+        pbar.close()
+        if incremental is not None:
+            incremental.save()
+            metadata['incremental'] = OrderedDict([
+                ('path', self.incremental),
+                ('reused', incremental.n_reused),
+                ('measured', incremental.n_measured)])
+
+        if not iterable_input or self.to_dataframe is False:
+            return db if iterable_input else db[0]
+
+        if self.to_dataframe:
+            return self._aggregate_dataframe(res.to_pandas(), index)
+
+        if self.repeat > 1 and self.aggregate:
+            index.remove('runid')
+            res = res.groupby(index).agg(self.aggregate)
+        return res
+
+    def _incremental_config(self, n_rows_per_case, cases=()):
+        """Configuration identifying the results of a case in the
+        incremental cache
+
+        It includes the interpreter, the host and the versions of the
+        packages of the objects wrapped by the cases, as code without
+        source files (e.g. builtins or C extensions) is not traced.
+        """
+        metrics = [(name, getattr(func, '__qualname__', repr(func)),
+                    sorted(params.items()))
+                   for name, func, params in self._metric_funcs]
+        static = _static_metadata()
+        packages, _ = _code_under_test(cases)
+        environment = (sys.version, sys.executable, static['hostname'],
+                       static['cpu']['model'],
+                       [(name, _package_version(name))
+                        for name in sorted(packages)])
+        return repr((metrics, self.repeat, self.cache, self.gc,
+                     bool(self.roofline), type(self.executor).__name__,
+                     list(getattr(self.executor, 'index', ())),
+                     n_rows_per_case, environment))
+
+    def _aggregate_dataframe(self, db, index):
+        """Aggregate repeated runs in a pandas.DataFrame"""
+        if self.repeat > 1 and self.aggregate:
+            attrs = db.attrs
+            aggregate = _pandas_aggregation(self.aggregate)
+            # only numeric metrics can be aggregated
+            db = db.select_dtypes('number')
+            if index == ['runid']:
+                # no tags were passed
+                db = db.agg(aggregate)
+            else:
+                index = [key for key in index if key != 'runid']
+                db = db.groupby(index).agg(aggregate)
+            db.attrs = attrs
+        return db
+
+    def _check_unique_tags(self, obj):
+        """Check that tags and env uniquely identify delayed objects"""
+        try:
+            tags_all = list(set([self._hash_tags_env(el) for el in obj]))
+        except TypeError:
+            # unhashable tag values
+            tags_all = list(set([repr(self._hash_tags_env(el))
+                                 for el in obj]))
 
-        # check that tags are unique
         if len(obj) != len(tags_all):
-            if len(tags_all) == 1 and tags_all[0] == '':
+            if len(tags_all) == 1 and tags_all[0] in [((), ()), '((), ())']:
                 raise ValueError('When bechmarking a sequence, please provide '
                                  'the tag parameter for each delayed object '
                                  'to uniquely identify them!')
@@ -185,75 +608,153 @@ class Benchmark(object):
                                   'but only %s unique tags were found!')
                                  % (len(obj), len(tags_all)))
 
-        db = []
-        pbar = _ProgressBar(
-                len(obj)*len(self.metrics)*self.repeat,
-                self.progress_bar
-        )
-        for runid in range(self.repeat):
-            for idx, obj_el in enumerate(obj):
-                res = self._evaluate_single(obj_el, pbar)
-                if self.repeat > 1:
-                    res['runid'] = runid
-                db.append(res)
-
-        pbar.close()
-
-        pd = import_or_none('pandas')
-
-        if iterable_input:
-            if self.to_dataframe is not False and pd is not None:
-                index = list(obj[0].get_tags().keys())
-                if self.repeat > 1:
-                    index.append('runid')
-                db = pd.DataFrame(db)
-                if index:
-                    db.set_index(index, inplace=True)
-                if self.repeat > 1 and self.aggregate:
-                    if index == ['runid']:
-                        # no tags were passed
-                        db = db.agg(self.aggregate)
-                    else:
-                        index.remove('runid')
-                        db = db.groupby(index).agg(self.aggregate)
-
-                return db
-            else:
-                return db
-        else:
-            return db[0]
-
     def _hash_tags_env(self, obj):
-        """Compute a string representation of tags and env of a delayed
+        """Compute a hashable representation of tags and env of a delayed
         object. This is used for duplicates detection."""
         if not _is_delayed(obj):
             raise ValueError
-        tags_el = []
-        for key, val in obj.get_tags().items():
-            tags_el.append('%s:%s' % (key, val))
-        for key, val in obj.get_env().items():
-            tags_el.append('%s:%s' % (key, val))
-        return '|'.join(tags_el)
-
-    def _evaluate_single(self, obj, pbar):
+        return (tuple(obj.get_tags().items()),
+                tuple(obj.get_env().items()))
+
+    def _emit(self, event, obj, **fields):
+        """Send an event to the telemetry hooks"""
+        if not self.events:
+            return
+        tags = OrderedDict(obj.get_tags())
+        tags.update(obj.get_env())
+        record = OrderedDict([('event', event), ('time', time.time()),
+                              ('tags', tags)])
+        record.update(fields)
+        with self._events_lock:
+            for emitter in self.events:
+                try:
+                    emitter(record)
+                except Exception as exc:
+                    # telemetry failures should not abort the benchmark
+                    warnings.warn('Event emitter %r failed: %s'
+                                  % (emitter, exc))
+
+    def _emit_row(self, obj, row, start, **fields):
+        """Emit the events of a case evaluated in another process"""
+        if not self.events:
+            return
+        duration = time.time() - start
+        if row.get('status', 'ok') != 'ok':
+            self._emit('error', obj, error=row.get('error'),
+                       duration=duration, **fields)
+            return
+        tags = set(obj.get_tags()) | set(obj.get_env())
+        for key, val in row.items():
+            # skip tags and host, status or version columns
+            if key not in tags and key not in fields and \
+                    not isinstance(val, str):
+                self._emit('measurement', obj, metric=key, value=val,
+                           **fields)
+        self._emit('case_finished', obj, duration=duration, **fields)
+
+    def _count_precomputed(self, cases):
+        """Count the evaluations depending on each precomputed node (the
+        runs of a case are evaluated consecutively)"""
+        refcounts = {}
+        for obj in cases:
+            if not hasattr(obj, '_precomputed_nodes'):
+                continue
+            for node in obj._precomputed_nodes():
+                refcounts[id(node)] = refcounts.get(id(node), 0) + 1
+        return dict((key, val * self.repeat)
+                    for key, val in refcounts.items())
+
+    def _release_precomputed(self, nodes):
+        """Release precomputed nodes no longer needed by other cases"""
+        for node in nodes:
+            count = self._refcounts.get(id(node), 1) - 1
+            if count > 0:
+                self._refcounts[id(node)] = count
+            else:
+                self._refcounts.pop(id(node), None)
+                node._release()
+
+    def _evaluate_single(self, obj, pbar=None):
         """Evaluate all metrics a single time"""
         row = {}
         row.update(obj.get_tags())
         row.update(obj.get_env())
 
-        for (name, params) in self.metrics.items():
-            params = params.copy()
-            func = params.pop('func')
+        if hasattr(obj, '_precomputed_nodes'):
+            nodes = obj._precomputed_nodes()
+        else:
+            nodes = []
+        if self.system is not None:
+            row['loadavg_before'] = loadavg()
+        start = time.time()
+        self._emit('case_started', obj)
+        try:
+            # shared prefixes are computed once, outside of measurements,
+            # with the environment variables of the case
+            with _environ(obj.get_env()):
+                for node in nodes:
+                    node._precompute()
+            if self.cache == 'both':
+                self._evaluate_metrics(obj, row, pbar)
+                self._evaluate_metrics(obj, row, pbar, cold=True,
+                                       suffix='_cold')
+            else:
+                self._evaluate_metrics(obj, row, pbar,
+                                       cold=self.cache == 'cold')
+        except Exception:
+            self._emit('error', obj, error=traceback.format_exc(),
+                       duration=time.time() - start)
+            raise
+        finally:
+            self._release_precomputed(nodes)
+
+        work = obj.get_work() if hasattr(obj, 'get_work') else None
+        if work and 'wall_time' in row:
+            row.update(throughput(work, row['wall_time'],
+                                  getattr(self, '_peaks', None)))
+        if self.system is not None:
+            row['loadavg_after'] = loadavg()
+        self._emit('case_finished', obj, duration=time.time() - start)
+        return row
 
-            gc.collect()
+    def _evaluate_metrics(self, obj, row, pbar, cold=False, suffix=''):
+        """Evaluate all metrics, and store the results in ``row``"""
+        if cold:
+            if callable(self.cache_files):
+                files = self.cache_files(obj.get_tags())
+            elif self.cache_files is not None:
+                files = self.cache_files
+            else:
+                files = detect_files(obj)
+
+        collect = self._collect
+        for name, func, params in self._metric_funcs:
+            if collect is not None:
+                collect()
+            if cold:
+                evict_files(files)
+                flush_cpu_caches()
             res = func(obj, **params)
 
-            if name in ['wall_time', 'cpu_time']:
-                res = _validate_timer_precision(res, func, obj,
-                                                params)
-            row[name] = res
-            pbar.increment()
-        return row
+            if name in ['wall_time', 'cpu_time'] and not cold:
+                # repeated evaluations would not be cold
+                res, number = _validate_timer_precision(
+                        res, func, obj, params, collect=collect)
+                self._emit('calibration_done', obj, metric=name,
+                           number=number)
+            if not isinstance(res, dict):
+                res = {name: res}
+            for key, val in res.items():
+                # metrics may return several values
+                row[key + suffix] = val
+                self._emit('measurement', obj, metric=key + suffix,
+                           value=val)
+            if pbar is not None:
+                pbar.increment()
+
+    def _n_metrics_per_case(self):
+        """Number of metric evaluations per case"""
+        return len(self.metrics) * (2 if self.cache == 'both' else 1)
 
 
 def memit(obj, repeat=1, aggregate=('mean', 'max', 'std'),
@@ -266,13 +767,16 @@ def memit(obj, repeat=1, aggregate=('mean', 'max', 'std'),
     ----------
     repeat : int, default=1
         number of repeated measurements
-    aggregate : {collection, False}, default=('mean', 'max', 'std')
+    aggregate : {collection, str, False}, default=('mean', 'max', 'std')
        when repeat > 1, different runs are indexed by the ``runid`` key.
-       If pandas is installed and aggregate is a collection, aggregate repeated
-       runs with the provided methods.
+       If aggregate is a collection, aggregate repeated runs with the
+       provided methods (see :meth:`GroupBy.agg`). Use ``'robust'`` for
+       the median, median absolute deviation, bootstrap confidence interval
+       and number of outliers.
     to_dataframe : bool, default=None
-      whether to convert parametric results to a daframe. By default convert to
-      dataframe is pandas is installed.
+      format of parametric results. By default return a
+      :class:`ResultSet`. If True, convert the results to a
+      ``pandas.DataFrame``, if False return a list of dictionaries.
     progress_bar : {bool, float}, default=5.0
       if a number, and tqdm is installed, display the progress bar when the
       estimated benchmark time is larger than the given number of seconds.
@@ -280,7 +784,7 @@ def memit(obj, repeat=1, aggregate=('mean', 'max', 'std'),
 
     Returns
     -------
-    res : dict, list or pandas.DataFrame
+    res : dict, list, ResultSet or pandas.DataFrame
         computed memory usage
     """
 
@@ -305,13 +809,16 @@ def timeit(obj, timer='wall_time', number=1, repeat=1,
         number of runs to pass to ``timeit.Timer``
     repeat : int, default=1
         number of repeated measurements
-    aggregate : {collection, False}, default=('mean', 'max', 'std')
+    aggregate : {collection, str, False}, default=('mean', 'max', 'std')
        when repeat > 1, different runs are indexed by the ``runid`` key.
-       If pandas is installed and aggregate is a collection, aggregate repeated
-       runs with the provided methods.
+       If aggregate is a collection, aggregate repeated runs with the
+       provided methods (see :meth:`GroupBy.agg`). Use ``'robust'`` for
+       the median, median absolute deviation, bootstrap confidence interval
+       and number of outliers.
     to_dataframe : bool, default=None
-      whether to convert parametric results to a daframe. By default convert to
-      dataframe is pandas is installed.
+      format of parametric results. By default return a
+      :class:`ResultSet`. If True, convert the results to a
+      ``pandas.DataFrame``, if False return a list of dictionaries.
     progress_bar : {bool, float}, default=5.0
       if a number, and tqdm is installed, display the progress bar when the
       estimated benchmark time is larger than the given number of seconds.
@@ -319,7 +826,7 @@ def timeit(obj, timer='wall_time', number=1, repeat=1,
 
     Returns
     -------
-    res : dict, list or pandas.DataFrame
+    res : dict, list, ResultSet or pandas.DataFrame
         computed timing
     """
 
@@ -0,0 +1,122 @@
+# neurtu, BSD 3 clause license
+# Authors: Roman Yurchak
+"""Eviction of the OS page cache and CPU caches for cold measurements"""
+
+import glob
+import os
+
+# default last level cache size when it cannot be detected
+_DEFAULT_LLC_SIZE = 32 * 1024**2
+
+_FLUSH_BUFFER = []
+
+
+def llc_size():
+    """Size in bytes of the last level CPU cache
+
+    Read from ``/sys/devices/system/cpu`` on Linux, defaults to 32 MB
+    otherwise.
+    """
+    best_level, best_size = -1, None
+    for path in glob.glob('/sys/devices/system/cpu/cpu0/cache/index*'):
+        try:
+            with open(os.path.join(path, 'level')) as fh:
+                level = int(fh.read())
+            with open(os.path.join(path, 'size')) as fh:
+                size = fh.read().strip()
+        except (IOError, OSError, ValueError):
+            continue
+        units = {'K': 1024, 'M': 1024**2, 'G': 1024**3}
+        if size[-1:] in units:
+            size = int(size[:-1]) * units[size[-1]]
+        else:
+            size = int(size)
+        if level > best_level:
+            best_level, best_size = level, size
+    return best_size if best_size is not None else _DEFAULT_LLC_SIZE
+
+
+def flush_cpu_caches(size=None, chunk_size=1024**2):
+    """Evict data from the CPU caches by writing to a buffer larger than the
+    last level cache
+
+    Parameters
+    ----------
+    size : int, default=None
+      size of the buffer in bytes. By default, twice the last level cache.
+    chunk_size : int, default=1048576
+      size of the chunks written at once
+    """
+    if size is None:
+        size = 2 * llc_size()
+    if not _FLUSH_BUFFER or len(_FLUSH_BUFFER[0]) != size:
+        del _FLUSH_BUFFER[:]
+        _FLUSH_BUFFER.append(bytearray(size))
+    buf = memoryview(_FLUSH_BUFFER[0])
+    value = (buf[0] + 1) % 256
+    chunk = bytes(bytearray([value])) * chunk_size
+    for start in range(0, size, chunk_size):
+        stop = min(start + chunk_size, size)
+        buf[start:stop] = chunk[:stop - start]
+
+
+def evict_files(paths):
+    """Evict files from the OS page cache with
+    ``posix_fadvise(POSIX_FADV_DONTNEED)``
+
+    Dirty pages are written to disk first, since they cannot be evicted.
+
+    Parameters
+    ----------
+    paths : list of str
+      paths of the files to evict
+
+    Returns
+    -------
+    n_evicted : int
+      number of evicted files
+    """
+    if not hasattr(os, 'posix_fadvise'):  # pragma: no cover
+        return 0
+    n_evicted = 0
+    for path in paths:
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except (IOError, OSError):
+            continue
+        try:
+            try:
+                os.fdatasync(fd)
+            except (IOError, OSError):
+                pass
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            n_evicted += 1
+        finally:
+            os.close(fd)
+    return n_evicted
+
+
+def detect_files(obj):
+    """Find existing files passed as arguments of a delayed object
+
+    Parameters
+    ----------
+    obj : Delayed
+      delayed object
+
+    Returns
+    -------
+    paths : list of str
+    """
+    values = list(obj.get_args())
+    for kwargs in obj.get_kwargs():
+        values.extend(kwargs.values())
+    paths = []
+    for val in values:
+        if isinstance(val, (str, bytes)) or hasattr(val, '__fspath__'):
+            try:
+                if os.path.isfile(val):
+                    paths.append(os.fspath(val))
+            except (TypeError, ValueError):
+                continue
+    return paths
@@ -0,0 +1,325 @@
+# neurtu, BSD 3 clause license
+# Authors: Roman Yurchak
+"""Paired comparison of implementations"""
+
+from __future__ import division
+
+import gc
+import math
+from collections import OrderedDict
+
+from .delayed import _is_delayed
+from .metrics import measure_wall_time
+from .resultset import ResultSet
+from .stats import median
+
+
+def _pair_key(obj, pair_on):
+    tags = obj.get_tags()
+    try:
+        return tuple(tags[key] for key in pair_on)
+    except KeyError as exc:
+        raise ValueError('Tag %s used in pair_on not found in %s'
+                         % (exc, obj))
+
+
+def _default_pair_on(a_cases, b_cases):
+    """Tags of all cases, except those identifying the implementation, i.e.
+    with a single value in A cases and a different one in B cases"""
+    if not a_cases:
+        return []
+    pair_on = []
+    for key in a_cases[0].get_tags():
+        if not all(key in obj.get_tags() for obj in a_cases + b_cases):
+            continue
+        value_a = a_cases[0].get_tags()[key]
+        value_b = b_cases[0].get_tags()[key] if b_cases else value_a
+        if (value_a != value_b and
+                all(obj.get_tags()[key] == value_a for obj in a_cases) and
+                all(obj.get_tags()[key] == value_b for obj in b_cases)):
+            continue
+        pair_on.append(key)
+    return pair_on
+
+
+def _binom_cdf(k, n):
+    """``P(X <= k)`` for ``X ~ Binomial(n, 1/2)``"""
+    def comb(n, i):
+        return math.factorial(n) // (math.factorial(i) *
+                                     math.factorial(n - i))
+    return math.fsum(comb(n, i) for i in range(k + 1)) / 2**n
+
+
+def _median_ci(values, alpha):
+    """Distribution-free confidence interval of the median, from order
+    statistics (the inverse of the sign test)
+
+    NaN bounds are returned when there are too few values for the
+    requested level.
+    """
+    values = sorted(values)
+    n = len(values)
+    k = -1
+    while _binom_cdf(k + 1, n) <= alpha / 2:
+        k += 1
+    if k < 0:
+        return (float('nan'), float('nan'))
+    return (values[k], values[n - k - 1])
+
+
+def _min_rounds_ci(alpha):
+    """Smallest number of values for which the confidence interval of the
+    median at level ``1 - alpha`` is finite"""
+    n = 1
+    while 0.5**n > alpha / 2:
+        n += 1
+    return n
+
+
+def _interim_looks(min_rounds, max_rounds, confidence):
+    """Rounds after which the stopping rule is checked: ``min_rounds``,
+    doubled until ``max_rounds``
+
+    Looks where the confidence interval cannot exclude 1 (too few rounds
+    for the level of each look) are skipped, so that no error rate is
+    spent on them.
+    """
+    def doubling(n_rounds):
+        looks = []
+        while n_rounds < max_rounds:
+            looks.append(n_rounds)
+            n_rounds *= 2
+        looks.append(max_rounds)
+        return looks
+
+    looks = doubling(min_rounds)
+    n_min = _min_rounds_ci((1 - confidence) / len(looks))
+    if looks[0] < n_min:
+        # fewer looks, starting later, each with a larger error rate
+        looks = doubling(min(n_min, max_rounds))
+    if looks[0] < _min_rounds_ci((1 - confidence) / len(looks)):
+        raise ValueError('max_rounds=%s is too small for confidence=%s, at '
+                         'least %s rounds are needed'
+                         % (max_rounds, confidence,
+                            _min_rounds_ci(1 - confidence)))
+    return looks
+
+
+def _significant(ci):
+    """Whether a confidence interval excludes 1 (False for NaN bounds)"""
+    return bool(ci[0] > 1 or ci[1] < 1)
+
+
+def _calibrate(obj, min_time):
+    """Number of evaluations needed for a measurement of at least
+    ``min_time`` seconds"""
+    gc.collect()
+    dt = measure_wall_time(obj)
+    if dt <= 0:
+        return 1000
+    return max(1, int(math.ceil(min_time / dt)))
+
+
+def _measure(obj, number):
+    gc.collect()
+    return measure_wall_time(obj, number=number)
+
+
+def compare_impls(a_cases, b_cases, pair_on=None, min_rounds=3,
+                  max_rounds=20, confidence=0.95, min_time=0.05):
+    """Paired A/B comparison of two implementations
+
+    For each pair of cases with the same ``pair_on`` tags, A and B are
+    measured in interleaved ABBA rounds (A, B, B, A, then B, A, A, B, ...)
+    to cancel out slow drifts of the machine performance. The speedup of
+    B with respect to A (i.e. ``time_a / time_b``) is computed for each
+    round.
+
+    The confidence interval of the median speedup is computed from order
+    statistics (i.e. a sign test), which makes no assumption on the
+    distribution of measurements. It is checked after ``min_rounds``
+    rounds, then each time the number of rounds doubles up to
+    ``max_rounds``, and the comparison stops as soon as it excludes 1.
+    To keep the overall false positive rate below ``1 - confidence``
+    despite these repeated checks, the error rate is split equally
+    between them (Bonferroni alpha spending), so the reported interval
+    is wider than a single fixed-size one. Checks with too few rounds
+    for the interval to exclude 1 are skipped, e.g. with the defaults the
+    interval is checked after 8, 16 and 20 rounds.
+
+    Parameters
+    ----------
+    a_cases : iterable of Delayed
+      cases of the first implementation
+    b_cases : iterable of Delayed
+      cases of the second implementation
+    pair_on : list of str, default=None
+      tags used to match A and B cases. By default, use the tags common to
+      A and B cases, except those with a single value in A cases and a
+      different one in B cases (e.g. ``impl='a'`` and ``impl='b'``).
+    min_rounds : int, default=3
+      minimum number of ABBA rounds per pair
+    max_rounds : int, default=20
+      maximum number of ABBA rounds per pair. Should be large enough for
+      the confidence interval to exclude 1 (at least 6 rounds for a 0.95
+      confidence).
+    confidence : float, default=0.95
+      overall confidence level of the speedup confidence interval
+    min_time : float, default=0.05
+      minimum duration of a single measurement in s. Fast cases are
+      evaluated several times per measurement.
+
+    Returns
+    -------
+    res : ResultSet
+      one row per pair indexed by the ``pair_on`` tags, with the median
+      ``time_a`` and ``time_b``, the median ``speedup`` of B with respect
+      to A, its confidence interval ``ci_low``, ``ci_high``, whether it is
+      ``significant`` (the confidence interval excludes 1, NaN bounds when
+      there are too few rounds are never significant) and the number of
+      rounds ``n_rounds``.
+    """
+    a_cases = list(a_cases)
+    b_cases = list(b_cases)
+    for obj in a_cases + b_cases:
+        if not _is_delayed(obj):
+            raise ValueError('obj=%s must be a Delayed object!' % obj)
+    if pair_on is None:
+        pair_on = _default_pair_on(a_cases, b_cases)
+    if min_rounds < 1 or max_rounds < min_rounds:
+        raise ValueError('min_rounds=%s and max_rounds=%s should verify '
+                         '1 <= min_rounds <= max_rounds'
+                         % (min_rounds, max_rounds))
+    looks = _interim_looks(min_rounds, max_rounds, confidence)
+    alpha = (1 - confidence) / len(looks)
+
+    b_pairs = OrderedDict()
+    for obj in b_cases:
+        b_pairs[_pair_key(obj, pair_on)] = obj
+    if len(b_pairs) != len(b_cases):
+        raise ValueError('pair_on=%s does not uniquely identify B cases!'
+                         % pair_on)
+
+    columns = OrderedDict((key, []) for key in pair_on)
+    for key in ['time_a', 'time_b', 'speedup', 'ci_low', 'ci_high',
+                'significant', 'n_rounds']:
+        columns[key] = []
+
+    seen = set()
+    for obj_a in a_cases:
+        key = _pair_key(obj_a, pair_on)
+        if key in seen:
+            raise ValueError('pair_on=%s does not uniquely identify A cases!'
+                             % pair_on)
+        seen.add(key)
+        if key not in b_pairs:
+            raise ValueError('No B case found for %s'
+                             % dict(zip(pair_on, key)))
+        obj_b = b_pairs[key]
+        number_a = _calibrate(obj_a, min_time)
+        number_b = _calibrate(obj_b, min_time)
+
+        times_a, times_b, speedups = [], [], []
+        ci = (float('nan'), float('nan'))
+        for round_idx in range(max_rounds):
+            if round_idx % 2 == 0:
+                order = ['a', 'b', 'b', 'a']
+            else:
+                order = ['b', 'a', 'a', 'b']
+            res = {'a': [], 'b': []}
+            for impl in order:
+                if impl == 'a':
+                    res['a'].append(_measure(obj_a, number_a))
+                else:
+                    res['b'].append(_measure(obj_b, number_b))
+            time_a = sum(res['a']) / 2
+            time_b = sum(res['b']) / 2
+            times_a.append(time_a)
+            times_b.append(time_b)
+            speedups.append(time_a / time_b if time_b > 0 else float('inf'))
+            if round_idx + 1 in looks:
+                ci = _median_ci(speedups, alpha)
+                if _significant(ci):
+                    break
+
+        for name, val in zip(pair_on, key):
+            columns[name].append(val)
+        columns['time_a'].append(median(times_a))
+        columns['time_b'].append(median(times_b))
+        columns['speedup'].append(median(speedups))
+        columns['ci_low'].append(ci[0])
+        columns['ci_high'].append(ci[1])
+        columns['significant'].append(_significant(ci))
+        columns['n_rounds'].append(len(speedups))
+
+    return ResultSet(columns, index=pair_on)
+
+
+def speedup_table(res, by='environment', baseline=None, metric='wall_time'):
+    """Speedup of each value of a tag with respect to a baseline
+
+    Typically used to compare the results of a benchmark evaluated in
+    several Python environments (see
+    :class:`neurtu.executors.EnvironmentExecutor`).
+
+    Parameters
+    ----------
+    res : ResultSet
+      benchmark results
+    by : str, default='environment'
+      tag (index column) to compare
+    baseline : object, default=None
+      value of the ``by`` tag used as reference. By default, the first
+      value found.
+    metric : {str, tuple}, default='wall_time'
+      metric to compare, e.g. ``('wall_time', 'mean')`` for aggregated
+      results. Repeated runs are reduced with the median.
+
+    Returns
+    -------
+    res : ResultSet
+      one row per combination of the other tags, and one column per value
+      of the ``by`` tag, with the speedup ``baseline_metric / metric``
+      (larger is faster).
+
+    Example
+    -------
+    >>> from neurtu import ResultSet
+    >>> res = ResultSet({'N': [1, 1, 2, 2], 'env': ['a', 'b', 'a', 'b'],
+    ...                  'wall_time': [1.0, 0.5, 4.0, 1.0]},
+    ...                 index=['N', 'env'])
+    >>> table = speedup_table(res, by='env')
+    >>> dict(table.to_records()[1])
+    {'N': 2, 'a': 1.0, 'b': 4.0}
+    """
+    if by not in res.index:
+        raise ValueError('by=%s should be one of the index columns %s'
+                         % (by, res.index))
+    if metric not in res:
+        raise ValueError('metric=%s not found in %s' % (metric, res.columns))
+    index = [key for key in res.index if key not in (by, 'runid')]
+    res = res.groupby(index + [by]).agg('median')
+
+    levels = list(OrderedDict.fromkeys(res[by]))
+    if baseline is None:
+        baseline = levels[0]
+    elif baseline not in levels:
+        raise ValueError('baseline=%s not found in %s' % (baseline, levels))
+
+    values = OrderedDict()
+    for key, level, val in zip(zip(*[res[name] for name in index])
+                               if index else [()] * len(res),
+                               res[by], res[metric]):
+        values.setdefault(key, {})[level] = val
+
+    columns = OrderedDict((name, []) for name in index)
+    for level in levels:
+        columns[level] = []
+    for key, row in values.items():
+        for name, val in zip(index, key):
+            columns[name].append(val)
+        ref = row.get(baseline, float('nan'))
+        for level in levels:
+            val = row.get(level, float('nan'))
+            columns[level].append(ref / val if val else float('nan'))
+    return ResultSet(columns, index=index, metadata=res.metadata)
@@ -3,6 +3,39 @@
 import os
 
 
+class _environ(object):
+    """Context manager setting environment variables, and restoring the
+    initial environment on exit"""
+    def __init__(self, env):
+        self.env = env
+        self.env_init = None
+
+    def __enter__(self):
+        if self.env:
+            self.env_init = os.environ.copy()
+            os.environ.update(self.env)
+
+    def __exit__(self, *exc_info):
+        if self.env_init is not None:
+            os.environ.clear()
+            os.environ.update(self.env_init)
+
+
+class _Missing(object):
+    """Marker of precomputed values that were not computed yet"""
+    def __reduce__(self):
+        return '_MISSING'
+
+
+_MISSING = _Missing()
+
+# special attributes that pickle and copy look up on instances
+_PICKLE_ATTRIBUTES = frozenset([
+    '__getstate__', '__setstate__', '__reduce__', '__reduce_ex__',
+    '__getnewargs__', '__getnewargs_ex__', '__getinitargs__', '__copy__',
+    '__deepcopy__', '__dict__'])
+
+
 class Delayed(object):
     """Delayed wrapper class
 
@@ -20,9 +53,15 @@ class Delayed(object):
       optional tags for the delayed object
     env: dict
       optional environment variables to set when evaluating the delayed object
+    work: {dict, callable}
+      optional work counts of the delayed object
     """
+    # many delayed objects may be created for large parametric benchmarks
+    __slots__ = ('__obj', '__func', '__args', '__kwargs', '__tags', '__env',
+                 '__work', '__root', '__value')
+
     def __init__(self, obj, func, args=None, kwargs=None, tags=None,
-                 env=None):
+                 env=None, work=None):
         self.__obj = obj
         self.__func = func
         if args is None:
@@ -31,11 +70,34 @@ class Delayed(object):
         self.__kwargs = kwargs if kwargs is not None else {}
         self.__tags = tags if tags is not None else {}
         self.__env = env if env is not None else {}
+        self.__work = work
+        if func is None or not isinstance(obj, Delayed):
+            self.__root = None
+        else:
+            # cache the root Delayed object, holding tags, env and work
+            self.__root = obj.__root if obj.__root is not None else obj
+        if func == '__precompute__':
+            self.__value = _MISSING
+
+    def __getstate__(self):
+        # precomputed values are not serialized
+        state = {}
+        for name in Delayed.__slots__:
+            name = '_Delayed' + name
+            if hasattr(self, name):
+                state[name] = getattr(self, name)
+        if '_Delayed__value' in state:
+            state['_Delayed__value'] = _MISSING
+        return (None, state)
 
     def __call__(self, *args, **kwargs):
         return Delayed(self, '__call__', args, kwargs)
 
     def __getattr__(self, key):
+        if key in _PICKLE_ATTRIBUTES or key.startswith('_Delayed__'):
+            # private attributes, and special attributes looked up by
+            # pickle and copy are not delayed
+            raise AttributeError(key)
         return Delayed(self, '__getattr__', args=(key,))
 
     def __getitem__(self, key):
@@ -43,7 +105,14 @@ class Delayed(object):
 
     def _compute(self):
         if self.__func is None:
+            if isinstance(self.__obj, Delayed):
+                # a case rebased on a shared prefix
+                return self.__obj._compute()
             return self.__obj
+        elif self.__func == '__precompute__':
+            if self.__value is not _MISSING:
+                return self.__value
+            return self.__obj._compute()
         else:
             obj = self.__obj._compute()
             args, kwargs = self.__args, self.__kwargs
@@ -58,22 +127,12 @@ class Delayed(object):
     def compute(self):
         """Evaluate the delayed object"""
 
-        env = self.get_env()
-        if env:
-            env_init = os.environ.copy()
-            try:
-                os.environ.update(env)
-                res = self._compute()
-            finally:
-                os.environ.clear()
-                os.environ.update(env_init)
-            return res
-        else:
+        with _environ(self.get_env()):
             return self._compute()
 
     def __repr__(self):
         """Render a Delayed object"""
-        parent_repr = self.__obj.__repr__()
+        parent_repr = repr(self.__obj)
 
         def _str2str(x):
             if isinstance(x, str) and not x.strip():
@@ -104,6 +163,8 @@ class Delayed(object):
             return (parent_repr[:-1] + '.%s>' % args_repr)
         elif self.__func == '__getitem__':
             return (parent_repr[:-1] + '[%s]>' % args_repr)
+        elif self.__func == '__precompute__':
+            return (parent_repr[:-1] + ' [precomputed]>')
         else:
             return (parent_repr +
                     ' -> {} args={} kwargs={}'
@@ -117,11 +178,9 @@ class Delayed(object):
         tags : dict
           a dictionary of tags
         """
-        if self.__func is None:
+        if self.__root is None:
             return self.__tags
-        else:
-            # recursively find the root Delayed object
-            return self.__obj.get_tags()
+        return self.__root.get_tags()
 
     def get_env(self):
         """Get environement variables passed at init
@@ -131,11 +190,24 @@ class Delayed(object):
         env : dict
           a dictionary of environement variables
         """
-        if self.__func is None:
+        if self.__root is None:
             return self.__env
-        else:
-            # recursively find the root Delayed object
-            return self.__obj.get_env()
+        return self.__root.get_env()
+
+    def get_work(self):
+        """Get work counts passed at init
+
+        Returns
+        -------
+        work : dict
+          a dictionary of work counts (e.g. ``flops``, ``bytes``, ``items``).
+          When a callable was passed, it is evaluated with the tags dictionary.
+        """
+        if self.__root is not None:
+            return self.__root.get_work()
+        if callable(self.__work):
+            return self.__work(self.get_tags())
+        return self.__work if self.__work is not None else {}
 
     def get_args(self):
         """Get all arguments passed.
@@ -163,6 +235,59 @@ class Delayed(object):
         else:
             return [self.__kwargs] + self.__obj.get_kwargs()
 
+    def _precomputed_nodes(self):
+        """Get the precomputed nodes of the delayed chain, from the root"""
+        nodes = []
+        node = self
+        while node.__func is not None or isinstance(node.__obj, Delayed):
+            if node.__func == '__precompute__':
+                nodes.append(node)
+            node = node.__obj
+        return nodes[::-1]
+
+    def _precompute(self):
+        """Compute and store the value of a precomputed node"""
+        if self.__value is _MISSING:
+            self.__value = self.__obj._compute()
+
+    def _release(self):
+        """Release the value of a precomputed node"""
+        self.__value = _MISSING
+
+    def _get_root_obj(self):
+        """Get the object wrapped by the root of the delayed chain"""
+        node = self.__root if self.__root is not None else self
+        if isinstance(node.__obj, Delayed):
+            return node.__obj._get_root_obj()
+        return node.__obj
+
+    def _get_chain(self):
+        """Get the root object, tags, env, work and operations of the delayed
+        chain, used for serialization
+
+        Returns
+        -------
+        chain : dict
+          with the ``ops`` key containing ``(func, args, kwargs)`` tuples,
+          from the root to this object
+        """
+        ops = []
+        node = self
+        while node.__func is not None:
+            ops.append((node.__func, tuple(node.__args), node.__kwargs))
+            node = node.__obj
+        return {'obj': node.__obj, 'tags': node.__tags, 'env': node.__env,
+                'work': node.__work, 'ops': ops[::-1]}
+
+    @classmethod
+    def _from_chain(cls, chain):
+        """Build a delayed object from the output of :meth:`_get_chain`"""
+        obj = cls(chain['obj'], None, tags=chain['tags'], env=chain['env'],
+                  work=chain['work'])
+        for func, args, kwargs in chain['ops']:
+            obj = cls(obj, func, args, kwargs)
+        return obj
+
 
 def _is_delayed(obj):
     """Check that object follows the ``class:neurtu.Delayed`` API
@@ -171,7 +296,7 @@ def _is_delayed(obj):
             callable(obj.compute) and callable(obj.get_tags))
 
 
-def delayed(obj, tags=None, env=None):
+def delayed(obj, tags=None, env=None, work=None):
     """Delayed object evaluation
 
     Parameters
@@ -182,6 +307,10 @@ def delayed(obj, tags=None, env=None):
        optional tags for the produced delayed object
     env: dict
       optional environment variables to set when evaluating the delayed object
+    work: {dict, callable}
+      optional work counts of one evaluation, used to compute throughputs,
+      e.g. ``{'flops': 2*N**3, 'bytes': 8*N**2, 'items': N}``. Can also be
+      a callable taking the tags dictionary and returning work counts.
 
     Returns
     -------
@@ -204,5 +333,52 @@ def delayed(obj, tags=None, env=None):
     >>> x.get_tags()
     {'a': 0}
 
+    Declaring work counts
+
+    >>> x = delayed(sum, tags={'N': 10},
+    ...             work=lambda tags: {'items': tags['N']})(range(10))
+    >>> x.get_work()
+    {'items': 10}
+
+    """
+    return Delayed(obj, None, tags=tags, env=env, work=work)
+
+
+def precompute(obj):
+    """Mark a delayed object as an untimed prefix of benchmark cases
+
+    Cases derived from the returned object (e.g. several ``predict``
+    variants of the same fitted model) share it. To tag them separately,
+    wrap it again with :func:`delayed`, which creates a new root evaluating
+    the shared prefix (its own tags and env are ignored). When they are
+    evaluated by
+    :class:`Benchmark`, the prefix is computed once, before the
+    measurements, and its value is passed to the remaining operations of
+    each case. It is released as soon as the last case depending on it was
+    evaluated, to keep memory bounded (with ``repeat > 1``, the runs of each
+    case are then evaluated consecutively).
+
+    Outside of :class:`Benchmark`, or with executors evaluating cases in
+    other processes, the prefix is computed with each case.
+
+    Parameters
+    ----------
+    obj : Delayed
+      the shared prefix
+
+    Returns
+    -------
+    result : Delayed
+
+    Example
+    -------
+    >>> data = precompute(delayed(sorted)(range(5), reverse=True))
+    >>> data
+    <Delayed(built-in function sorted)(range(0, 5),reverse=True) [precomputed]>
+    >>> cases = [delayed(data, tags={'idx': idx})[idx] for idx in range(3)]
+    >>> [obj.compute() for obj in cases]
+    [4, 3, 2]
     """
-    return Delayed(obj, None, tags=tags, env=env)
+    if not isinstance(obj, Delayed):
+        raise ValueError('obj=%s must be a Delayed object!' % obj)
+    return Delayed(obj, '__precompute__')
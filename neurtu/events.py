@@ -0,0 +1,196 @@
+# neurtu, BSD 3 clause license
+# Authors: Roman Yurchak
+"""Live telemetry of running benchmarks
+
+:class:`neurtu.Benchmark` emits the following events to the callables
+passed with ``Benchmark(events=[...])``:
+
+ - ``case_started``: the evaluation of a case started
+ - ``calibration_done``: the number of evaluations needed for a precise
+   timing was determined (``metric``, ``number`` fields)
+ - ``measurement``: a metric was measured (``metric``, ``value`` fields)
+ - ``case_finished``: all metrics of a case were measured (``duration``
+   field, in s)
+ - ``error``: the evaluation of a case failed (``error``, ``duration``
+   fields)
+
+Each event is a dictionary with the ``event`` name, the ``time`` as a
+UNIX timestamp and the ``tags`` of the case (including its env).
+"""
+
+import json
+import os
+import re
+import socket
+import threading
+from collections import OrderedDict
+
+EVENTS = ('case_started', 'calibration_done', 'measurement',
+          'case_finished', 'error')
+
+
+def _is_number(val):
+    return (isinstance(val, (int, float)) and not isinstance(val, bool))
+
+
+class JSONLinesEmitter(object):
+    """Append events to a file, one JSON object per line
+
+    The file is opened for each event, so it can be followed (e.g. with
+    ``tail -f``) while the benchmark is running.
+
+    Parameters
+    ----------
+    path : str
+      path of the output file
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def __call__(self, event):
+        line = json.dumps(event, default=str)
+        with open(self.path, 'a') as fh:
+            fh.write(line + '\n')
+
+
+class PrometheusEmitter(object):
+    """Write benchmark metrics in the Prometheus text format, for the
+    textfile collector of the node exporter
+
+    The file is atomically replaced after each event, and contains the
+    following metrics:
+
+     - ``neurtu_events_total{event="..."}``: counter of events
+     - ``neurtu_cases_in_progress``: number of cases being evaluated
+     - ``neurtu_last_event_timestamp_seconds``: time of the last event
+     - ``neurtu_last_case_duration_seconds``: duration of the last case
+     - ``neurtu_measurement{metric="..."}``: last measured value of each
+       metric
+
+    Parameters
+    ----------
+    path : str
+      path of the output file, which should have a ``.prom`` extension
+    labels : dict, default=None
+      additional labels added to all metrics, e.g. ``{'job': 'nightly'}``
+    """
+    def __init__(self, path, labels=None):
+        self.path = path
+        self.labels = OrderedDict(labels or {})
+        self.counts = OrderedDict((name, 0) for name in EVENTS)
+        self.in_progress = 0
+        self.last_time = None
+        self.last_duration = None
+        self.measurements = OrderedDict()
+
+    def _labels(self, **labels):
+        labels = OrderedDict(self.labels, **labels)
+        if not labels:
+            return ''
+        return '{%s}' % ','.join(
+            '%s="%s"' % (key, str(val).replace('"', r'\"'))
+            for key, val in labels.items())
+
+    def __call__(self, event):
+        name = event['event']
+        self.counts[name] = self.counts.get(name, 0) + 1
+        self.last_time = event['time']
+        if name == 'case_started':
+            self.in_progress += 1
+        elif name in ['case_finished', 'error']:
+            self.in_progress = max(self.in_progress - 1, 0)
+            self.last_duration = event.get('duration')
+        elif name == 'measurement' and _is_number(event['value']):
+            self.measurements[event['metric']] = event['value']
+        self.write()
+
+    def write(self):
+        """Write the metrics file"""
+        lines = ['# HELP neurtu_events_total Number of benchmark events',
+                 '# TYPE neurtu_events_total counter']
+        for name, count in self.counts.items():
+            lines.append('neurtu_events_total%s %s'
+                         % (self._labels(event=name), count))
+        for metric, kind, value, description in [
+                ('neurtu_cases_in_progress', 'gauge', self.in_progress,
+                 'Number of cases being evaluated'),
+                ('neurtu_last_event_timestamp_seconds', 'gauge',
+                 self.last_time, 'Time of the last event'),
+                ('neurtu_last_case_duration_seconds', 'gauge',
+                 self.last_duration, 'Duration of the last case')]:
+            if value is None:
+                continue
+            lines.append('# HELP %s %s' % (metric, description))
+            lines.append('# TYPE %s %s' % (metric, kind))
+            lines.append('%s%s %r' % (metric, self._labels(), float(value)))
+        if self.measurements:
+            lines.append('# HELP neurtu_measurement Last measured value of '
+                         'each metric')
+            lines.append('# TYPE neurtu_measurement gauge')
+            for key, value in self.measurements.items():
+                lines.append('neurtu_measurement%s %r'
+                             % (self._labels(metric=key), float(value)))
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as fh:
+            fh.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, self.path)
+
+
+class StatsdEmitter(object):
+    """Send events to a statsd daemon over UDP
+
+    Events are counted as ``<prefix>.<event>``, case durations are sent
+    as ``<prefix>.case_duration`` timings (in ms) and measurements as
+    ``<prefix>.<metric>`` gauges.
+
+    Parameters
+    ----------
+    host : str, default='127.0.0.1'
+      statsd host
+    port : int, default=8125
+      statsd port
+    prefix : str, default='neurtu'
+      prefix of the metric names
+    """
+    def __init__(self, host='127.0.0.1', port=8125, prefix='neurtu'):
+        self.host = host
+        self.port = port
+        self.prefix = prefix
+        self._sock = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_sock'] = None
+        state['_lock'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _name(self, name):
+        return '%s.%s' % (self.prefix, re.sub(r'[^A-Za-z0-9_.-]', '_',
+                                              str(name)))
+
+    def __call__(self, event):
+        name = event['event']
+        packets = ['%s:1|c' % self._name(name)]
+        if event.get('duration') is not None:
+            packets.append('%s:%.3f|ms' % (self._name('case_duration'),
+                                           1000 * event['duration']))
+        if name == 'measurement' and _is_number(event['value']):
+            packets.append('%s:%r|g' % (self._name(event['metric']),
+                                        float(event['value'])))
+        with self._lock:
+            if self._sock is None:
+                self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            for packet in packets:
+                self._sock.sendto(packet.encode('utf-8'),
+                                  (self.host, self.port))
+
+    def close(self):
+        """Close the UDP socket"""
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
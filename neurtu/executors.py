@@ -0,0 +1,599 @@
+# neurtu, BSD 3 clause license
+# Authors: Roman Yurchak
+"""Execution backends for :class:`neurtu.Benchmark`"""
+
+import heapq
+import multiprocessing
+import os
+import pickle
+import shutil
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+from .sharing import SharedInputs, loads
+
+
+# pickle protocol used with workers of other Python versions
+_STDIO_PROTOCOL = 4
+
+
+def _default_authkey(authkey=None):
+    """Authentication key shared by remote workers and executors
+
+    There is no default key: workers unpickle, and thus may execute, any
+    data received from an authenticated client.
+    """
+    if authkey is None:
+        authkey = os.environ.get('NEURTU_AUTHKEY') or None
+        if authkey is not None:
+            authkey = authkey.encode('utf-8')
+    if not authkey:
+        raise ValueError('An authentication key is required: pass authkey '
+                         '(--authkey for neurtu worker) or set the '
+                         'NEURTU_AUTHKEY environment variable.')
+    return authkey
+
+
+def _parse_address(address):
+    """Convert a ``'host:port'`` string to a ``(host, port)`` tuple"""
+    if isinstance(address, str):
+        host, _, port = address.rpartition(':')
+        return (host or '127.0.0.1', int(port))
+    return tuple(address)
+
+
+class LocalExecutor(object):
+    """Evaluate benchmark cases sequentially in the calling process"""
+
+    def map(self, benchmark, cases, pbar):
+        """Evaluate cases
+
+        Parameters
+        ----------
+        benchmark : Benchmark
+          the benchmark defining the metrics to evaluate
+        cases : iterable of Delayed
+          cases to evaluate
+        pbar : _ProgressBar
+          progress bar, incremented once per evaluated metric
+
+        Returns
+        -------
+        rows : iterable of dict
+          results in the same order as ``cases``. Rows are evaluated lazily,
+          as they are consumed.
+        """
+        return (benchmark._evaluate_single(obj, pbar) for obj in cases)
+
+
+def _isolated_worker(conn, memory_limit):
+    """Evaluate a case received on a pipe, in a child process"""
+    try:
+        if memory_limit is not None:
+            import resource
+            import psutil
+            # the limit applies to the memory allocated during evaluation
+            limit = (psutil.Process().memory_info().vms +
+                     int(memory_limit * 1024**2))
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        benchmark, obj = loads(conn.recv_bytes())
+        row = benchmark._evaluate_single(obj)
+        row['status'] = 'ok'
+    except MemoryError:
+        row = {'status': 'memory_error', 'error': 'MemoryError'}
+    except Exception as exc:
+        row = {'status': 'error',
+               'error': '%s: %s' % (type(exc).__name__, exc)}
+    conn.send(row)
+    conn.close()
+
+
+class IsolatedExecutor(object):
+    """Evaluate each benchmark case in a child process, with resource
+    guards
+
+    Failures do not abort the benchmark, but are recorded in the ``status``
+    column of the result row: ``'ok'``, ``'timeout'`` (the case was killed
+    after ``timeout`` seconds), ``'memory_error'`` (the case exceeded
+    ``memory_limit``), ``'error'`` (an exception was raised) or
+    ``'crashed'`` (the child process died). The ``error`` column contains
+    the error message. Large numpy inputs are passed to the child process
+    through shared memory (see :class:`neurtu.sharing.SharedInputs`).
+
+    Parameters
+    ----------
+    timeout : float, default=None
+      maximum wall time in s for the evaluation of all metrics of a case
+    memory_limit : float, default=None
+      maximum memory in MB that can be allocated while evaluating a case,
+      enforced with ``RLIMIT_AS`` (Unix only)
+    start_method : str, default=None
+      multiprocessing start method. By default, use the platform default.
+    """
+    def __init__(self, timeout=None, memory_limit=None, start_method=None):
+        if memory_limit is not None and sys.platform == 'win32':
+            raise ValueError('memory_limit is not supported on Windows.')
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.start_method = start_method
+
+    def map(self, benchmark, cases, pbar):
+        """Evaluate cases, see :meth:`LocalExecutor.map`"""
+        ctx = multiprocessing.get_context(self.start_method)
+        rows = []
+        with SharedInputs() as shared:
+            for obj in cases:
+                start = time.time()
+                benchmark._emit('case_started', obj)
+                row = self._evaluate(ctx, shared, benchmark, obj)
+                for key, val in obj.get_tags().items():
+                    row.setdefault(key, val)
+                for key, val in obj.get_env().items():
+                    row.setdefault(key, val)
+                benchmark._emit_row(obj, row, start)
+                rows.append(row)
+                pbar.increment(benchmark._n_metrics_per_case())
+        return rows
+
+    def _evaluate(self, ctx, shared, benchmark, obj):
+        data = shared.dumps((benchmark, obj))
+        parent_conn, child_conn = ctx.Pipe()
+        proc = ctx.Process(target=_isolated_worker,
+                           args=(child_conn, self.memory_limit))
+        proc.daemon = True
+        proc.start()
+        child_conn.close()
+        try:
+            parent_conn.send_bytes(data)
+            if parent_conn.poll(self.timeout):
+                row = parent_conn.recv()
+            else:
+                row = {'status': 'timeout',
+                       'error': 'Timeout after %s s' % self.timeout}
+        except (EOFError, OSError):
+            row = {'status': 'crashed', 'error': 'Child process died'}
+        finally:
+            parent_conn.close()
+            if proc.is_alive():
+                proc.kill()
+            proc.join()
+        if row['status'] == 'crashed' and proc.exitcode:
+            row['error'] += ' with exit code %s' % proc.exitcode
+        return row
+
+
+def _default_expected_cost(obj):
+    """Expected cost of a case, from its declared work counts"""
+    work = obj.get_work() if hasattr(obj, 'get_work') else None
+    if not work:
+        return 0
+    return sum(work.values())
+
+
+class _Scheduler(object):
+    """Thread-safe queue of cases, longest expected first"""
+    def __init__(self, cases, expected_cost, n_workers):
+        self.heap = [(-expected_cost(obj), idx, obj)
+                     for idx, obj in enumerate(cases)]
+        heapq.heapify(self.heap)
+        self.n_total = len(cases)
+        self.results = {}
+        self.errors = []
+        self.n_workers = n_workers
+        self.cond = threading.Condition()
+
+    def get(self):
+        """Next case to run, or None when there is nothing left to do"""
+        with self.cond:
+            while True:
+                if self.errors:
+                    return None
+                if self.heap:
+                    return heapq.heappop(self.heap)
+                if len(self.results) == self.n_total:
+                    return None
+                # cases in progress on other workers may be requeued
+                self.cond.wait(0.1)
+
+    def requeue(self, item):
+        with self.cond:
+            heapq.heappush(self.heap, item)
+            self.cond.notify_all()
+
+    def done(self, idx, row):
+        with self.cond:
+            self.results[idx] = row
+            self.cond.notify_all()
+
+    def fail(self, message):
+        with self.cond:
+            self.errors.append(message)
+            self.cond.notify_all()
+
+    def worker_lost(self):
+        with self.cond:
+            self.n_workers -= 1
+            self.cond.notify_all()
+
+
+class RemoteExecutor(object):
+    """Evaluate benchmark cases on remote workers over TCP
+
+    Workers are started with ``neurtu worker --host HOST --port PORT``
+    (or :func:`serve`). Cases are sent to the first available worker,
+    longest expected first. Workers send heartbeats while computing, and
+    cases of workers that died or stopped responding are requeued on the
+    remaining workers. Each result row gets a ``host`` column with the
+    address of the worker that evaluated it.
+
+    .. warning::
+
+       cases are serialized with pickle, and workers execute them. Anyone
+       knowing the ``authkey`` can run arbitrary code on the workers, and
+       a malicious worker can run arbitrary code in the calling process.
+       Use a secret key, and only run workers on trusted networks.
+
+    Parameters
+    ----------
+    hosts : list
+      addresses of the workers, as ``'host:port'`` strings or
+      ``(host, port)`` tuples
+    expected_cost : callable, default=None
+      function returning the expected cost of a delayed object, used to
+      schedule longest cases first. By default, use the sum of declared
+      work counts.
+    heartbeat_timeout : float, default=30.0
+      a worker is considered dead when no message was received for this
+      number of seconds
+    authkey : bytes, default=None
+      secret authentication key shared with the workers. By default, use
+      the ``NEURTU_AUTHKEY`` environment variable. A ``ValueError`` is
+      raised if neither is provided.
+    """
+    def __init__(self, hosts, expected_cost=None, heartbeat_timeout=30.0,
+                 authkey=None):
+        self.hosts = [_parse_address(host) for host in hosts]
+        if not self.hosts:
+            raise ValueError('At least one worker host must be provided!')
+        self.expected_cost = (expected_cost if expected_cost is not None
+                              else _default_expected_cost)
+        self.heartbeat_timeout = heartbeat_timeout
+        self.authkey = _default_authkey(authkey)
+
+    def map(self, benchmark, cases, pbar):
+        """Evaluate cases, see :meth:`LocalExecutor.map`"""
+        cases = list(cases)
+        scheduler = _Scheduler(cases, self.expected_cost, len(self.hosts))
+        threads = [threading.Thread(target=self._run_worker,
+                                    args=(address, benchmark, scheduler,
+                                          pbar))
+                   for address in self.hosts]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if scheduler.errors:
+            raise RuntimeError('Remote evaluation failed:\n%s'
+                               % scheduler.errors[0])
+        if len(scheduler.results) != len(cases):
+            raise RuntimeError(('All workers died with %s cases left to '
+                                'evaluate!')
+                               % (len(cases) - len(scheduler.results)))
+        return [scheduler.results[idx] for idx in range(len(cases))]
+
+    def _run_worker(self, address, benchmark, scheduler, pbar):
+        host = '%s:%s' % address
+        try:
+            conn = Client(address, authkey=self.authkey)
+        except AuthenticationError:
+            scheduler.fail('Authentication with %s failed, check the '
+                           'authkey' % host)
+            return
+        except (OSError, EOFError):
+            scheduler.worker_lost()
+            return
+        item = None
+        try:
+            # the benchmark is sent once, then only the cases
+            conn.send(('benchmark', benchmark))
+            while True:
+                item = scheduler.get()
+                if item is None:
+                    break
+                _, idx, obj = item
+                start = time.time()
+                benchmark._emit('case_started', obj, host=host)
+                conn.send(('run', obj))
+                while True:
+                    if not conn.poll(self.heartbeat_timeout):
+                        raise socket.timeout('no heartbeat from %s' % host)
+                    msg = conn.recv()
+                    if msg[0] != 'heartbeat':
+                        break
+                if msg[0] == 'error':
+                    benchmark._emit('error', obj, error=msg[1],
+                                    duration=time.time() - start, host=host)
+                    scheduler.fail('%s on %s' % (msg[1], host))
+                    break
+                row = msg[1]
+                row['host'] = host
+                benchmark._emit_row(obj, row, start, host=host)
+                scheduler.done(idx, row)
+                item = None
+                pbar.increment(benchmark._n_metrics_per_case())
+        except (OSError, EOFError):
+            # worker died, run its case on another worker
+            if item is not None:
+                scheduler.requeue(item)
+            scheduler.worker_lost()
+        finally:
+            conn.close()
+
+
+def _handle_connection(conn, heartbeat):
+    """Evaluate cases received on a connection until it is closed"""
+    lock = threading.Lock()
+    benchmark = None
+
+    def send(msg):
+        with lock:
+            conn.send(msg)
+
+    while True:
+        try:
+            msg = conn.recv()
+        except (EOFError, OSError):
+            return
+        if msg[0] == 'benchmark':
+            benchmark = msg[1]
+            continue
+        obj = msg[1]
+        result = []
+
+        def evaluate():
+            try:
+                result.append(('result', benchmark._evaluate_single(obj)))
+            except Exception:
+                result.append(('error', traceback.format_exc()))
+
+        thread = threading.Thread(target=evaluate)
+        thread.daemon = True
+        thread.start()
+        while thread.is_alive():
+            thread.join(heartbeat)
+            if thread.is_alive():
+                send(('heartbeat',))
+        send(result[0])
+
+
+def _send_frame(stream, obj):
+    """Write a length-prefixed pickled object to a binary stream"""
+    data = pickle.dumps(obj, protocol=_STDIO_PROTOCOL)
+    stream.write(struct.pack('>Q', len(data)))
+    stream.write(data)
+    stream.flush()
+
+
+def _recv_frame(stream):
+    """Read a length-prefixed pickled object from a binary stream"""
+    header = stream.read(8)
+    if len(header) < 8:
+        raise EOFError
+    size, = struct.unpack('>Q', header)
+    data = stream.read(size)
+    if len(data) < size:
+        raise EOFError
+    return pickle.loads(data)
+
+
+def _environment_info():
+    """Versions of the interpreter and of some packages"""
+    import platform
+    info = {'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'executable': sys.executable}
+    for name in ['numpy', 'scipy', 'pandas', 'sklearn']:
+        try:
+            module = __import__(name)
+        except ImportError:
+            continue
+        info[name] = getattr(module, '__version__', None)
+    return info
+
+
+def serve_stdio(stdin=None, stdout=None):
+    """Run a benchmark worker, evaluating cases received on the standard
+    input, and writing results on the standard output. Used by
+    :class:`EnvironmentExecutor`."""
+    if stdin is None:
+        stdin = sys.stdin.buffer
+    if stdout is None:
+        stdout = sys.stdout.buffer
+    # anything printed by the benchmarked code goes to stderr
+    sys.stdout = sys.stderr
+    _send_frame(stdout, ('hello', _environment_info()))
+    while True:
+        try:
+            _, benchmark, obj = _recv_frame(stdin)
+        except EOFError:
+            return
+        try:
+            msg = ('result', benchmark._evaluate_single(obj))
+        except Exception:
+            msg = ('error', traceback.format_exc())
+        _send_frame(stdout, msg)
+
+
+def _interpreter_path(path):
+    """Python interpreter of a virtual environment, or the path itself"""
+    if os.path.isdir(path):
+        for name in [os.path.join('bin', 'python'),
+                     os.path.join('Scripts', 'python.exe')]:
+            candidate = os.path.join(path, name)
+            if os.path.exists(candidate):
+                return candidate
+        raise ValueError('No Python interpreter found in %s' % path)
+    return path
+
+
+def _package_path():
+    """Temporary directory containing only the neurtu package of the calling
+    process, to be added to the ``PYTHONPATH`` of workers"""
+    path = tempfile.mkdtemp(prefix='neurtu-')
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    try:
+        os.symlink(package_dir, os.path.join(path, 'neurtu'))
+    except (OSError, NotImplementedError, AttributeError):
+        # e.g. on Windows without the symlink privilege
+        shutil.copytree(package_dir, os.path.join(path, 'neurtu'),
+                        ignore=shutil.ignore_patterns('__pycache__'))
+    return path
+
+
+class EnvironmentExecutor(object):
+    """Evaluate benchmark cases in several Python environments
+
+    A worker subprocess (``python -m neurtu worker --stdio``) is started in
+    each environment, and each case is evaluated in all environments, one
+    after the other. Result rows get an ``environment`` index column, as
+    well as the ``python`` version and the versions of numpy, scipy,
+    pandas and scikit-learn when installed. Use
+    :func:`neurtu.compare.speedup_table` to compare environments.
+
+    Cases are serialized with pickle (protocol 4), so the benchmarked
+    functions must be importable in all environments. The neurtu package
+    of the calling process (and only it, not the other packages installed
+    next to it) is added to the ``PYTHONPATH`` of the workers.
+
+    Parameters
+    ----------
+    environments : {list, dict}
+      paths to Python interpreters or virtual environments. When a
+      dictionary, keys are used as environment labels, otherwise the
+      paths are.
+    """
+    index = ('environment',)
+
+    def __init__(self, environments):
+        if not isinstance(environments, dict):
+            environments = OrderedDict((path, path) for path in environments)
+        if not environments:
+            raise ValueError('At least one environment must be provided!')
+        self.environments = OrderedDict(
+            (label, _interpreter_path(path))
+            for label, path in environments.items())
+        self.n_rows_per_case = len(self.environments)
+
+    def _start_workers(self, workers, package_path):
+        env = os.environ.copy()
+        env['PYTHONPATH'] = os.pathsep.join(
+            [package_path] + [el for el in [env.get('PYTHONPATH')] if el])
+        for label, executable in self.environments.items():
+            proc = subprocess.Popen(
+                [executable, '-m', 'neurtu', 'worker', '--stdio'],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, env=env)
+            workers[label] = (proc, None)
+            try:
+                _, info = _recv_frame(proc.stdout)
+            except EOFError:
+                raise RuntimeError('Failed to start a worker in %s' % label)
+            workers[label] = (proc, info)
+
+    def map(self, benchmark, cases, pbar):
+        """Evaluate cases in all environments
+
+        Returns
+        -------
+        rows : list of dict
+          for each case (in order), one row per environment
+        """
+        workers = OrderedDict()
+        package_path = _package_path()
+        rows = []
+        try:
+            self._start_workers(workers, package_path)
+            for obj in cases:
+                for label, (proc, info) in workers.items():
+                    start = time.time()
+                    benchmark._emit('case_started', obj, environment=label)
+                    _send_frame(proc.stdin, ('run', benchmark, obj))
+                    try:
+                        msg = _recv_frame(proc.stdout)
+                    except EOFError:
+                        raise RuntimeError('Worker in %s died!' % label)
+                    if msg[0] == 'error':
+                        benchmark._emit('error', obj, error=msg[1],
+                                        duration=time.time() - start,
+                                        environment=label)
+                        raise RuntimeError('Evaluation failed in %s:\n%s'
+                                           % (label, msg[1]))
+                    row = msg[1]
+                    row['environment'] = label
+                    for key, val in info.items():
+                        if key != 'executable':
+                            row[key] = val
+                    benchmark._emit_row(obj, row, start, environment=label)
+                    rows.append(row)
+                pbar.increment(benchmark._n_metrics_per_case())
+        finally:
+            for proc, _ in workers.values():
+                proc.stdin.close()
+                proc.wait()
+                proc.stdout.close()
+            shutil.rmtree(package_path, ignore_errors=True)
+        return rows
+
+
+def serve(host='127.0.0.1', port=0, authkey=None, heartbeat=1.0,
+          stream=None):
+    """Run a benchmark worker, evaluating cases sent by a
+    :class:`RemoteExecutor`
+
+    .. warning::
+
+       received cases are unpickled and executed: anyone knowing the
+       ``authkey`` can run arbitrary code with the permissions of the
+       worker. Use a secret key, and prefer listening on the loopback
+       interface or on a trusted network.
+
+    Parameters
+    ----------
+    host : str, default='127.0.0.1'
+      address to listen on
+    port : int, default=0
+      port to listen on. If 0, a free port is chosen.
+    authkey : bytes, default=None
+      secret authentication key shared with clients. By default, use the
+      ``NEURTU_AUTHKEY`` environment variable. A ``ValueError`` is raised
+      if neither is provided.
+    heartbeat : float, default=1.0
+      interval in seconds between heartbeats sent while computing
+    stream : file, default=sys.stdout
+      stream where the listening address is written
+    """
+    authkey = _default_authkey(authkey)
+    if stream is None:
+        stream = sys.stdout
+    with Listener((host, port), authkey=authkey) as listener:
+        stream.write('neurtu worker listening on %s:%s\n'
+                     % listener.address)
+        stream.flush()
+        while True:
+            try:
+                conn = listener.accept()
+            except Exception:
+                # failed authentication
+                continue
+            with conn:
+                _handle_connection(conn, heartbeat)
@@ -0,0 +1,199 @@
+# neurtu, BSD 3 clause license
+# Authors: Roman Yurchak
+"""Lazy parametric grids of benchmark cases"""
+
+import inspect
+import itertools
+import sys
+from collections import OrderedDict
+
+from .delayed import delayed
+
+
+def _arg_names(func):
+    """Names of the arguments of a function, and whether it accepts
+    arbitrary keyword arguments"""
+    sig = inspect.signature(func)
+    names = []
+    var_kwargs = False
+    for param in sig.parameters.values():
+        if param.kind == param.VAR_KEYWORD:
+            var_kwargs = True
+        elif param.kind != param.VAR_POSITIONAL:
+            names.append(param.name)
+    return names, var_kwargs
+
+
+def _nbytes(obj):
+    nbytes = getattr(obj, 'nbytes', None)
+    if isinstance(nbytes, int):
+        return nbytes
+    return sys.getsizeof(obj)
+
+
+class _LRUCache(object):
+    """Least recently used cache, bounded by the size in bytes of the
+    stored values
+
+    Values larger than the budget are not stored.
+    """
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes
+        self.data = OrderedDict()
+        self.nbytes = 0
+        self.n_misses = 0
+
+    def get(self, key, factory):
+        if key in self.data:
+            self.data.move_to_end(key)
+            return self.data[key][0]
+        self.n_misses += 1
+        value = factory()
+        nbytes = _nbytes(value)
+        if self.max_bytes is not None and nbytes > self.max_bytes:
+            return value
+        if self.max_bytes is not None:
+            while self.data and self.nbytes + nbytes > self.max_bytes:
+                _, (_, evicted_nbytes) = self.data.popitem(last=False)
+                self.nbytes -= evicted_nbytes
+        self.data[key] = (value, nbytes)
+        self.nbytes += nbytes
+        return value
+
+    def clear(self):
+        self.data.clear()
+        self.nbytes = 0
+
+
+class Grid(object):
+    """Lazy parametric grid of delayed benchmark cases
+
+    See :func:`grid` for a description of the parameters.
+
+    Cases are generated on iteration, and inputs are only computed when
+    the corresponding case is generated. :class:`Benchmark` evaluates
+    grids as a stream, without holding all cases in memory.
+    """
+    def __init__(self, func, params, inputs=None, max_bytes=None):
+        self.func = func
+        self.inputs = OrderedDict(inputs or {})
+        for key, val in params.items():
+            if isinstance(val, (str, bytes)) or not hasattr(val, '__iter__'):
+                raise ValueError('Parameter %s=%r should be a list of values!'
+                                 % (key, val))
+        self.params = OrderedDict((key, list(val))
+                                  for key, val in params.items())
+        for key, values in self.params.items():
+            # cases are identified by their tags
+            try:
+                n_unique = len(set(values))
+            except TypeError:
+                # unhashable values
+                n_unique = len(set(repr(val) for val in values))
+            if n_unique != len(values):
+                raise ValueError('Values of parameter %s=%r are not unique!'
+                                 % (key, values))
+
+        self._input_deps = OrderedDict()
+        for name, factory in self.inputs.items():
+            if name in self.params:
+                raise ValueError('Input %s conflicts with a parameter of '
+                                 'the same name!' % name)
+            deps, _ = _arg_names(factory)
+            for key in deps:
+                if key not in self.params:
+                    raise ValueError(('Argument %s of the %s input factory '
+                                      'is not a grid parameter!')
+                                     % (key, name))
+            self._input_deps[name] = deps
+        self._func_args = _arg_names(func)
+        self.cache = _LRUCache(max_bytes)
+
+    @property
+    def tag_names(self):
+        """Names of the grid parameters, used as tags"""
+        return list(self.params)
+
+    def __len__(self):
+        n_cases = 1
+        for val in self.params.values():
+            n_cases *= len(val)
+        return n_cases
+
+    def _iteration_order(self):
+        """Parameters on which inputs depend come first, so that cases
+        sharing inputs are generated consecutively"""
+        deps = []
+        for names in self._input_deps.values():
+            for key in names:
+                if key not in deps:
+                    deps.append(key)
+        return deps + [key for key in self.params if key not in deps]
+
+    def _input(self, name, tags):
+        deps = self._input_deps[name]
+        key = (name,) + tuple(tags[dep] for dep in deps)
+        return self.cache.get(
+            key, lambda: self.inputs[name](**dict((dep, tags[dep])
+                                                  for dep in deps)))
+
+    def __iter__(self):
+        order = self._iteration_order()
+        arg_names, var_kwargs = self._func_args
+        for values in itertools.product(*[self.params[key]
+                                          for key in order]):
+            values = dict(zip(order, values))
+            tags = OrderedDict((key, values[key]) for key in self.params)
+            kwargs = OrderedDict(tags)
+            for name in self.inputs:
+                kwargs[name] = self._input(name, tags)
+            if not var_kwargs:
+                kwargs = dict((key, val) for key, val in kwargs.items()
+                              if key in arg_names)
+            yield delayed(self.func, tags=tags)(**kwargs)
+
+
+def grid(func, inputs=None, max_bytes=None, **params):
+    """Lazy parametric grid of benchmark cases
+
+    Each case calls ``func`` with the grid parameters and inputs as keyword
+    arguments (only the ones in the signature of ``func``, unless it
+    accepts ``**kwargs``), and is tagged with the parameters.
+
+    Inputs are generated by factories called with the parameters they
+    depend on (as given by their signature). They are memoized, so that
+    an input is generated once per combination of these parameters, and
+    cases are generated in an order where consecutive cases share inputs.
+
+    Parameters
+    ----------
+    func : callable
+      function to benchmark
+    inputs : dict, default=None
+      input factories of the form ``{name: factory}``
+    max_bytes : int, default=None
+      maximum size in bytes of memoized inputs. Least recently used inputs
+      are evicted first, and inputs larger than ``max_bytes`` are not
+      memoized. By default, the size is not bounded.
+    **params : dict
+      lists of parameter values of the form ``{name: values}``
+
+    Returns
+    -------
+    cases : Grid
+      a lazy iterable of :class:`Delayed` objects
+
+    Example
+    -------
+    >>> def power_sum(x, p):
+    ...     return sum(el**p for el in x)
+    >>> cases = grid(power_sum, p=[1, 2, 3], N=[10, 100],
+    ...              inputs={'x': lambda N: range(N)})
+    >>> len(cases)
+    6
+    >>> [(obj.get_tags()['N'], obj.get_tags()['p']) for obj in cases][:4]
+    [(10, 1), (10, 2), (10, 3), (100, 1)]
+    >>> cases.cache.n_misses
+    2
+    """
+    return Grid(func, params, inputs=inputs, max_bytes=max_bytes)
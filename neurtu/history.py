@@ -0,0 +1,358 @@
+# neurtu, BSD 3 clause license
+# Authors: Roman Yurchak
+"""Historical trends of stored benchmark runs, with changepoint detection"""
+
+from __future__ import division
+
+import datetime
+import html
+import math
+from collections import OrderedDict
+
+from .resultset import ResultSet, _agg_median
+
+# size of the SVG trend plots, in px
+_WIDTH, _HEIGHT, _MARGIN = 640, 180, 40
+
+
+def _noise_std(values):
+    """Estimate of the standard deviation of the noise, from the
+    differences between consecutive values (which are not much affected
+    by a few changes in the mean)
+
+    The median of the absolute differences is robust to changes, but has a
+    large variance for short series, and underestimating the noise leads
+    to false changes: the root mean square of the differences is used if
+    larger (unless most values are equal, i.e. there is no noise).
+    """
+    scale = abs(_agg_median(values)) if values else 0
+    diffs = [abs(b - a) for a, b in zip(values[:-1], values[1:])]
+    if diffs:
+        std = 1.4826 * _agg_median(diffs) / math.sqrt(2)
+        if std > 1e-12 * scale:
+            rms = math.sqrt(math.fsum(d * d for d in diffs) / len(diffs))
+            return max(std, rms / math.sqrt(2))
+    # noiseless series: changes are relative to the values
+    return 1e-3 * scale if scale > 0 else 1.0
+
+
+def pelt(values, penalty=None, min_size=2):
+    """Detect changes in the mean of a series with PELT
+
+    Pruned Exact Linear Time search (Killick et al., 2012) of the
+    segmentation minimizing the sum of squared deviations from the segment
+    means, normalized by the noise variance, plus a penalty per
+    changepoint.
+
+    Parameters
+    ----------
+    values : list of float
+      the series
+    penalty : float, default=None
+      cost of adding a changepoint, in units of the noise variance
+      (estimated from consecutive differences). By default,
+      ``3 * log(len(values))``, stronger than the BIC penalty
+      (``2 * log(len(values))``) which finds false changes in noise.
+    min_size : int, default=2
+      minimum number of values per segment
+
+    Returns
+    -------
+    changepoints : list of int
+      indices of the first value of each new segment
+
+    Example
+    -------
+    >>> pelt([1.0, 1.1, 0.9, 1.0, 2.0, 2.1, 1.9, 2.0])
+    [4]
+    """
+    values = [float(val) for val in values]
+    n = len(values)
+    if min_size < 1:
+        raise ValueError('min_size=%s should be a positive integer!'
+                         % min_size)
+    if n < 2 * min_size:
+        return []
+    if penalty is None:
+        penalty = 3 * math.log(n)
+    scale = _noise_std(values)**2
+
+    cumsum, cumsum2 = [0.0], [0.0]
+    for val in values:
+        cumsum.append(cumsum[-1] + val)
+        cumsum2.append(cumsum2[-1] + val * val)
+
+    def cost(start, stop):
+        total = cumsum[stop] - cumsum[start]
+        return max(cumsum2[stop] - cumsum2[start] -
+                   total * total / (stop - start), 0.0) / scale
+
+    best = {0: -penalty}
+    last = {0: 0}
+    candidates = []
+    for stop in range(min_size, n + 1):
+        start = stop - min_size
+        if start == 0 or start >= min_size:
+            candidates.append(start)
+        costs = [best[start] + cost(start, stop) for start in candidates]
+        best[stop] = min(costs) + penalty
+        last[stop] = candidates[costs.index(min(costs))]
+        # prune the candidates that can never be optimal
+        candidates = [start for start, val in zip(candidates, costs)
+                      if val <= best[stop]]
+
+    changepoints = []
+    stop = n
+    while stop > 0:
+        stop = last[stop]
+        if stop > 0:
+            changepoints.append(stop)
+    return changepoints[::-1]
+
+
+def _run_info(run):
+    """Commit and date of a stored run"""
+    metadata = run.get('metadata') or {}
+    git = metadata.get('git') or {}
+    commit = git.get('sha')
+    if commit is not None and git.get('dirty'):
+        commit += '+dirty'
+    return commit, metadata.get('timestamp') or run.get('timestamp')
+
+
+def time_series(store, metric='wall_time', method='mean', **tags):
+    """Time series of a metric for each case of a result store
+
+    Parameters
+    ----------
+    store : ResultStore
+      the stored runs
+    metric : str, default='wall_time'
+      the metric
+    method : str, default='mean'
+      aggregation of the samples of each run, see
+      :meth:`neurtu.store.ResultStore.aggregate`
+    **tags : dict
+      only include the cases where the given tags are equal to the given
+      values
+
+    Returns
+    -------
+    res : ResultSet
+      indexed by the tags and the ``run`` id (in the order of the runs),
+      with the ``metric``, the git ``commit`` and the ``date`` of the run
+    """
+    res = store.aggregate(by=store.tag_names + ['run'], methods=method,
+                          metrics=[metric], **tags)
+    runs = dict((run['run'], _run_info(run)) for run in store.runs())
+    order = sorted(range(len(res)), key=lambda idx: res['run'][idx])
+    res = res._take(order)
+    columns = OrderedDict((key, res[key]) for key in res.columns)
+    columns['commit'] = [runs[run][0] for run in res['run']]
+    columns['date'] = [runs[run][1] for run in res['run']]
+    return ResultSet(columns, index=res.index)
+
+
+def _group_cases(series, tag_names):
+    """Split a time series result set by case"""
+    cases = OrderedDict()
+    for row in series:
+        key = tuple((name, row[name]) for name in tag_names)
+        cases.setdefault(repr(key), (OrderedDict(key), []))[1].append(row)
+    return list(cases.values())
+
+
+def detect_changes(store, metric='wall_time', method='mean', penalty=None,
+                   min_size=2, min_change=0.01, **tags):
+    """Find the runs where the metric of each case changed
+
+    Parameters
+    ----------
+    store : ResultStore
+      the stored runs
+    metric : str, default='wall_time'
+      the metric, for which lower values are better
+    method : str, default='mean'
+      aggregation of the samples of each run
+    penalty : float, default=None
+      penalty of the changepoint detection, see :func:`pelt`
+    min_size : int, default=2
+      minimum number of runs between changepoints
+    min_change : float, default=0.01
+      minimum relative change of the mean between segments to report
+    **tags : dict
+      only include the cases where the given tags are equal to the given
+      values
+
+    Returns
+    -------
+    changes : ResultSet
+      indexed by the tags and the first ``run`` after the change, with its
+      ``commit`` and ``date``, the mean of the metric ``before`` and
+      ``after`` the change, the relative ``change``, and its ``kind``
+      (``'regression'`` or ``'improvement'``)
+    """
+    series = time_series(store, metric=metric, method=method, **tags)
+    return _detect_changes(series, store.tag_names, metric, penalty,
+                           min_size, min_change)
+
+
+def _segments(values, changepoints):
+    bounds = [0] + changepoints + [len(values)]
+    return [(start, stop, math.fsum(values[start:stop]) / (stop - start))
+            for start, stop in zip(bounds[:-1], bounds[1:])]
+
+
+def _detect_changes(series, tag_names, metric, penalty, min_size,
+                    min_change):
+    columns = OrderedDict((key, []) for key in tag_names + [
+        'run', 'commit', 'date', 'before', 'after', 'change', 'kind'])
+    for case, rows in _group_cases(series, tag_names):
+        values = [row[metric] for row in rows]
+        segments = _segments(values, pelt(values, penalty, min_size))
+        for (_, _, before), (start, _, after) in zip(segments[:-1],
+                                                     segments[1:]):
+            change = after / before - 1 if before else float('inf')
+            if abs(change) < min_change:
+                continue
+            for key, val in case.items():
+                columns[key].append(val)
+            for key in ['run', 'commit', 'date']:
+                columns[key].append(rows[start][key])
+            columns['before'].append(before)
+            columns['after'].append(after)
+            columns['change'].append(change)
+            columns['kind'].append('regression' if change > 0
+                                   else 'improvement')
+    return ResultSet(columns, index=tag_names + ['run'])
+
+
+def _format(val):
+    if isinstance(val, float):
+        return '%.4g' % val
+    return '%s' % val
+
+
+def _short_commit(commit):
+    return commit[:10] + ('+' if commit.endswith('+dirty') else '') \
+        if commit else ''
+
+
+def _svg_plot(rows, metric, segments):
+    """Trend plot of a case, with the segment means"""
+    values = [row[metric] for row in rows]
+    low, high = min(values), max(values)
+    if high == low:
+        pad = 1e-3 * abs(low) or 1.0
+        low, high = low - pad, high + pad
+    width = _WIDTH - 2 * _MARGIN
+    height = _HEIGHT - 2 * _MARGIN
+
+    def x(idx):
+        step = width / (len(values) - 1) if len(values) > 1 else 0
+        return _MARGIN + (idx * step if len(values) > 1 else width / 2)
+
+    def y(val):
+        return _MARGIN + height * (high - val) / (high - low)
+
+    parts = ['<svg xmlns="http://www.w3.org/2000/svg" width="%d" '
+             'height="%d">' % (_WIDTH, _HEIGHT),
+             '<rect x="%d" y="%d" width="%d" height="%d" fill="none" '
+             'stroke="#ccc"/>' % (_MARGIN, _MARGIN, width, height),
+             '<text x="%d" y="%d" font-size="10" text-anchor="end">%s</text>'
+             % (_MARGIN - 4, _MARGIN + 4, _format(high)),
+             '<text x="%d" y="%d" font-size="10" text-anchor="end">%s</text>'
+             % (_MARGIN - 4, _MARGIN + height, _format(low))]
+    for start, stop, mean in segments:
+        parts.append('<line x1="%.1f" y1="%.1f" x2="%.1f" y2="%.1f" '
+                     'stroke="#e69f00" stroke-dasharray="4"/>'
+                     % (x(start), y(mean), x(stop - 1), y(mean)))
+        if start > 0:
+            commit = _short_commit(rows[start]['commit'])
+            parts.append('<line x1="%.1f" y1="%d" x2="%.1f" y2="%d" '
+                         'stroke="#d55e00"/>'
+                         % (x(start), _MARGIN, x(start), _MARGIN + height))
+            parts.append('<text x="%.1f" y="%d" font-size="10" '
+                         'fill="#d55e00">%s</text>'
+                         % (x(start) + 2, _MARGIN - 4,
+                            html.escape('run %s %s'
+                                        % (rows[start]['run'], commit))))
+    points = ' '.join('%.1f,%.1f' % (x(idx), y(val))
+                      for idx, val in enumerate(values))
+    parts.append('<polyline points="%s" fill="none" stroke="#0072b2"/>'
+                 % points)
+    for idx, (row, val) in enumerate(zip(rows, values)):
+        parts.append('<circle cx="%.1f" cy="%.1f" r="3" fill="#0072b2">'
+                     '<title>%s</title></circle>'
+                     % (x(idx), y(val), html.escape(
+                         'run %s, %s, %s: %s'
+                         % (row['run'], _short_commit(row['commit']),
+                            row['date'], _format(val)))))
+    for idx in sorted(set([0, len(rows) - 1])):
+        parts.append('<text x="%.1f" y="%d" font-size="10" '
+                     'text-anchor="middle">run %s</text>'
+                     % (x(idx), _MARGIN + height + 14, rows[idx]['run']))
+    parts.append('</svg>')
+    return '\n'.join(parts)
+
+
+def _html_table(res):
+    lines = ['<table>', '<tr>%s</tr>' % ''.join(
+        '<th>%s</th>' % html.escape(str(key)) for key in res.columns)]
+    for row in res:
+        lines.append('<tr>%s</tr>' % ''.join(
+            '<td>%s</td>' % html.escape(_format(val))
+            for val in row.values()))
+    lines.append('</table>')
+    return '\n'.join(lines)
+
+
+def history_report(store, path, metric='wall_time', method='mean',
+                   penalty=None, min_size=2, min_change=0.01, **tags):
+    """Write a static HTML report of the trends of each case, with the
+    detected changes
+
+    Parameters
+    ----------
+    store : ResultStore
+      the stored runs
+    path : str
+      path of the HTML file
+    metric, method, penalty, min_size, min_change, **tags
+      see :func:`detect_changes`
+
+    Returns
+    -------
+    changes : ResultSet
+      the detected changes, see :func:`detect_changes`
+    """
+    series = time_series(store, metric=metric, method=method, **tags)
+    tag_names = store.tag_names
+    changes = _detect_changes(series, tag_names, metric, penalty, min_size,
+                              min_change)
+    title = 'neurtu history: %s' % metric
+    body = ['<h1>%s</h1>' % html.escape(title),
+            '<p>%s, %s runs, %s cases. Generated on %s.</p>'
+            % (html.escape(store.path), len(store.runs()),
+               len(store.cases()), datetime.datetime.now(
+                   datetime.timezone.utc).strftime('%Y-%m-%d %H:%M UTC')),
+            '<h2>Changes</h2>']
+    if len(changes):
+        body.append(_html_table(changes))
+    else:
+        body.append('<p>No changes detected.</p>')
+    body.append('<h2>Cases</h2>')
+    for case, rows in _group_cases(series, tag_names):
+        values = [row[metric] for row in rows]
+        segments = _segments(values, pelt(values, penalty, min_size))
+        body.append('<h3>%s</h3>' % html.escape(', '.join(
+            '%s=%s' % (key, val) for key, val in case.items()) or metric))
+        body.append(_svg_plot(rows, metric, segments))
+    with open(path, 'w') as fh:
+        fh.write('<!DOCTYPE html>\n<html>\n<head>\n<meta charset="utf-8">\n'
+                 '<title>%s</title>\n<style>\nbody {font-family: sans-serif;'
+                 '}\ntable {border-collapse: collapse;}\n'
+                 'td, th {border: 1px solid #ccc; padding: 2px 6px;}\n'
+                 '</style>\n</head>\n<body>\n%s\n</body>\n</html>\n'
+                 % (html.escape(title), '\n'.join(body)))
+    return changes
@@ -0,0 +1,292 @@
+# neurtu, BSD 3 clause license
+# Authors: Roman Yurchak
+"""Incremental benchmarks, re-measuring only the cases whose code changed
+
+The source files executed by each case are recorded with a tracing pass
+(:func:`sys.settrace`), after the case is measured. On the next run, cases
+are re-measured only if the content of one of these files changed, and the
+cached results are reused for the others.
+
+Code without a source file (e.g. builtins or C extensions) is not traced:
+the cache is therefore only valid for the interpreter, the host and the
+versions of the packages under test it was created with.
+
+The cache is a JSON file: cases whose result rows cannot be represented in
+JSON (e.g. arbitrary objects returned by custom metrics) are measured on
+every run.
+"""
+
+import hashlib
+import json
+import os
+import sys
+import threading
+import types
+from collections import OrderedDict
+
+from .delayed import Delayed
+
+FORMAT_VERSION = 2
+
+# code of neurtu itself is not a dependency of the cases
+_NEURTU_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _is_source_file(filename):
+    return (not filename.startswith('<') and
+            not filename.startswith(_NEURTU_DIR + os.sep) and
+            os.path.isfile(filename))
+
+
+def trace_dependencies(obj):
+    """Source files and functions executed when evaluating a delayed object
+
+    Only function calls are traced (not lines), in the calling thread and in
+    the threads started during the evaluation. Files of neurtu itself and
+    code without a source file (e.g. C extensions) are ignored.
+
+    Parameters
+    ----------
+    obj : Delayed
+      the benchmark case, evaluated once
+
+    Returns
+    -------
+    dependencies : dict
+      names of the executed functions, by absolute source file path
+
+    Example
+    -------
+    >>> import json
+    >>> from neurtu import delayed
+    >>> deps = trace_dependencies(delayed(json.dumps)([1]))
+    >>> 'dumps' in deps[json.__file__]
+    True
+    """
+    codes = set()
+
+    def tracer(frame, event, arg):
+        codes.add(frame.f_code)
+        # do not trace lines
+        return None
+
+    sys_trace = sys.gettrace()
+    threading_trace = getattr(threading, 'gettrace', lambda: None)()
+    threading.settrace(tracer)
+    sys.settrace(tracer)
+    try:
+        obj.compute()
+    finally:
+        sys.settrace(sys_trace)
+        threading.settrace(threading_trace)
+
+    dependencies = {}
+    for code in codes:
+        if code.co_filename not in dependencies:
+            if not _is_source_file(code.co_filename):
+                continue
+            dependencies[code.co_filename] = set()
+        dependencies[code.co_filename].add(
+            getattr(code, 'co_qualname', code.co_name))
+    return OrderedDict((os.path.abspath(filename), sorted(names))
+                       for filename, names in sorted(dependencies.items()))
+
+
+def _stable_repr(value):
+    """Representation of a value that does not depend on the process (e.g.
+    memory addresses) and includes the content of large arrays"""
+    if isinstance(value, Delayed):
+        return fingerprint(value)
+    if isinstance(value, (list, tuple)):
+        return '%s(%s)' % (type(value).__name__,
+                           ', '.join(_stable_repr(el) for el in value))
+    if isinstance(value, dict):
+        items = sorted('%s: %s' % (_stable_repr(key), _stable_repr(val))
+                       for key, val in value.items())
+        return '{%s}' % ', '.join(items)
+    if isinstance(value, types.ModuleType):
+        return value.__name__
+    if callable(value) and hasattr(value, '__qualname__'):
+        # classes, functions and methods
+        return '%s.%s' % (getattr(value, '__module__', None),
+                          value.__qualname__)
+    if hasattr(value, 'tobytes') and hasattr(value, 'dtype'):
+        # numpy arrays
+        return 'array(%s, %s, %s)' % (
+            getattr(value, 'shape', None), value.dtype,
+            hashlib.sha1(value.tobytes()).hexdigest())
+    res = repr(value)
+    if ' at 0x' in res:
+        # default repr of objects
+        cls = type(value)
+        return '<%s.%s>' % (cls.__module__, cls.__qualname__)
+    return res
+
+
+def fingerprint(obj):
+    """Fingerprint of the computation of a delayed object
+
+    It is a hash of the wrapped object (e.g. the qualified name of a
+    function) and of the operations applied to it, with their arguments, so
+    that it is stable across processes.
+
+    Parameters
+    ----------
+    obj : Delayed
+
+    Returns
+    -------
+    fingerprint : str
+
+    Example
+    -------
+    >>> from neurtu import delayed
+    >>> fingerprint(delayed(sum)([1, 2])) == fingerprint(delayed(sum)([1, 2]))
+    True
+    >>> fingerprint(delayed(sum)([1, 2])) == fingerprint(delayed(sum)([1, 3]))
+    False
+    """
+    if not hasattr(obj, '_get_chain'):
+        # other objects following the Delayed API
+        return hashlib.sha1(_stable_repr(obj).encode('utf-8')).hexdigest()
+    chain = obj._get_chain()
+    parts = [_stable_repr(chain['obj'])]
+    for func, args, kwargs in chain['ops']:
+        parts.append('%s %s %s' % (func, _stable_repr(args),
+                                   _stable_repr(kwargs)))
+    return hashlib.sha1('\n'.join(parts).encode('utf-8')).hexdigest()
+
+
+def _file_hash(path):
+    try:
+        with open(path, 'rb') as fh:
+            return hashlib.sha1(fh.read()).hexdigest()
+    except (IOError, OSError):
+        return None
+
+
+class IncrementalCache(object):
+    """Cache of the result rows of benchmark cases, with the hashes of the
+    source files they depend on
+
+    Cases are identified by their tags, env and :func:`fingerprint`. The
+    cache is invalidated when the benchmark configuration (metrics, repeat,
+    executor, ...), the interpreter, the host or the versions of the
+    packages under test change.
+
+    Parameters
+    ----------
+    path : str
+      path of the cache file, created if it does not exist
+    config : str
+      benchmark configuration the results were obtained with
+    """
+    def __init__(self, path, config):
+        self.path = path
+        self.config = config
+        self.entries = {}
+        self.n_reused = 0
+        self.n_measured = 0
+        self._hashes = {}
+        self._fresh = set()
+        if os.path.exists(path):
+            with open(path, 'r') as fh:
+                try:
+                    data = json.load(fh, object_pairs_hook=OrderedDict)
+                except ValueError:
+                    data = {}
+            if isinstance(data, dict) and \
+                    data.get('version') == FORMAT_VERSION and \
+                    data.get('config') == config:
+                self.entries = data['entries']
+
+    @staticmethod
+    def key(obj):
+        """Key of a case in the cache"""
+        return repr((tuple(obj.get_tags().items()),
+                     tuple(obj.get_env().items()), fingerprint(obj)))
+
+    def _hash(self, path):
+        # files are hashed at most once per run
+        if path not in self._hashes:
+            self._hashes[path] = _file_hash(path)
+        return self._hashes[path]
+
+    def is_fresh(self, key):
+        """Whether the cached results of a case can be reused"""
+        entry = self.entries.get(key)
+        if entry is None:
+            return False
+        if all(self._hash(path) == digest
+               for path, digest in entry['hashes'].items()):
+            self._fresh.add(key)
+            return True
+        return False
+
+    def _record(self, key, obj, runs):
+        if any(row.get('status', 'ok') != 'ok'
+               for rows in runs for row in rows):
+            # failed cases are evaluated again on the next run
+            self.entries.pop(key, None)
+            return
+        try:
+            # rows that cannot be saved are not cached
+            json.dumps(runs)
+            dependencies = trace_dependencies(obj)
+        except Exception:
+            self.entries.pop(key, None)
+            return
+        self.entries[key] = OrderedDict([
+            ('hashes', OrderedDict((path, self._hash(path))
+                                   for path in dependencies)),
+            ('functions', dependencies),
+            ('runs', runs)])
+
+    def merge(self, cases, keys, rows, repeat, n_rows_per_case):
+        """Merge the cached rows with the rows of the measured cases
+
+        Parameters
+        ----------
+        cases : list of Delayed
+          all cases, in order
+        keys : list of str
+          keys of the cases
+        rows : iterable of dict
+          rows of the cases that are not fresh, ``repeat`` times
+        repeat : int
+          number of runs
+        n_rows_per_case : int
+          number of rows per case and per run
+
+        Returns
+        -------
+        rows : generator of dict
+          rows of all cases, ``repeat`` times
+        """
+        rows = iter(rows)
+        measured = {}
+        for run in range(repeat):
+            for obj, key in zip(cases, keys):
+                if key in self._fresh:
+                    chunk = self.entries[key]['runs'][run]
+                    if run == 0:
+                        self.n_reused += 1
+                else:
+                    chunk = [next(rows) for _ in range(n_rows_per_case)]
+                    measured.setdefault(key, []).append(
+                        [OrderedDict(row) for row in chunk])
+                    if run == repeat - 1:
+                        # dependencies are traced after the measurements
+                        self._record(key, obj, measured.pop(key))
+                        self.n_measured += 1
+                for row in chunk:
+                    yield OrderedDict(row)
+
+    def save(self):
+        """Write the cache file"""
+        data = {'version': FORMAT_VERSION, 'config': self.config,
+                'entries': self.entries}
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as fh:
+            json.dump(data, fh)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,213 @@
+# neurtu, BSD 3 clause license
+# Authors: Roman Yurchak
+"""Low overhead instrumentation of production code"""
+
+import functools
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict, deque
+
+from .resultset import ResultSet
+
+# tracemalloc is started for the duration of measurements when it is not
+# already tracing, and stopped after the last one
+_TRACEMALLOC = {'active': 0, 'started': False}
+_TRACEMALLOC_LOCK = threading.Lock()
+
+
+def _start_tracing():
+    with _TRACEMALLOC_LOCK:
+        if not _TRACEMALLOC['active'] and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _TRACEMALLOC['started'] = True
+        _TRACEMALLOC['active'] += 1
+
+
+def _stop_tracing():
+    with _TRACEMALLOC_LOCK:
+        _TRACEMALLOC['active'] -= 1
+        if not _TRACEMALLOC['active'] and _TRACEMALLOC['started']:
+            tracemalloc.stop()
+            _TRACEMALLOC['started'] = False
+
+
+class Instrument(object):
+    """Record metrics of function calls or code blocks
+
+    See :func:`instrument` for a description of the parameters.
+
+    Each thread appends records to its own buffer, without locking.
+    :meth:`flush` collects the records of all threads in a
+    :class:`ResultSet`, and drops the buffers of finished threads.
+    """
+    def __init__(self, tags=None, sample=1, cpu_time=False,
+                 traced_memory=False, buffer_size=100000):
+        if int(sample) < 1:
+            raise ValueError('sample=%s should be a positive integer!'
+                             % sample)
+        if cpu_time and not hasattr(time, 'thread_time'):
+            raise ValueError('cpu_time requires time.thread_time '
+                             '(Python >= 3.7)')
+        if traced_memory and not hasattr(tracemalloc, 'reset_peak'):
+            raise ValueError('traced_memory requires tracemalloc.reset_peak '
+                             '(Python >= 3.9)')
+        self.tags = OrderedDict(tags or {})
+        self.sample = int(sample)
+        self.cpu_time = cpu_time
+        self.traced_memory = traced_memory
+        self.buffer_size = buffer_size
+        self._local = threading.local()
+        self._buffers = []
+        self._lock = threading.Lock()
+
+    def _state(self):
+        state = getattr(self._local, 'state', None)
+        if state is None:
+            buf = deque(maxlen=self.buffer_size)
+            # a lock is only taken once per thread, to register its buffer
+            with self._lock:
+                self._buffers.append((threading.current_thread(), buf))
+            state = self._local.state = {'count': 0, 'buffer': buf,
+                                         'stack': []}
+        return state
+
+    def _start(self):
+        """Start a measurement, or return None if the call is not sampled"""
+        state = self._state()
+        state['count'] += 1
+        if (state['count'] - 1) % self.sample:
+            return None
+        if self.traced_memory:
+            _start_tracing()
+            memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        else:
+            memory = None
+        cpu = time.thread_time() if self.cpu_time else None
+        return (time.time(), time.perf_counter(), cpu, memory)
+
+    def _stop(self, start, tags):
+        wall = time.perf_counter()
+        cpu = time.thread_time() if self.cpu_time else None
+        timestamp, wall_start, cpu_start, memory_start = start
+        row = OrderedDict(tags)
+        row['wall_time'] = wall - wall_start
+        if self.cpu_time:
+            row['cpu_time'] = cpu - cpu_start
+        if self.traced_memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            _stop_tracing()
+            row['traced_memory'] = (peak - memory_start) / 1024**2
+        row['timestamp'] = timestamp
+        self._state()['buffer'].append(row)
+
+    def __call__(self, func):
+        tags = OrderedDict(self.tags)
+        tags.setdefault('function', getattr(func, '__qualname__',
+                                            func.__name__))
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = self._start()
+            if start is None:
+                return func(*args, **kwargs)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._stop(start, tags)
+        return wrapper
+
+    def __enter__(self):
+        self._state()['stack'].append(self._start())
+        return self
+
+    def __exit__(self, *args):
+        start = self._state()['stack'].pop()
+        if start is not None:
+            self._stop(start, self.tags)
+
+    def flush(self):
+        """Collect the records of all threads, and clear the buffers
+
+        Returns
+        -------
+        res : ResultSet
+          one row per sampled call, indexed by the tags, with the same
+          metrics as :class:`Benchmark` and the ``timestamp`` of the call
+        """
+        with self._lock:
+            buffers = list(self._buffers)
+        records = []
+        finished = set()
+        for thread, buf in buffers:
+            alive = thread.is_alive()
+            # records appended concurrently are kept for the next flush
+            for _ in range(len(buf)):
+                records.append(buf.popleft())
+            if not alive:
+                finished.add(id(buf))
+        if finished:
+            with self._lock:
+                self._buffers = [(thread, buf)
+                                 for thread, buf in self._buffers
+                                 if id(buf) not in finished]
+        records.sort(key=lambda row: row['timestamp'])
+        index = OrderedDict()
+        for row in records:
+            for key in row:
+                if key in ('wall_time', 'cpu_time', 'traced_memory',
+                           'timestamp'):
+                    break
+                index[key] = None
+        return ResultSet.from_records(records, index=list(index))
+
+
+def instrument(tags=None, sample=1, cpu_time=False, traced_memory=False,
+               buffer_size=100000):
+    """Instrument production code with neurtu metrics
+
+    The returned object can be used as a function decorator, or as a
+    context manager. Decorated functions are additionally tagged with
+    their ``function`` name. Use :meth:`Instrument.flush` to periodically
+    collect the measurements in a :class:`ResultSet` with the same schema
+    as :class:`Benchmark` results.
+
+    Parameters
+    ----------
+    tags : dict, default=None
+      tags of the measurements
+    sample : int, default=1
+      measure one in ``sample`` calls (per thread)
+    cpu_time : bool, default=False
+      also measure the CPU time of the calling thread (requires
+      Python >= 3.7)
+    traced_memory : bool, default=False
+      also measure the peak memory allocated by Python objects during the
+      call in MB, with :mod:`tracemalloc` (requires Python >= 3.9). If it
+      is not already tracing, tracemalloc is started during measurements
+      only. The peak is process-wide, so measurements of concurrent
+      threads interfere.
+    buffer_size : int, default=100000
+      maximum number of records kept per thread between flushes. The
+      oldest records are discarded first.
+
+    Returns
+    -------
+    instrument : Instrument
+
+    Example
+    -------
+    >>> predict_metrics = instrument(tags={'model': 'linear'}, sample=10)
+    >>> @predict_metrics
+    ... def predict(x):
+    ...     return 2 * x
+    >>> _ = [predict(x) for x in range(100)]
+    >>> with predict_metrics:
+    ...     _ = predict(1)
+    >>> res = predict_metrics.flush()
+    >>> len(res), res.index
+    (11, ['model', 'function'])
+    """
+    return Instrument(tags=tags, sample=sample, cpu_time=cpu_time,
+                      traced_memory=traced_memory, buffer_size=buffer_size)
@@ -0,0 +1,344 @@
+# neurtu, BSD 3 clause license
+# Authors: Roman Yurchak
+"""Environment and hardware metadata of benchmark runs"""
+
+import copy
+import datetime
+import glob
+import os
+import platform
+import socket
+import subprocess
+import sys
+import types
+from collections import OrderedDict
+
+from .delayed import Delayed
+from .grid import Grid
+from .utils import import_or_none
+
+# packages reported when they are imported
+_KNOWN_PACKAGES = ('numpy', 'scipy', 'pandas', 'sklearn', 'numba', 'torch',
+                   'tensorflow', 'jax', 'dask', 'joblib', 'numexpr')
+
+# environment variables controlling the number of threads
+_THREAD_VARIABLES = ('OMP_NUM_THREADS', 'MKL_NUM_THREADS',
+                     'OPENBLAS_NUM_THREADS', 'BLIS_NUM_THREADS',
+                     'VECLIB_MAXIMUM_THREADS', 'NUMEXPR_NUM_THREADS')
+
+# metadata that does not change while the process is running
+_STATIC_METADATA = None
+
+# mapping of top-level packages to the distributions providing them
+_DISTRIBUTIONS = None
+
+# git repositories by directory, and their commit, by top level directory
+_GIT_TOPLEVELS = {}
+_GIT_COMMITS = {}
+
+
+def _cpu_model():
+    try:
+        with open('/proc/cpuinfo') as fh:
+            for line in fh:
+                if line.startswith('model name'):
+                    return line.split(':', 1)[1].strip()
+    except (IOError, OSError):
+        pass
+    return platform.processor() or None
+
+
+def _cpu_caches():
+    """CPU cache sizes by name (e.g. ``L1d``, ``L2``), from sysfs"""
+    caches = OrderedDict()
+    paths = sorted(glob.glob('/sys/devices/system/cpu/cpu0/cache/index*'))
+    for path in paths:
+        try:
+            with open(os.path.join(path, 'level')) as fh:
+                level = fh.read().strip()
+            with open(os.path.join(path, 'type')) as fh:
+                kind = fh.read().strip()
+            with open(os.path.join(path, 'size')) as fh:
+                size = fh.read().strip()
+        except (IOError, OSError):
+            continue
+        suffix = {'Data': 'd', 'Instruction': 'i'}.get(kind, '')
+        caches['L%s%s' % (level, suffix)] = size
+    return caches
+
+
+def _total_memory():
+    """Total physical memory in bytes"""
+    psutil = import_or_none('psutil')
+    if psutil is not None:
+        return psutil.virtual_memory().total
+    try:
+        with open('/proc/meminfo') as fh:
+            for line in fh:
+                if line.startswith('MemTotal:'):
+                    return int(line.split()[1]) * 1024
+    except (IOError, OSError, ValueError):
+        pass
+    return None
+
+
+def _physical_cores():
+    psutil = import_or_none('psutil')
+    if psutil is not None:
+        return psutil.cpu_count(logical=False)
+    return None
+
+
+def _static_metadata():
+    global _STATIC_METADATA
+    if _STATIC_METADATA is not None:
+        return _STATIC_METADATA
+    from . import __version__
+    _STATIC_METADATA = OrderedDict([
+        ('neurtu_version', __version__),
+        ('hostname', socket.gethostname()),
+        ('platform', OrderedDict([
+            ('system', platform.system()),
+            ('kernel', platform.release()),
+            ('machine', platform.machine())])),
+        ('cpu', OrderedDict([
+            ('model', _cpu_model()),
+            ('n_cores', _physical_cores()),
+            ('n_threads', os.cpu_count()),
+            ('caches', _cpu_caches())])),
+        ('memory', _total_memory()),
+        ('python', OrderedDict([
+            ('version', platform.python_version()),
+            ('implementation', platform.python_implementation()),
+            ('build', ' '.join(platform.python_build())),
+            ('compiler', platform.python_compiler()),
+            ('executable', sys.executable)]))])
+    return _STATIC_METADATA
+
+
+def _package_version(name):
+    """Version of the distribution providing a top-level package"""
+    global _DISTRIBUTIONS
+    try:
+        from importlib import metadata
+    except ImportError:  # pragma: no cover
+        metadata = None
+    if metadata is not None:
+        if _DISTRIBUTIONS is None:
+            # only available with Python >= 3.10
+            try:
+                _DISTRIBUTIONS = metadata.packages_distributions()
+            except Exception:
+                _DISTRIBUTIONS = {}
+        # e.g. sklearn is provided by scikit-learn
+        for dist in [name] + list(_DISTRIBUTIONS.get(name, [])):
+            try:
+                return metadata.version(dist)
+            except Exception:
+                pass
+    module = sys.modules.get(name)
+    return getattr(module, '__version__', None)
+
+
+def package_versions(packages=()):
+    """Versions of the given packages, and of the known scientific
+    packages that were imported
+
+    Parameters
+    ----------
+    packages : list of str
+      names of top-level packages
+
+    Returns
+    -------
+    versions : dict
+    """
+    names = list(packages) + [name for name in _KNOWN_PACKAGES
+                              if name in sys.modules]
+    versions = OrderedDict()
+    for name in names:
+        if name in versions or name in ('builtins', '__main__') or \
+                name in sys.builtin_module_names:
+            continue
+        version = _package_version(name)
+        if version is not None:
+            versions[name] = version
+    return versions
+
+
+def threadpools():
+    """BLAS and OpenMP libraries, with their number of threads
+
+    Uses threadpoolctl when installed, otherwise only the BLAS library
+    numpy was built with is reported.
+
+    Returns
+    -------
+    info : dict
+      with the ``libraries`` list, and the thread related ``env`` variables
+    """
+    info = OrderedDict()
+    threadpoolctl = import_or_none('threadpoolctl')
+    libraries = []
+    if threadpoolctl is not None:
+        for lib in threadpoolctl.threadpool_info():
+            libraries.append(OrderedDict(
+                (key, lib.get(key)) for key in ['user_api', 'internal_api',
+                                                'version', 'num_threads']))
+    elif 'numpy' in sys.modules:
+        try:
+            config = sys.modules['numpy'].show_config(mode='dicts')
+            blas = config['Build Dependencies']['blas']
+            libraries.append(OrderedDict([('user_api', 'blas'),
+                                          ('internal_api', blas.get('name')),
+                                          ('version', blas.get('version')),
+                                          ('num_threads', None)]))
+        except (TypeError, KeyError, AttributeError):
+            pass
+    info['libraries'] = libraries
+    info['env'] = OrderedDict((key, os.environ[key])
+                              for key in _THREAD_VARIABLES
+                              if key in os.environ)
+    return info
+
+
+def _git_toplevel(path):
+    """Top level directory of the git repository containing ``path``, or
+    None (cached)"""
+    if path not in _GIT_TOPLEVELS:
+        try:
+            root = subprocess.check_output(
+                ['git', 'rev-parse', '--show-toplevel'], cwd=path,
+                stderr=subprocess.DEVNULL).decode('utf-8').strip()
+            root = os.path.realpath(root)
+        except (OSError, subprocess.CalledProcessError):
+            root = None
+        _GIT_TOPLEVELS[path] = root
+    return _GIT_TOPLEVELS[path]
+
+
+def git_commit(path=None, toplevel=False):
+    """Git commit of a directory
+
+    The commit of each repository is only looked up once per process, as
+    ``git status`` can take seconds on large repositories.
+
+    Parameters
+    ----------
+    path : str, default=None
+      directory in a git repository. By default, the current directory.
+    toplevel : bool, default=False
+      only report the commit if ``path`` is the top level directory of the
+      repository (or its ``src`` directory), e.g. to ignore the repository
+      enclosing a ``site-packages`` directory.
+
+    Returns
+    -------
+    commit : dict or None
+      the ``sha`` of the commit and whether the working tree is ``dirty``,
+      or None if ``path`` is not in a git repository.
+    """
+    path = os.path.realpath(path or os.getcwd())
+    root = _git_toplevel(path)
+    if root is None:
+        return None
+    if toplevel and path not in (root, os.path.join(root, 'src')):
+        return None
+    if root not in _GIT_COMMITS:
+        try:
+            sha = subprocess.check_output(
+                ['git', 'rev-parse', 'HEAD'], cwd=root,
+                stderr=subprocess.DEVNULL).decode('utf-8').strip()
+            status = subprocess.check_output(
+                ['git', 'status', '--porcelain', '--untracked-files=no'],
+                cwd=root, stderr=subprocess.DEVNULL)
+            commit = OrderedDict([('sha', sha),
+                                  ('dirty', bool(status.strip()))])
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        _GIT_COMMITS[root] = commit
+    commit = _GIT_COMMITS[root]
+    return OrderedDict(commit) if commit is not None else None
+
+
+def _code_under_test(cases):
+    """Top-level packages of the objects wrapped by the benchmark cases,
+    and the directory from which the first of them is imported (used to find
+    the git commit)
+
+    Parameters
+    ----------
+    cases : {list of Delayed, Grid}
+
+    Returns
+    -------
+    packages : list of str
+    path : str or None
+    """
+    if isinstance(cases, Grid):
+        roots = [cases.func]
+    else:
+        seen = set()
+        roots = []
+        for obj in cases:
+            root = obj._get_root_obj() if isinstance(obj, Delayed) else obj
+            if id(root) not in seen:
+                seen.add(id(root))
+                roots.append(root)
+    packages, path = [], None
+    for root in roots:
+        if isinstance(root, types.ModuleType):
+            module = root.__name__
+        else:
+            module = getattr(root, '__module__', None)
+        if not isinstance(module, str):
+            module = type(root).__module__
+        name = module.split('.')[0]
+        if name in packages:
+            continue
+        packages.append(name)
+        filename = getattr(sys.modules.get(module), '__file__', None)
+        if path is None and filename is not None:
+            # directory from which the top-level package is imported
+            path = os.path.dirname(os.path.abspath(filename))
+            n_levels = len(module.split('.'))
+            if os.path.basename(filename) != '__init__.py' or \
+                    module == '__main__':
+                n_levels -= 1
+            for _ in range(n_levels):
+                path = os.path.dirname(path)
+    return packages, path
+
+
+def collect_metadata(packages=(), path=None):
+    """Collect the environment and hardware metadata of a benchmark run
+
+    Parameters
+    ----------
+    packages : list of str, default=()
+      names of the packages under test, reported in addition to the
+      known scientific packages that were imported
+    path : str, default=None
+      directory from which the code under test is imported, used to find
+      its git commit if it is the top level of a repository (see
+      :func:`git_commit`). By default, the current directory.
+
+    Returns
+    -------
+    metadata : dict
+      with the ``neurtu_version``, the ``timestamp`` (UTC), the
+      ``hostname``, ``platform`` (system, kernel), ``cpu`` (model, number
+      of cores, cache sizes), ``memory`` (in bytes), ``python`` build,
+      ``packages`` versions, ``threadpools`` (BLAS, OpenMP) and ``git``
+      commit (None if ``path`` is not the top level of a repository).
+    """
+    metadata = copy.deepcopy(_static_metadata())
+    metadata['timestamp'] = datetime.datetime.now(
+        datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+    metadata['packages'] = package_versions(packages)
+    metadata['threadpools'] = threadpools()
+    if path is not None:
+        metadata['git'] = git_commit(path, toplevel=True)
+    else:
+        metadata['git'] = git_commit()
+    return metadata
@@ -8,6 +8,10 @@ import itertools
 import time
 import timeit as cpython_timeit
 import gc
+import threading
+from collections import OrderedDict
+
+from .utils import import_or_none
 
 
 # Timer class copied from ipython
@@ -18,6 +22,10 @@ class Timer(cpython_timeit.Timer):
     which is an undocumented implementation detail of CPython,
     not shared by PyPy.
     """
+    def __init__(self, *args, **kwargs):
+        self.disable_gc = kwargs.pop('disable_gc', True)
+        super(Timer, self).__init__(*args, **kwargs)
+
     # Timer.timeit copied from CPython 3.4.2
     def timeit(self, number=cpython_timeit.default_number):
         """Time 'number' executions of the main statement.
@@ -30,7 +38,8 @@ class Timer(cpython_timeit.Timer):
         """
         it = itertools.repeat(None, number)
         gcold = gc.isenabled()
-        gc.disable()
+        if self.disable_gc:
+            gc.disable()
         try:
             timing = self.inner(it, self.timer)
         finally:
@@ -39,13 +48,13 @@ class Timer(cpython_timeit.Timer):
         return timing
 
 
-def measure_wall_time(obj, number=1):
+def measure_wall_time(obj, number=1, disable_gc=True):
     if sys.version_info >= (3, 7):
         sys_timer = time.perf_counter_ns
     else:
         sys_timer = cpython_timeit.default_timer
 
-    timer = Timer(obj.compute, timer=sys_timer)
+    timer = Timer(obj.compute, timer=sys_timer, disable_gc=disable_gc)
     dt = timer.timeit(number)
 
     if sys.version_info >= (3, 7):
@@ -53,22 +62,443 @@ def measure_wall_time(obj, number=1):
     return dt / number
 
 
-def measure_cpu_time(obj, number=1):
+def _descendants_user_time():
+    """User CPU time of the live descendant processes, including their own
+    terminated children"""
+    import psutil
+    total = 0.0
+    for child in psutil.Process().children(recursive=True):
+        try:
+            times = child.cpu_times()
+        except psutil.Error:
+            # the process terminated in the meantime
+            continue
+        total += times.user + times.children_user
+    return total
+
+
+class _ProcessTreeTimer(object):
+    """User CPU time of the process tree
+
+    The CPU time of descendants that exit without being waited for by this
+    process (zombies, or orphans re-parented to init) is no longer reported
+    by either ``RUSAGE_CHILDREN`` or the live processes. The timer is
+    therefore made monotonic, so that the measured time never decreases.
+    """
+    def __init__(self):
+        import resource
+        self._resource = resource
+        self._last = 0.0
+
+    def __call__(self):
+        resource = self._resource
+        current = (resource.getrusage(resource.RUSAGE_SELF).ru_utime +
+                   resource.getrusage(resource.RUSAGE_CHILDREN).ru_utime +
+                   _descendants_user_time())
+        self._last = max(self._last, current)
+        return self._last
+
+
+def measure_cpu_time(obj, number=1, disable_gc=True, include_children=False):
+    """Measure the user CPU time
+
+    Parameters
+    ----------
+    obj : Delayed
+      delayed object to evaluate
+    number : int, default=1
+      number of evaluations
+    disable_gc : bool, default=True
+      disable the garbage collector during the measurement
+    include_children : bool, default=False
+      include the CPU time of child processes, both the ones that
+      terminated during the evaluation (``RUSAGE_CHILDREN``) and the
+      live ones (e.g. persistent worker pools of joblib or
+      multiprocessing). Only the CPU time spent during the evaluation is
+      accounted for. The CPU time of descendants that are not waited for
+      by their parent can be lost, but the measured time is never
+      negative.
+    """
     try:
         import resource
 
-        def timer():
-            return resource.getrusage(resource.RUSAGE_SELF).ru_utime
+        if include_children:
+            timer = _ProcessTreeTimer()
+        else:
+            def timer():
+                return resource.getrusage(resource.RUSAGE_SELF).ru_utime
     except ImportError:  # pragma: no cover
         raise ValueError('CPU timer is not available on Windows.')
-    timer = Timer(obj.compute, timer=timer)
+    timer = Timer(obj.compute, timer=timer, disable_gc=disable_gc)
     dt = timer.timeit(number)
     return dt / number
 
 
-def measure_peak_memory(obj, **kwargs):
+class _GCTracker(object):
+    """Record garbage collections through ``gc.callbacks``"""
+    def __init__(self):
+        self.collections = [0, 0, 0]
+        self.total_time = 0.0
+        self._t0 = None
+
+    def __call__(self, phase, info):
+        if phase == 'start':
+            self._t0 = cpython_timeit.default_timer()
+        elif self._t0 is not None:
+            self.total_time += cpython_timeit.default_timer() - self._t0
+            self.collections[info['generation']] += 1
+            self._t0 = None
+
+
+def measure_gc_time(obj, number=1):
+    """Measure the time spent in garbage collection
+
+    The garbage collector is enabled during the measurement.
+
+    Parameters
+    ----------
+    obj : Delayed
+      delayed object to evaluate
+    number : int, default=1
+      number of evaluations
+
+    Returns
+    -------
+    res : dict
+      the ``gc_time`` pause time in s, and the ``gc_collections_0``,
+      ``gc_collections_1``, ``gc_collections_2`` number of collections per
+      generation, averaged over evaluations.
+    """
+    tracker = _GCTracker()
+    gcold = gc.isenabled()
+    gc.enable()
+    gc.callbacks.append(tracker)
+    try:
+        for _ in range(number):
+            obj.compute()
+    finally:
+        gc.callbacks.remove(tracker)
+        if not gcold:
+            gc.disable()
+    res = {'gc_time': tracker.total_time / number}
+    for generation, count in enumerate(tracker.collections):
+        res['gc_collections_%s' % generation] = count / number
+    return res
+
+
+_PROC_IO_KEYS = ('read_bytes', 'write_bytes', 'syscr', 'syscw')
+_RUSAGE_KEYS = ('minflt', 'majflt', 'nvcsw', 'nivcsw', 'inblock', 'oublock')
+
+
+def _read_proc_io():
+    """Read I/O counters of the current process from ``/proc/self/io``,
+    return None if it is not available."""
+    try:
+        with open('/proc/self/io') as fh:
+            lines = fh.readlines()
+    except (IOError, OSError):
+        return None
+    res = {}
+    for line in lines:
+        key, _, val = line.partition(':')
+        if key in _PROC_IO_KEYS:
+            res[key] = int(val)
+    return res
+
+
+def measure_io(obj):
+    """Measure I/O, page faults and context switches
+
+    Counters from ``/proc/self/io`` (Linux only) and ``getrusage``
+    (Unix only) are diffed around the evaluation.
+
+    Parameters
+    ----------
+    obj : Delayed
+      delayed object to evaluate
+
+    Returns
+    -------
+    res : dict
+      ``read_bytes`` and ``write_bytes`` read from and written to the
+      storage layer, ``syscr`` and ``syscw`` number of read and write
+      system calls, ``minflt`` and ``majflt`` number of minor and major page
+      faults, ``nvcsw`` and ``nivcsw`` number of voluntary and involuntary
+      context switches, ``inblock`` and ``oublock`` number of block input
+      and output operations. Unavailable counters are not reported.
+    """
+    try:
+        import resource
+    except ImportError:  # pragma: no cover
+        raise ValueError('I/O counters are not available on Windows.')
+
+    io_0 = _read_proc_io()
+    usage_0 = resource.getrusage(resource.RUSAGE_SELF)
+    obj.compute()
+    usage_1 = resource.getrusage(resource.RUSAGE_SELF)
+    io_1 = _read_proc_io()
+
+    res = {}
+    if io_0 is not None and io_1 is not None:
+        for key in _PROC_IO_KEYS:
+            res[key] = io_1[key] - io_0[key]
+    for key in _RUSAGE_KEYS:
+        res[key] = getattr(usage_1, 'ru_' + key) - getattr(usage_0,
+                                                           'ru_' + key)
+    return res
+
+
+def _process_tree_memory(process):
+    """Memory usage (in MB) of a process and of each of its descendants,
+    by pid"""
+    import psutil
+    usage = OrderedDict()
+    for proc in [process] + process.children(recursive=True):
+        try:
+            usage[proc.pid] = proc.memory_info().rss / 2**20
+        except psutil.Error:
+            # the process terminated in the meantime
+            continue
+    return usage
+
+
+def _measure_process_tree_peak_memory(obj, interval=0.1):
+    """Peak memory usage of the process tree, and the largest and summed
+    peak memory usage of the child processes
+
+    The memory of the processes is sampled with psutil in a background
+    thread. The usage of the processes that existed before the evaluation
+    (e.g. persistent worker pools) is relative to their initial usage.
+    """
+    import psutil
+    process = psutil.Process()
+    initial = _process_tree_memory(process)
+    peaks = OrderedDict()
+    total_peak = [0.0]
+
+    def record():
+        total = 0.0
+        for pid, mem in _process_tree_memory(process).items():
+            mem -= initial.get(pid, 0.0)
+            total += mem
+            peaks[pid] = max(peaks.get(pid, mem), mem)
+        total_peak[0] = max(total_peak[0], total)
+
+    stop = threading.Event()
+
+    def sample():
+        while not stop.wait(interval):
+            record()
+
+    thread = threading.Thread(target=sample)
+    thread.daemon = True
+    thread.start()
+    try:
+        obj.compute()
+    finally:
+        stop.set()
+        thread.join()
+    record()
+
+    children = [val for pid, val in peaks.items() if pid != process.pid]
+    return OrderedDict([
+        ('peak_memory', total_peak[0]),
+        ('peak_memory_child_max', max(children) if children else 0.0),
+        ('peak_memory_child_sum', sum(children))])
+
+
+def measure_peak_memory(obj, include_children=False, **kwargs):
+    """Measure the peak memory usage
+
+    Parameters
+    ----------
+    obj : Delayed
+      delayed object to evaluate
+    include_children : bool, default=False
+      account for the memory of the child processes. The ``peak_memory``
+      is then the peak of the summed memory usage of the process tree.
+      The peak memory of the child processes is also reported: the
+      largest one in ``peak_memory_child_max``, and their sum in
+      ``peak_memory_child_sum``. Memory is sampled with psutil, and
+      ``interval`` is the only supported parameter.
+    **kwargs : dict
+      passed to ``memory_profiler.memory_usage``
+
+    Returns
+    -------
+    res : {float, dict}
+      the peak memory usage in MB, relative to the initial memory usage.
+      A dictionary when ``include_children=True``.
+    """
+    if include_children:
+        unsupported = sorted(key for key in kwargs if key != 'interval')
+        if unsupported:
+            raise ValueError('Parameters %s of measure_peak_memory are not '
+                             'supported with include_children=True'
+                             % ', '.join(unsupported))
+        return _measure_process_tree_peak_memory(obj, **kwargs)
     from memory_profiler import memory_usage as _memory_usage_profiler
     usage = _memory_usage_profiler((obj.compute, (), {}), **kwargs)
     # subtract the initial memory usage of the process
     usage = [el - usage[0] for el in usage]
     return max(usage)
+
+
+class MemoryTimeline(object):
+    """Memory usage timeline of a single evaluation
+
+    Parameters
+    ----------
+    samples : array of shape (n_samples, 2)
+      time (in s, relative to the start of the measurement) and memory usage
+      (in MB, relative to the initial memory usage) for each sample. A
+      ``numpy.ndarray`` if numpy is installed, a list of tuples otherwise.
+    """
+    def __init__(self, samples):
+        self.samples = samples
+
+    def __len__(self):
+        return len(self.samples)
+
+    def __repr__(self):
+        return ('<MemoryTimeline(n_samples=%s, peak=%.3f MB, '
+                'time_to_peak=%.3f s)>'
+                % (len(self), self.peak, self.time_to_peak))
+
+    def _is_array(self):
+        return hasattr(self.samples, 'ndim')
+
+    @property
+    def times(self):
+        """Sample times in s (a ``numpy.ndarray`` if the samples are)"""
+        if self._is_array():
+            return self.samples[:, 0]
+        return [el[0] for el in self.samples]
+
+    @property
+    def usage(self):
+        """Memory usage in MB (a ``numpy.ndarray`` if the samples are)"""
+        if self._is_array():
+            return self.samples[:, 1]
+        return [el[1] for el in self.samples]
+
+    @property
+    def peak(self):
+        """Peak memory usage in MB"""
+        return float(max(self.usage))
+
+    @property
+    def time_to_peak(self):
+        """Time elapsed until the peak memory usage is reached, in s"""
+        usage = self.usage
+        if self._is_array():
+            return float(self.times[usage.argmax()])
+        return self.times[usage.index(max(usage))]
+
+    @property
+    def final(self):
+        """Memory retained at the end of the evaluation, in MB"""
+        return float(self.usage[-1])
+
+    @property
+    def duration(self):
+        """Total duration of the timeline, in s"""
+        return float(self.times[-1])
+
+    @property
+    def area(self):
+        """Area under the memory usage curve, in MB.s"""
+        times, usage = self.times, self.usage
+        if self._is_array():
+            return float(((times[1:] - times[:-1]) *
+                          (usage[1:] + usage[:-1]) / 2).sum())
+        return sum((times[idx + 1] - times[idx]) *
+                   (usage[idx + 1] + usage[idx]) / 2
+                   for idx in range(len(times) - 1))
+
+    def summary(self):
+        """Summary features of the timeline
+
+        Returns
+        -------
+        res : dict
+          a dictionary with the ``peak``, ``time_to_peak``, ``area``,
+          ``final`` and ``duration`` keys.
+        """
+        return {'peak': self.peak, 'time_to_peak': self.time_to_peak,
+                'area': self.area, 'final': self.final,
+                'duration': self.duration}
+
+    def plot(self, ax=None, **kwargs):
+        """Plot the memory usage timeline (requires matplotlib)
+
+        Parameters
+        ----------
+        ax : matplotlib.axes.Axes, default=None
+          axes to plot on. By default, use the current axes.
+        **kwargs : dict
+          passed to ``ax.plot``
+
+        Returns
+        -------
+        ax : matplotlib.axes.Axes
+        """
+        if ax is None:
+            import matplotlib.pyplot as plt
+            ax = plt.gca()
+        ax.plot(self.times, self.usage, **kwargs)
+        ax.set_xlabel('Time (s)')
+        ax.set_ylabel('Memory usage (MB)')
+        return ax
+
+
+def _downsample_timeline(samples, max_samples):
+    """Downsample a memory timeline by keeping the maximum memory usage
+    within consecutive bins, so that the peak is always preserved."""
+    if max_samples is None or len(samples) <= max_samples:
+        return samples
+    # one sample is reserved for the last one
+    n_bins = max_samples - 1
+    bin_size = -(-len(samples) // n_bins)
+    res = []
+    for idx in range(0, len(samples), bin_size):
+        bin_ = samples[idx:idx + bin_size]
+        res.append(max(bin_, key=lambda el: el[1]))
+    # always keep the last sample for the retained memory
+    if res[-1] is not samples[-1]:
+        res.append(samples[-1])
+    return res
+
+
+def measure_memory_timeline(obj, max_samples=1000, **kwargs):
+    """Measure the memory usage over time
+
+    Parameters
+    ----------
+    obj : Delayed
+      delayed object to evaluate
+    max_samples : {int, None}, default=1000
+      maximum number of samples to keep, at least 2. Longer timelines are
+      downsampled preserving the peak memory usage and the last sample.
+    **kwargs : dict
+      passed to ``memory_profiler.memory_usage``
+
+    Returns
+    -------
+    res : MemoryTimeline
+      the memory usage timeline
+    """
+    if max_samples is not None and max_samples < 2:
+        raise ValueError('max_samples=%s should be at least 2, to keep the '
+                         'peak and the last sample' % max_samples)
+    from memory_profiler import memory_usage as _memory_usage_profiler
+    usage = _memory_usage_profiler((obj.compute, (), {}), timestamps=True,
+                                   **kwargs)
+    mem0, t0 = usage[0]
+    samples = [(ts - t0, mem - mem0) for mem, ts in usage]
+    samples = _downsample_timeline(samples, max_samples)
+
+    np = import_or_none('numpy')
+    if np is not None:
+        samples = np.array(samples, dtype='float64')
+    return MemoryTimeline(samples)
@@ -0,0 +1,503 @@
+# neurtu, BSD 3 clause license
+# Authors: Roman Yurchak
+
+from __future__ import division
+
+import math
+import numbers
+from array import array
+from collections import OrderedDict
+
+from . import stats
+from .utils import import_or_none
+
+
+def _is_number(val):
+    return (isinstance(val, numbers.Real) and not isinstance(val, bool))
+
+
+def _to_column(values):
+    """Store a column of integers as a contiguous int64 array, of other
+    numeric values as a float64 array, and any other column as a list"""
+    if isinstance(values, array) and values.typecode in 'dq':
+        return values
+    values = list(values)
+    if values and all(_is_number(val) and isinstance(val, numbers.Integral)
+                      for val in values):
+        try:
+            return array('q', values)
+        except OverflowError:
+            pass
+    if values and all(_is_number(val) or val is None for val in values):
+        return array('d', [float('nan') if val is None else val
+                           for val in values])
+    return values
+
+
+def _dropna(values):
+    return [val for val in values if val is not None and
+            not (isinstance(val, float) and math.isnan(val))]
+
+
+def _agg_count(values):
+    return len(_dropna(values))
+
+
+def _agg_sum(values):
+    return math.fsum(_dropna(values))
+
+
+def _agg_mean(values):
+    values = _dropna(values)
+    if not values:
+        return float('nan')
+    return math.fsum(values) / len(values)
+
+
+def _agg_var(values):
+    values = _dropna(values)
+    if len(values) < 2:
+        return float('nan')
+    mean = math.fsum(values) / len(values)
+    return math.fsum((val - mean)**2 for val in values) / (len(values) - 1)
+
+
+def _agg_std(values):
+    return math.sqrt(_agg_var(values))
+
+
+def _agg_min(values):
+    values = _dropna(values)
+    return min(values) if values else float('nan')
+
+
+def _agg_max(values):
+    values = _dropna(values)
+    return max(values) if values else float('nan')
+
+
+def _percentile(values, q):
+    """Percentile with linear interpolation (same as numpy's default)"""
+    values = sorted(_dropna(values))
+    if not values:
+        return float('nan')
+    pos = (len(values) - 1) * q / 100
+    low = int(math.floor(pos))
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (pos - low)
+
+
+def _agg_median(values):
+    return _percentile(values, 50)
+
+
+_AGGREGATIONS = {
+    'count': _agg_count,
+    'sum': _agg_sum,
+    'mean': _agg_mean,
+    'median': _agg_median,
+    'var': _agg_var,
+    'std': _agg_std,
+    'min': _agg_min,
+    'max': _agg_max,
+    # robust statistics, require numpy
+    'mad': stats.mad,
+    'trimmed_mean': stats.trimmed_mean,
+    'n_outliers': stats.n_outliers,
+    'ci_low': stats.ci_low,
+    'ci_high': stats.ci_high,
+}
+
+# named collections of aggregation methods
+_AGGREGATION_PRESETS = {
+    'robust': ('median', 'mad', 'ci_low', 'ci_high', 'n_outliers'),
+}
+
+
+def _get_aggregation(method):
+    """Return the (name, func) of an aggregation method.
+
+    Supported methods are the keys of ``_AGGREGATIONS``, percentiles written
+    as ``'p95'``, or any callable taking a list of values."""
+    if callable(method):
+        return method.__name__, method
+    if method in _AGGREGATIONS:
+        return method, _AGGREGATIONS[method]
+    if (isinstance(method, str) and method.startswith('p') and
+            method[1:].replace('.', '', 1).isdigit()):
+        q = float(method[1:])
+
+        def func(values):
+            return _percentile(values, q)
+        return method, func
+    raise ValueError(('aggregate=%s is not a supported aggregation method. '
+                      'Supported methods are %s, percentiles (e.g. "p95") '
+                      'or callables.') % (method, sorted(_AGGREGATIONS)))
+
+
+class ResultSet(object):
+    """Columnar container of benchmark results
+
+    Numeric columns are stored as contiguous int64 or float64 arrays
+    (``array.array``) that can be converted without copy to numpy, pandas
+    or pyarrow, other columns are stored as lists.
+
+    Iterating over a ``ResultSet`` yields rows as dictionaries, indexing it
+    with an integer returns a row and indexing it with a column name returns
+    the column.
+
+    Parameters
+    ----------
+    columns : dict
+      a mapping of column names to sequences of values of the same length
+    index : list of str, default=()
+      names of the columns identifying the benchmark cases (tags, environment
+      variables and ``runid``). The remaining columns are metrics.
+    metadata : dict, default=None
+      optional metadata associated with the results
+    """
+    def __init__(self, columns, index=(), metadata=None):
+        self.index = list(index)
+        # index columns (e.g. tags) keep their original types
+        self._columns = OrderedDict(
+                (key, list(val) if key in self.index else _to_column(val))
+                for key, val in columns.items())
+        lengths = set(len(val) for val in self._columns.values())
+        if len(lengths) > 1:
+            raise ValueError('All columns must have the same length, got %s'
+                             % sorted(lengths))
+        self._length = lengths.pop() if lengths else 0
+        for key in self.index:
+            if key not in self._columns:
+                raise ValueError('Index column %s not found in %s'
+                                 % (key, list(self._columns)))
+        self.metadata = metadata if metadata is not None else {}
+
+    @classmethod
+    def from_records(cls, records, index=(), metadata=None):
+        """Create a ``ResultSet`` from a list of dictionaries
+
+        Parameters
+        ----------
+        records : iterable of dict
+          rows of results. Missing values are filled with ``None``.
+        index : list of str, default=()
+          names of the columns identifying the benchmark cases
+        metadata : dict, default=None
+          optional metadata associated with the results
+
+        Returns
+        -------
+        res : ResultSet
+        """
+        # records are accumulated in columns in a single pass, so that they
+        # can be consumed from a generator
+        columns = OrderedDict()
+        n_rows = 0
+        for row in records:
+            for key, val in row.items():
+                col = columns.get(key)
+                if col is None:
+                    col = columns[key] = [None] * n_rows
+                col.append(val)
+            n_rows += 1
+            for col in columns.values():
+                if len(col) < n_rows:
+                    col.append(None)
+        return cls(columns, index=index, metadata=metadata)
+
+    @property
+    def columns(self):
+        """List of column names"""
+        return list(self._columns)
+
+    @property
+    def metrics(self):
+        """List of metric (non index) column names"""
+        return [key for key in self._columns if key not in self.index]
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        for idx in range(self._length):
+            yield self._row(idx)
+
+    def __contains__(self, key):
+        return key in self._columns
+
+    def __getitem__(self, key):
+        if isinstance(key, numbers.Integral):
+            if key < 0:
+                key += self._length
+            if not 0 <= key < self._length:
+                raise IndexError('row index out of range')
+            return self._row(key)
+        return self._columns[key]
+
+    def __eq__(self, other):
+        if not isinstance(other, ResultSet):
+            return NotImplemented
+        return (self.index == other.index and
+                self.to_records() == other.to_records())
+
+    def _row(self, idx):
+        return OrderedDict((key, val[idx])
+                           for key, val in self._columns.items())
+
+    def __repr__(self):
+        max_rows = 20
+        columns = [str(key) if not isinstance(key, tuple) else
+                   '.'.join(str(el) for el in key) for key in self._columns]
+
+        def _fmt(val):
+            if isinstance(val, float):
+                return '%.6g' % val
+            return str(val)
+        rows = [[_fmt(val[idx]) for val in self._columns.values()]
+                for idx in range(min(self._length, max_rows))]
+        widths = [max([len(key)] + [len(row[idx]) for row in rows])
+                  for idx, key in enumerate(columns)]
+        lines = ['  '.join(key.rjust(width)
+                           for key, width in zip(columns, widths))]
+        for row in rows:
+            lines.append('  '.join(val.rjust(width)
+                                   for val, width in zip(row, widths)))
+        if self._length > max_rows:
+            lines.append('...')
+        lines.append('[ResultSet: %s rows x %s columns]'
+                     % (self._length, len(columns)))
+        return '\n'.join(lines)
+
+    def to_records(self):
+        """Convert to a list of dictionaries"""
+        return [dict(row) for row in self]
+
+    def _take(self, indices):
+        columns = OrderedDict()
+        for key, val in self._columns.items():
+            if isinstance(val, array):
+                columns[key] = array(val.typecode,
+                                     [val[idx] for idx in indices])
+            else:
+                columns[key] = [val[idx] for idx in indices]
+        return ResultSet(columns, index=self.index, metadata=self.metadata)
+
+    def filter(self, func=None, **tags):
+        """Select a subset of rows
+
+        Parameters
+        ----------
+        func : callable, default=None
+          a function taking a row (as a dictionary) and returning a boolean
+        **tags : dict
+          keep rows where the given columns are equal to the given values
+
+        Returns
+        -------
+        res : ResultSet
+
+        Example
+        -------
+        >>> res = ResultSet({'N': [1, 2, 3], 'wall_time': [0.1, 0.2, 0.3]},
+        ...                 index=['N'])
+        >>> len(res.filter(lambda row: row['N'] > 1))
+        2
+        >>> res.filter(N=3)['wall_time'][0]
+        0.3
+        """
+        for key in tags:
+            if key not in self._columns:
+                raise ValueError('Column %s not found in %s'
+                                 % (key, self.columns))
+        indices = []
+        for idx in range(self._length):
+            if any(self._columns[key][idx] != val
+                   for key, val in tags.items()):
+                continue
+            if func is not None and not func(self._row(idx)):
+                continue
+            indices.append(idx)
+        return self._take(indices)
+
+    def groupby(self, by):
+        """Group rows by the values of some columns
+
+        Parameters
+        ----------
+        by : {str, list of str}
+          column names to group by
+
+        Returns
+        -------
+        groups : GroupBy
+        """
+        return GroupBy(self, by)
+
+    def agg(self, methods):
+        """Aggregate all rows
+
+        Parameters
+        ----------
+        methods : {str, callable, list}
+          aggregation method(s), see :meth:`GroupBy.agg`
+
+        Returns
+        -------
+        res : ResultSet
+          a result set with a single row
+        """
+        return GroupBy(self, []).agg(methods)
+
+    def to_numpy(self, column):
+        """Return a column as a numpy array, without copy for numeric
+        columns"""
+        import numpy as np
+        val = self._columns[column]
+        if isinstance(val, array):
+            return np.frombuffer(val, dtype=val.typecode)
+        return np.asarray(val)
+
+    def to_pandas(self):
+        """Convert to a ``pandas.DataFrame``
+
+        Numeric columns are converted without copy. Index columns are set as
+        the DataFrame index and tuple column names (from aggregations) are
+        converted to a ``pandas.MultiIndex``.
+        """
+        import pandas as pd
+        np = import_or_none('numpy')
+
+        data = OrderedDict()
+        for key, val in self._columns.items():
+            if isinstance(val, array) and np is not None:
+                val = np.frombuffer(val, dtype=val.typecode)
+            data[key] = val
+        df = pd.DataFrame(data, copy=False)
+        if self.index:
+            df = df.set_index(self.index)
+        if any(isinstance(key, tuple) for key in df.columns):
+            df.columns = pd.MultiIndex.from_tuples(
+                    [key if isinstance(key, tuple) else (key, '')
+                     for key in df.columns])
+        df.attrs.update(self.metadata)
+        return df
+
+    def to_arrow(self):
+        """Convert to a ``pyarrow.Table``
+
+        Numeric columns are converted without copy. Tuple column names (from
+        aggregations) are joined with a ``'.'``.
+        """
+        import pyarrow as pa
+        np = import_or_none('numpy')
+
+        names, arrays = [], []
+        for key, val in self._columns.items():
+            if isinstance(val, array) and np is not None:
+                val = np.frombuffer(val, dtype=val.typecode)
+            names.append(key if not isinstance(key, tuple) else
+                         '.'.join(str(el) for el in key))
+            arrays.append(pa.array(val))
+        return pa.Table.from_arrays(arrays, names=names)
+
+
+class GroupBy(object):
+    """Rows of a :class:`ResultSet` grouped by the values of some columns
+
+    Parameters
+    ----------
+    resultset : ResultSet
+      the results to group
+    by : {str, list of str}
+      column names to group by
+    """
+    def __init__(self, resultset, by):
+        if isinstance(by, str):
+            by = [by]
+        self.by = list(by)
+        for key in self.by:
+            if key not in resultset:
+                raise ValueError('Column %s not found in %s'
+                                 % (key, resultset.columns))
+        self.resultset = resultset
+        groups = OrderedDict()
+        columns = [resultset[key] for key in self.by]
+        for idx in range(len(resultset)):
+            key = tuple(col[idx] for col in columns)
+            groups.setdefault(key, []).append(idx)
+        self.groups = groups
+
+    def __len__(self):
+        return len(self.groups)
+
+    def __iter__(self):
+        for key, indices in self.groups.items():
+            yield key, self.resultset._take(indices)
+
+    def agg(self, methods):
+        """Aggregate the metrics of each group
+
+        Parameters
+        ----------
+        methods : {str, callable, list}
+          aggregation methods: one of ``'count'``, ``'sum'``, ``'mean'``,
+          ``'median'``, ``'var'``, ``'std'``, ``'min'``, ``'max'``,
+          a percentile written as ``'p95'``, or a callable taking a list of
+          values. Robust statistics from :mod:`neurtu.stats` (requires
+          numpy) are also available: ``'mad'``, ``'trimmed_mean'``,
+          ``'n_outliers'``, and the ``'ci_low'``, ``'ci_high'`` bounds
+          of the bootstrap confidence interval of the median. ``'robust'``
+          is a shortcut for ``['median', 'mad', 'ci_low', 'ci_high',
+          'n_outliers']``. When a list of methods is provided, columns are
+          named ``(metric, method)``, otherwise the metric names are kept.
+
+        Returns
+        -------
+        res : ResultSet
+          aggregated results indexed by the group columns
+        """
+        if isinstance(methods, str) and methods in _AGGREGATION_PRESETS:
+            methods = _AGGREGATION_PRESETS[methods]
+        if isinstance(methods, (str, bytes)) or callable(methods):
+            methods = [_get_aggregation(methods)]
+            flat = True
+        else:
+            methods = [_get_aggregation(method) for method in methods]
+            flat = False
+
+        res = self.resultset
+        metrics = [key for key in res.metrics
+                   if key not in self.by and isinstance(res[key], array)]
+
+        columns = OrderedDict((key, []) for key in self.by)
+        for key in metrics:
+            for name, _ in methods:
+                columns[key if flat else (key, name)] = []
+
+        for group_key, indices in self.groups.items():
+            for key, val in zip(self.by, group_key):
+                columns[key].append(val)
+            for key in metrics:
+                col = res[key]
+                values = [col[idx] for idx in indices]
+                for name, func in methods:
+                    columns[key if flat else (key, name)].append(func(values))
+        return ResultSet(columns, index=self.by, metadata=res.metadata)
+
+    def mean(self):
+        """Mean of each metric per group"""
+        return self.agg('mean')
+
+    def median(self):
+        """Median of each metric per group"""
+        return self.agg('median')
+
+    def std(self):
+        """Standard deviation (with one degree of freedom) of each metric
+        per group"""
+        return self.agg('std')
+
+    def percentile(self, q):
+        """``q``-th percentile of each metric per group"""
+        return self.agg('p%s' % q)
@@ -0,0 +1,117 @@
+# neurtu, BSD 3 clause license
+# Authors: Roman Yurchak
+"""Throughput and roofline metrics from declared work counts"""
+
+from __future__ import division
+
+import timeit as cpython_timeit
+
+# machine peaks, measured once per process and probe parameters
+_MACHINE_PEAKS = {}
+
+
+def _best_time(func, repeat):
+    res = []
+    for _ in range(repeat):
+        t0 = cpython_timeit.default_timer()
+        func()
+        res.append(cpython_timeit.default_timer() - t0)
+    return min(res)
+
+
+def machine_peaks(refresh=False, n_flops=1024, n_bytes=2**26, repeat=5):
+    """Estimate the peak performance of the local machine with numpy
+
+    The peak floating point performance is estimated with a float64 matrix
+    product, and the memory bandwidth by copying an array larger than the
+    CPU caches. Results are measured once for each set of parameters and
+    cached.
+
+    Parameters
+    ----------
+    refresh : bool, default=False
+      run the probe even if results are cached
+    n_flops : int, default=1024
+      size of the square matrices used to estimate the peak FLOP/s
+    n_bytes : int, default=2**26
+      size in bytes of the array used to estimate the memory bandwidth
+    repeat : int, default=5
+      number of measurements, the best one is kept
+
+    Returns
+    -------
+    peaks : dict
+      the ``peak_gflops`` (GFLOP/s) and ``bandwidth_gbs`` (GB/s) values
+    """
+    key = (n_flops, n_bytes, repeat)
+    if key in _MACHINE_PEAKS and not refresh:
+        return _MACHINE_PEAKS[key]
+    import numpy as np
+
+    rng = np.random.RandomState(0)
+    A = rng.rand(n_flops, n_flops)
+    B = rng.rand(n_flops, n_flops)
+    dt = _best_time(lambda: A.dot(B), repeat)
+    peak_gflops = 2 * n_flops**3 / dt / 1e9
+
+    src = np.ones(n_bytes // 8)
+    dst = np.empty_like(src)
+    dt = _best_time(lambda: np.copyto(dst, src), repeat)
+    # one read and one write per element
+    bandwidth_gbs = 2 * src.nbytes / dt / 1e9
+
+    _MACHINE_PEAKS[key] = {'peak_gflops': peak_gflops,
+                           'bandwidth_gbs': bandwidth_gbs}
+    return _MACHINE_PEAKS[key]
+
+
+def throughput(work, wall_time, peaks=None):
+    """Compute throughputs from work counts
+
+    Parameters
+    ----------
+    work : dict
+      work counts of one evaluation. ``flops``, ``bytes`` and ``items`` are
+      converted to ``gflops`` (GFLOP/s), ``gbytes_per_s`` (GB/s) and
+      ``items_per_s`` columns, any other ``key`` to ``key_per_s``.
+    wall_time : float
+      wall time of one evaluation in s. Throughputs are NaN if it is not
+      positive (e.g. below the timer resolution).
+    peaks : dict, default=None
+      machine peaks as returned by :func:`machine_peaks`. If provided,
+      the fraction of the attainable performance given by the roofline
+      model is returned as ``roofline_fraction``.
+
+    Returns
+    -------
+    res : dict
+      throughput columns
+
+    Example
+    -------
+    >>> throughput({'flops': 4e9, 'bytes': 1e9}, 2.0,
+    ...            peaks={'peak_gflops': 10., 'bandwidth_gbs': 1.})
+    {'gflops': 2.0, 'gbytes_per_s': 0.5, 'roofline_fraction': 0.5}
+    """
+    names = {'flops': 'gflops', 'bytes': 'gbytes_per_s'}
+    if not wall_time > 0:
+        wall_time = float('nan')
+    res = {}
+    for key, count in work.items():
+        if key in names:
+            res[names[key]] = count / wall_time / 1e9
+        else:
+            res['%s_per_s' % key] = count / wall_time
+
+    if peaks is not None and ('flops' in work or 'bytes' in work):
+        if 'flops' in work and work.get('bytes'):
+            intensity = work['flops'] / work['bytes']
+            attainable = min(peaks['peak_gflops'],
+                             peaks['bandwidth_gbs'] * intensity)
+            res['roofline_fraction'] = res['gflops'] / attainable
+        elif 'flops' in work:
+            res['roofline_fraction'] = res['gflops'] / peaks['peak_gflops']
+        else:
+            res['roofline_fraction'] = (res['gbytes_per_s'] /
+                                        peaks['bandwidth_gbs'])
+    return res
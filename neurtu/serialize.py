@@ -0,0 +1,233 @@
+# neurtu, BSD 3 clause license
+# Authors: Roman Yurchak
+"""Versioned serialization of delayed benchmark cases
+
+Cases are saved in ``.nrt`` files, with the following layout:
+
+ - the ``b'NEURTU\\x00'`` magic string,
+ - the format version (uint16) and the header size (uint64), big-endian,
+ - a JSON header, describing the case (import path of the root callable,
+   representation, tags, env), the versions used to save it, and the sizes
+   of the following sections,
+ - a pickle payload (protocol 5) with the arguments of all operations,
+   the tags, env and work counts,
+ - out-of-band buffers of the pickle payload (e.g. the data of numpy
+   arrays), stored one after the other.
+
+The root callable is stored by import path, and must be importable when
+the case is loaded.
+"""
+
+import datetime
+import importlib
+import io
+import json
+import pickle
+import platform
+import struct
+from collections import OrderedDict
+
+from .delayed import Delayed, _is_delayed
+
+FORMAT_VERSION = 1
+
+_MAGIC = b'NEURTU\x00'
+_SIZES = struct.Struct('>HQ')
+
+
+def _resolve(path):
+    """Import an object from a ``'module:qualname'`` path"""
+    module, _, qualname = path.partition(':')
+    obj = importlib.import_module(module)
+    for name in qualname.split('.'):
+        obj = getattr(obj, name)
+    return obj
+
+
+def _import_path(obj):
+    """Import path of an object, or None if it cannot be imported"""
+    module = getattr(obj, '__module__', None)
+    qualname = getattr(obj, '__qualname__', None)
+    if not isinstance(module, str) or not isinstance(qualname, str) or \
+            '<' in qualname:
+        return None
+    path = '%s:%s' % (module, qualname)
+    try:
+        resolved = _resolve(path)
+    except (ImportError, AttributeError):
+        return None
+    return path if resolved is obj else None
+
+
+def _to_json(obj):
+    """Convert an object to JSON compatible types, for display"""
+    return json.loads(json.dumps(obj, default=repr))
+
+
+def dumps(obj):
+    """Serialize a delayed object
+
+    Parameters
+    ----------
+    obj : Delayed
+      the benchmark case
+
+    Returns
+    -------
+    data : bytes
+    """
+    fh = io.BytesIO()
+    dump(obj, fh)
+    return fh.getvalue()
+
+
+def dump(obj, file):
+    """Save a delayed object to a ``.nrt`` file
+
+    Parameters
+    ----------
+    obj : Delayed
+      the benchmark case
+    file : {str, file object}
+      path or binary file object
+    """
+    if not _is_delayed(obj) or not hasattr(obj, '_get_chain'):
+        raise ValueError('obj=%s must be a Delayed object!' % obj)
+    if isinstance(file, str):
+        with open(file, 'wb') as fh:
+            return dump(obj, fh)
+
+    from . import __version__
+
+    chain = obj._get_chain()
+    root = _import_path(chain['obj']) if callable(chain['obj']) else None
+    if root is not None:
+        chain['obj'] = None
+    buffers = []
+    try:
+        payload = pickle.dumps(chain, protocol=5,
+                               buffer_callback=buffers.append)
+    except (pickle.PicklingError, AttributeError, TypeError) as exc:
+        raise ValueError('Failed to serialize %r: %s' % (obj, exc))
+    buffers = [buf.raw() for buf in buffers]
+
+    header = OrderedDict([
+        ('format', 'neurtu-case'),
+        ('version', FORMAT_VERSION),
+        ('neurtu_version', __version__),
+        ('python', platform.python_version()),
+        ('created', datetime.datetime.now(datetime.timezone.utc).strftime(
+            '%Y-%m-%dT%H:%M:%SZ')),
+        ('root', root),
+        ('repr', repr(obj)),
+        ('tags', _to_json(chain['tags'])),
+        ('env', _to_json(chain['env'])),
+        ('payload_size', len(payload)),
+        ('buffer_sizes', [buf.nbytes for buf in buffers])])
+    header = json.dumps(header).encode('utf-8')
+
+    file.write(_MAGIC)
+    file.write(_SIZES.pack(FORMAT_VERSION, len(header)))
+    file.write(header)
+    file.write(payload)
+    for buf in buffers:
+        file.write(buf)
+
+
+def _read_header(data):
+    data = memoryview(data)
+    start = len(_MAGIC) + _SIZES.size
+    if bytes(data[:len(_MAGIC)]) != _MAGIC:
+        raise ValueError('Not a neurtu case file!')
+    version, header_size = _SIZES.unpack(data[len(_MAGIC):start])
+    if version > FORMAT_VERSION:
+        raise ValueError(('Case file format version %s is not supported by '
+                          'this version of neurtu (<= %s)')
+                         % (version, FORMAT_VERSION))
+    header = json.loads(bytes(data[start:start + header_size])
+                        .decode('utf-8'))
+    return header, start + header_size
+
+
+def read_header(path):
+    """Read the header of a ``.nrt`` file, describing the saved case
+
+    Parameters
+    ----------
+    path : str
+      path of the file
+
+    Returns
+    -------
+    header : dict
+    """
+    with open(path, 'rb') as fh:
+        data = fh.read(len(_MAGIC) + _SIZES.size)
+        if len(data) == len(_MAGIC) + _SIZES.size:
+            _, header_size = _SIZES.unpack(data[len(_MAGIC):])
+            data += fh.read(header_size)
+    return _read_header(data)[0]
+
+
+def loads(data):
+    """Deserialize a delayed object
+
+    Out-of-band buffers (e.g. numpy arrays) are not copied, and are backed
+    by ``data``, which should be writable (e.g. a ``bytearray``) to allow
+    modifying them.
+
+    Parameters
+    ----------
+    data : bytes-like
+
+    Returns
+    -------
+    obj : Delayed
+    """
+    header, offset = _read_header(data)
+    data = memoryview(data)
+    payload = data[offset:offset + header['payload_size']]
+    offset += header['payload_size']
+    buffers = []
+    for size in header['buffer_sizes']:
+        buffers.append(data[offset:offset + size])
+        offset += size
+    chain = pickle.loads(payload, buffers=buffers)
+    if header['root'] is not None:
+        try:
+            chain['obj'] = _resolve(header['root'])
+        except (ImportError, AttributeError) as exc:
+            raise ValueError('Failed to import %s: %s'
+                             % (header['root'], exc))
+    return Delayed._from_chain(chain)
+
+
+def load(path):
+    """Load a delayed object from a ``.nrt`` file
+
+    Parameters
+    ----------
+    path : str
+      path of the file
+
+    Returns
+    -------
+    obj : Delayed
+
+    Example
+    -------
+    >>> import os, tempfile
+    >>> from neurtu import delayed
+    >>> path = os.path.join(tempfile.mkdtemp(), 'case.nrt')
+    >>> dump(delayed(sorted, tags={'N': 3})([3, 1, 2]), path)
+    >>> obj = load(path)
+    >>> obj
+    <Delayed(built-in function sorted, tags={'N': 3})([3, 1, 2])>
+    >>> obj.compute()
+    [1, 2, 3]
+    >>> read_header(path)['root']
+    'builtins:sorted'
+    """
+    with open(path, 'rb') as fh:
+        data = bytearray(fh.read())
+    return loads(data)
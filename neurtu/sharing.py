@@ -0,0 +1,191 @@
+# neurtu, BSD 3 clause license
+# Authors: Roman Yurchak
+"""Zero-copy sharing of large array inputs with worker processes"""
+
+import io
+import mmap
+import os
+import pickle
+import sys
+
+from .utils import import_or_none
+
+# buffers of the shared memory segments attached in this process, by name
+_ATTACHED = {}
+
+
+def _attach(name):
+    """Attach to an existing shared memory segment without taking its
+    ownership"""
+    if name in _ATTACHED:
+        return _ATTACHED[name][1]
+    from multiprocessing import shared_memory
+
+    if sys.version_info >= (3, 13):
+        shm = shared_memory.SharedMemory(name=name, track=False)
+        _ATTACHED[name] = (shm, shm.buf)
+    elif os.name == 'posix':
+        # SharedMemory would register the segment with the resource tracker,
+        # that could destroy it when this process exits. Map it directly.
+        import _posixshmem
+        fd = _posixshmem.shm_open('/' + name, os.O_RDWR, mode=0o600)
+        try:
+            buf = mmap.mmap(fd, os.fstat(fd).st_size)
+        finally:
+            os.close(fd)
+        _ATTACHED[name] = (None, buf)
+    else:  # pragma: no cover
+        shm = shared_memory.SharedMemory(name=name)
+        _ATTACHED[name] = (shm, shm.buf)
+    return _ATTACHED[name][1]
+
+
+def _rebuild_shared_array(name, offset, shape, strides, dtype):
+    import numpy as np
+    return np.ndarray(shape, dtype=dtype, buffer=_attach(name),
+                      offset=offset, strides=strides)
+
+
+def _rebuild_memmap_array(filename, offset, shape, strides, dtype):
+    import numpy as np
+    # copy-on-write: benchmarked functions may modify their inputs
+    buf = np.memmap(filename, dtype='uint8', mode='c')
+    return np.ndarray(shape, dtype=dtype, buffer=buf, offset=offset,
+                      strides=strides)
+
+
+def _root_array(X, np):
+    """Find the array owning the memory of a (possibly nested) view"""
+    while isinstance(X.base, np.ndarray):
+        X = X.base
+    return X
+
+
+def _data_pointer(X):
+    return X.__array_interface__['data'][0]
+
+
+class _SharedPickler(pickle.Pickler):
+    def __init__(self, file, shared, protocol=None):
+        super(_SharedPickler, self).__init__(file, protocol=protocol)
+        self.shared = shared
+
+    def reducer_override(self, obj):
+        return self.shared.reduce_array(obj)
+
+
+class SharedInputs(object):
+    """Serializer placing large arrays in shared memory
+
+    Numpy arrays larger than ``min_size`` bytes found while pickling an
+    object (e.g. in the args and kwargs of a :class:`Delayed`) are copied
+    once to a ``multiprocessing.shared_memory`` segment and pickled as a
+    reference to it. Views of the same array (e.g. ``X[:N]``) reference the
+    same segment, so that the data is materialized once per node. Arrays
+    backed by a ``numpy.memmap`` are pickled as a reference to the
+    memory-mapped file without any copy.
+
+    Segments are owned by this object and released by :meth:`close`.
+    It can also be used as a context manager.
+
+    Parameters
+    ----------
+    min_size : int, default=1048576
+      minimum size in bytes of the arrays to share
+
+    Example
+    -------
+    >>> import numpy as np
+    >>> X = np.ones((1000, 1000))
+    >>> with SharedInputs() as shared:
+    ...     data = shared.dumps([X[:10], X[10:20]])
+    ...     X_1, X_2 = loads(data)
+    ...     len(shared.segments)
+    1
+    """
+    def __init__(self, min_size=1024**2):
+        if sys.version_info < (3, 8):  # pragma: no cover
+            raise ValueError('Shared inputs require Python 3.8+')
+        self.min_size = min_size
+        # id of the root array -> (root array, SharedMemory)
+        self.segments = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _share(self, root):
+        key = id(root)
+        if key not in self.segments:
+            import numpy as np
+            from multiprocessing import shared_memory
+
+            shm = shared_memory.SharedMemory(create=True,
+                                             size=max(root.nbytes, 1))
+            X = np.ndarray(root.shape, dtype=root.dtype, buffer=shm.buf,
+                           strides=root.strides)
+            X[...] = root
+            del X
+            # keep a reference to the root array so that its id is not reused
+            self.segments[key] = (root, shm)
+            # loading in this process should reuse the owned segment
+            _ATTACHED[shm.name] = (shm, shm.buf)
+        return self.segments[key][1]
+
+    def reduce_array(self, X):
+        """Reduce a numpy array to a shared memory or memory-mapped file
+        reference, or return ``NotImplemented`` to use the default pickling.
+        """
+        np = import_or_none('numpy')
+        if np is None or type(X) not in (np.ndarray, np.memmap):
+            return NotImplemented
+        root = _root_array(X, np)
+        if (root.nbytes < self.min_size or root.dtype.hasobject or
+                not (root.flags.c_contiguous or root.flags.f_contiguous)):
+            return NotImplemented
+        offset = _data_pointer(X) - _data_pointer(root)
+        args = (offset, X.shape, X.strides, X.dtype)
+        if isinstance(root, np.memmap) and root.filename is not None:
+            return (_rebuild_memmap_array,
+                    (root.filename, root.offset + offset) + args[1:])
+        shm = self._share(root)
+        return (_rebuild_shared_array, (shm.name,) + args)
+
+    def dumps(self, obj, protocol=pickle.HIGHEST_PROTOCOL):
+        """Pickle an object, placing large arrays in shared memory
+
+        Parameters
+        ----------
+        obj : object
+          object to serialize
+        protocol : int, default=pickle.HIGHEST_PROTOCOL
+          pickle protocol
+
+        Returns
+        -------
+        data : bytes
+          the serialized object, to be loaded with :func:`loads`
+        """
+        buf = io.BytesIO()
+        _SharedPickler(buf, self, protocol=protocol).dump(obj)
+        return buf.getvalue()
+
+    def close(self):
+        """Release all shared memory segments"""
+        for root, shm in self.segments.values():
+            _ATTACHED.pop(shm.name, None)
+            try:
+                shm.close()
+            except BufferError:
+                # arrays loaded in this process still use the segment, it
+                # will be unmapped once they are garbage collected
+                pass
+            shm.unlink()
+        self.segments = {}
+
+
+def loads(data):
+    """Load an object serialized with :meth:`SharedInputs.dumps`"""
+    return pickle.loads(data)
@@ -0,0 +1,155 @@
+# neurtu, BSD 3 clause license
+# Authors: Roman Yurchak
+"""Robust statistics of repeated measurements (requires numpy)"""
+
+from __future__ import division
+
+from collections import OrderedDict
+
+# bootstrap confidence intervals of the last aggregated groups, as the
+# ci_low and ci_high aggregations of a group are computed separately
+_CI_CACHE = OrderedDict()
+_CI_CACHE_SIZE = 1024
+
+
+def _as_array(values):
+    import numpy as np
+    values = np.asarray(values, dtype='float64')
+    return values[~np.isnan(values)]
+
+
+def median(values):
+    """Median of the samples"""
+    import numpy as np
+    values = _as_array(values)
+    if not len(values):
+        return float('nan')
+    return float(np.median(values))
+
+
+def mad(values):
+    """Median absolute deviation of the samples"""
+    import numpy as np
+    values = _as_array(values)
+    if not len(values):
+        return float('nan')
+    return float(np.median(np.abs(values - np.median(values))))
+
+
+def trimmed_mean(values, proportion=0.1):
+    """Mean of the samples, after removing the ``proportion`` of lowest
+    and highest values
+
+    Example
+    -------
+    >>> trimmed_mean([1, 2, 3, 4, 5, 6, 7, 8, 9, 100], proportion=0.1)
+    5.5
+    """
+    import numpy as np
+    values = np.sort(_as_array(values))
+    if not len(values):
+        return float('nan')
+    n_trim = int(proportion * len(values))
+    if n_trim:
+        values = values[n_trim:-n_trim]
+    return float(values.mean())
+
+
+def iqr_outliers(values, whis=1.5):
+    """Flag outliers with the interquartile range rule
+
+    Parameters
+    ----------
+    values : array-like
+      samples
+    whis : float, default=1.5
+      samples further than ``whis`` times the interquartile range from the
+      first or third quartile are outliers
+
+    Returns
+    -------
+    mask : numpy.ndarray of bool
+      True for outliers
+
+    Example
+    -------
+    >>> iqr_outliers([1.0, 1.1, 0.9, 1.0, 5.0]).tolist()
+    [False, False, False, False, True]
+    """
+    import numpy as np
+    values = np.asarray(values, dtype='float64')
+    q1, q3 = np.nanpercentile(values, [25, 75])
+    iqr = q3 - q1
+    return (values < q1 - whis * iqr) | (values > q3 + whis * iqr)
+
+
+def n_outliers(values):
+    """Number of outliers according to the interquartile range rule"""
+    values = _as_array(values)
+    if not len(values):
+        return 0
+    return int(iqr_outliers(values).sum())
+
+
+def bootstrap_ci(values, statistic='median', confidence=0.95,
+                 n_resamples=1000, random_state=0):
+    """Bootstrap confidence interval of a statistic
+
+    All resamples are drawn at once and the statistic is computed along
+    the last axis.
+
+    Parameters
+    ----------
+    values : array-like
+      samples
+    statistic : {'median', 'mean'}, default='median'
+      statistic to compute the confidence interval for
+    confidence : float, default=0.95
+      confidence level
+    n_resamples : int, default=1000
+      number of bootstrap resamples
+    random_state : int, default=0
+      seed of the random number generator
+
+    Returns
+    -------
+    low, high : float
+      bounds of the confidence interval
+    """
+    import numpy as np
+    values = _as_array(values)
+    if not len(values):
+        return float('nan'), float('nan')
+    if statistic not in ('median', 'mean'):
+        raise ValueError("statistic=%s should be one of 'median', 'mean'"
+                         % statistic)
+    rng = np.random.RandomState(random_state)
+    indices = rng.randint(len(values), size=(n_resamples, len(values)))
+    resamples = getattr(np, statistic)(values[indices], axis=-1)
+    alpha = (1 - confidence) / 2
+    low, high = np.percentile(resamples, [100 * alpha, 100 * (1 - alpha)])
+    return float(low), float(high)
+
+
+def _median_ci(values):
+    """95% bootstrap confidence interval of the median, memoized on the
+    values so that both bounds come from a single bootstrap"""
+    values = _as_array(values)
+    key = values.tobytes()
+    if key in _CI_CACHE:
+        _CI_CACHE.move_to_end(key)
+        return _CI_CACHE[key]
+    res = _CI_CACHE[key] = bootstrap_ci(values, random_state=0)
+    if len(_CI_CACHE) > _CI_CACHE_SIZE:
+        _CI_CACHE.popitem(last=False)
+    return res
+
+
+def ci_low(values):
+    """Lower bound of the 95% bootstrap confidence interval of the median"""
+    return _median_ci(values)[0]
+
+
+def ci_high(values):
+    """Upper bound of the 95% bootstrap confidence interval of the median"""
+    return _median_ci(values)[1]
@@ -0,0 +1,633 @@
+# neurtu, BSD 3 clause license
+# Authors: Roman Yurchak
+"""Append-only, memory-mapped columnar store of benchmark results
+
+A store is a directory with the following files:
+
+ - ``store.json``: the schema (tag and metric names), the number of rows,
+   cases and runs, updated atomically after each append,
+ - ``cases.jsonl``: the dictionary-encoded tag table, with the tags of one
+   case per line,
+ - ``runs.jsonl``: one line per call of :meth:`ResultStore.append`, with
+   its timestamp and metadata (e.g. the git commit, see
+   :mod:`neurtu.metadata`),
+ - ``case.i32`` and ``run.i32``: the case and run of each row (int32),
+ - ``metric_<i>.f64``: one file per metric (float64), with NaN for
+   missing values.
+
+Columns are read through memory maps, so that only the pages of the
+selected rows are loaded. Rows written after the last update of
+``store.json`` (e.g. by an interrupted append) are ignored, and overwritten
+by the next append.
+"""
+
+from __future__ import division
+
+import datetime
+import json
+import math
+import mmap
+import numbers
+import os
+import sys
+from array import array
+from collections import OrderedDict
+
+from .resultset import ResultSet, _to_column
+from .utils import import_or_none
+
+FORMAT_VERSION = 1
+
+# aggregations that can be computed out-of-core, in a single pass
+AGGREGATIONS = ('count', 'sum', 'mean', 'var', 'std', 'min', 'max')
+
+_INT_TYPECODE = 'i'
+
+
+def _json_default(val):
+    # numpy scalars (e.g. from np.logspace or Grid values) are stored as
+    # Python numbers, so that they can be queried with plain values
+    if isinstance(val, numbers.Number) or (
+            getattr(val, 'ndim', None) == 0 and hasattr(val, 'item')):
+        try:
+            return val.item()
+        except (AttributeError, ValueError):
+            pass
+    return repr(val)
+
+
+def _normalize(val):
+    """Value of a tag, as stored in the JSON tag table"""
+    return json.loads(json.dumps(val, default=_json_default))
+
+
+def _column_name(key):
+    if isinstance(key, tuple):
+        return '.'.join(str(el) for el in key)
+    return key
+
+
+class _Column(object):
+    """Read-only memory map of a column file"""
+    def __init__(self, path, typecode, length):
+        self._fh = None
+        self._mmap = None
+        if length:
+            self._fh = open(path, 'rb')
+            self._mmap = mmap.mmap(self._fh.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+            self.data = memoryview(self._mmap).cast(typecode)[:length]
+        else:
+            self.data = memoryview(array(typecode))
+
+    def take(self, selection):
+        """Values at the selected rows, as an ``array``"""
+        res = array(self.data.format)
+        if isinstance(selection, slice):
+            res.frombytes(self.data[selection].cast('B'))
+        elif hasattr(selection, 'dtype'):
+            np = import_or_none('numpy')
+            res.frombytes(np.frombuffer(self.data, dtype=self.data.format)
+                          [selection].tobytes())
+        else:
+            data = self.data
+            res.extend(data[idx] for idx in selection)
+        return res
+
+    def close(self):
+        if self._mmap is None:
+            return
+        try:
+            self.data.release()
+            self._mmap.close()
+        except BufferError:
+            # still referenced (e.g. by a numpy array), closed when
+            # garbage collected
+            pass
+        self._fh.close()
+        self._mmap = None
+
+
+class ResultStore(object):
+    """Append-only, memory-mapped columnar store of benchmark results
+
+    Designed for large numbers of raw samples (e.g. benchmarks with
+    ``aggregate=False`` and a high ``repeat``): metrics are stored as
+    fixed-width float64 columns, and tags are dictionary-encoded, each row
+    only storing the int32 id of its case. See :mod:`neurtu.store` for the
+    file layout.
+
+    Parameters
+    ----------
+    path : str
+      path of the store directory, created if it does not exist
+
+    Example
+    -------
+    >>> import tempfile
+    >>> from neurtu import Benchmark, delayed
+    >>> store = ResultStore(tempfile.mkdtemp())
+    >>> bench = Benchmark(wall_time=True, repeat=10, aggregate=False,
+    ...                   progress_bar=False, metadata=False)
+    >>> store.append(bench(delayed(sorted, tags={'N': N})(range(N))
+    ...                    for N in [10, 100]))
+    0
+    >>> len(store), store.tag_names, store.metrics
+    (20, ['N'], ['wall_time'])
+    >>> len(store.read(N=10))
+    10
+    >>> res = store.aggregate(by='N', methods=['mean', 'count'])
+    >>> list(res['N']), list(res[('wall_time', 'count')])
+    ([10, 100], [10.0, 10.0])
+    """
+    def __init__(self, path):
+        self.path = path
+        if not os.path.exists(path):
+            os.makedirs(path)
+        self._info = OrderedDict([
+            ('format', 'neurtu-store'), ('version', FORMAT_VERSION),
+            ('byteorder', sys.byteorder), ('n_rows', 0), ('n_cases', 0),
+            ('n_runs', 0), ('cases_bytes', 0), ('runs_bytes', 0),
+            ('tags', []), ('metrics', [])])
+        info_path = os.path.join(path, 'store.json')
+        if os.path.exists(info_path):
+            with open(info_path) as fh:
+                info = json.load(fh, object_pairs_hook=OrderedDict)
+            if info.get('format') != 'neurtu-store':
+                raise ValueError('%s is not a neurtu result store!' % path)
+            if info['version'] > FORMAT_VERSION:
+                raise ValueError(('Result store format version %s is not '
+                                  'supported by this version of neurtu '
+                                  '(<= %s)')
+                                 % (info['version'], FORMAT_VERSION))
+            if info['byteorder'] != sys.byteorder:
+                raise ValueError('Result store %s was created on a %s endian '
+                                 'machine!' % (path, info['byteorder']))
+            self._info = info
+        self._cases = self._read_lines('cases.jsonl', self._info['n_cases'])
+        self._runs = self._read_lines('runs.jsonl', self._info['n_runs'])
+        self._case_ids = dict((self._case_key(case), idx)
+                              for idx, case in enumerate(self._cases))
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _read_lines(self, name, n_lines):
+        if not n_lines:
+            return []
+        with open(self._file(name)) as fh:
+            return [json.loads(fh.readline(), object_pairs_hook=OrderedDict)
+                    for _ in range(n_lines)]
+
+    @staticmethod
+    def _case_key(tags):
+        return json.dumps(dict((key, val) for key, val in tags.items()
+                               if val is not None), sort_keys=True)
+
+    def __len__(self):
+        return self._info['n_rows']
+
+    @property
+    def tag_names(self):
+        """Names of the tags identifying the cases"""
+        return list(self._info['tags'])
+
+    @property
+    def metrics(self):
+        """Names of the metric columns"""
+        return list(self._info['metrics'])
+
+    def cases(self):
+        """Tags of the cases, by case id
+
+        Returns
+        -------
+        cases : list of dict
+        """
+        return [OrderedDict((key, case.get(key)) for key in self.tag_names)
+                for case in self._cases]
+
+    def runs(self):
+        """Runs (calls of :meth:`append`), by run id
+
+        Returns
+        -------
+        runs : list of dict
+          with the ``run`` id, ``timestamp`` (UTC), number of ``rows`` and
+          ``metadata`` of the results
+        """
+        return [OrderedDict(run) for run in self._runs]
+
+    def _append_lines(self, name, size_key, lines):
+        """Append JSON lines to a file, dropping uncommitted lines"""
+        path = self._file(name)
+        with open(path, 'ab') as fh:
+            fh.truncate(self._info[size_key])
+            for line in lines:
+                fh.write((json.dumps(line, default=_json_default) + '\n')
+                         .encode('utf-8'))
+            return fh.tell()
+
+    def _append_column(self, name, values, typecode, n_rows):
+        """Append values to a column file, dropping uncommitted rows"""
+        with open(self._file(name), 'ab') as fh:
+            fh.truncate(n_rows * array(typecode).itemsize)
+            if not isinstance(values, array) or values.typecode != typecode:
+                values = array(typecode, values)
+            values.tofile(fh)
+
+    def append(self, res, metadata=None):
+        """Append results to the store, as a new run
+
+        Parameters
+        ----------
+        res : ResultSet
+          benchmark results. Index columns are stored as tags, and numeric
+          columns as metrics. The ``runid`` of repeated measurements and
+          other columns (e.g. error messages) are not stored: rows are
+          kept in order.
+        metadata : dict, default=None
+          metadata of the run. By default, ``res.metadata``.
+
+        Returns
+        -------
+        run : int
+          id of the run
+        """
+        if not isinstance(res, ResultSet):
+            raise ValueError('res=%s should be a ResultSet!' % type(res))
+        tags = [key for key in res.index if key != 'runid']
+        metrics = OrderedDict()
+        for key in res.columns:
+            if key in tags or key == 'runid':
+                continue
+            col = res[key]
+            if not isinstance(col, array):
+                col = _to_column(col)
+            if isinstance(col, array):
+                metrics[_column_name(key)] = col
+        n_rows = self._info['n_rows']
+        n = len(res)
+
+        # dictionary encoding of the tags
+        for key in tags:
+            if key not in self._info['tags']:
+                self._info['tags'].append(key)
+        new_cases = []
+        case_ids = array(_INT_TYPECODE)
+        memo = {}
+        columns = [res[key] for key in tags]
+        for idx in range(n):
+            values = tuple(col[idx] for col in columns)
+            try:
+                case_id = memo.get(values)
+            except TypeError:
+                # unhashable tag values
+                values, case_id = repr(values), memo.get(repr(values))
+            if case_id is None:
+                case = OrderedDict((key, _normalize(val))
+                                   for key, val in zip(tags, values))
+                key = self._case_key(case)
+                case_id = self._case_ids.get(key)
+                if case_id is None:
+                    case_id = self._case_ids[key] = len(self._cases)
+                    self._cases.append(case)
+                    new_cases.append(case)
+                memo[values] = case_id
+            case_ids.append(case_id)
+
+        run = self._info['n_runs']
+        if metadata is None:
+            metadata = res.metadata
+        run_info = OrderedDict([
+            ('run', run),
+            ('timestamp', datetime.datetime.now(datetime.timezone.utc)
+             .strftime('%Y-%m-%dT%H:%M:%SZ')),
+            ('rows', n),
+            ('metadata', _normalize(metadata))])
+
+        for key in metrics:
+            if key not in self._info['metrics']:
+                # missing values of the previous rows
+                self._append_column(
+                    'metric_%d.f64' % len(self._info['metrics']),
+                    array('d', [float('nan')]) * n_rows, 'd', 0)
+                self._info['metrics'].append(key)
+        for idx, key in enumerate(self._info['metrics']):
+            values = metrics.get(key, array('d', [float('nan')]) * n)
+            self._append_column('metric_%d.f64' % idx, values, 'd', n_rows)
+        self._append_column('case.i32', case_ids, _INT_TYPECODE, n_rows)
+        self._append_column('run.i32', array(_INT_TYPECODE, [run]) * n,
+                            _INT_TYPECODE, n_rows)
+        cases_bytes = self._append_lines('cases.jsonl', 'cases_bytes',
+                                         new_cases)
+        runs_bytes = self._append_lines('runs.jsonl', 'runs_bytes',
+                                        [run_info])
+        self._runs.append(run_info)
+
+        # commit the new rows
+        self._info.update([('n_rows', n_rows + n),
+                           ('n_cases', len(self._cases)),
+                           ('n_runs', run + 1),
+                           ('cases_bytes', cases_bytes),
+                           ('runs_bytes', runs_bytes)])
+        tmp_path = self._file('store.json.tmp')
+        with open(tmp_path, 'w') as fh:
+            json.dump(self._info, fh, indent=1)
+        os.replace(tmp_path, self._file('store.json'))
+        return run
+
+    def _open(self, name, typecode='d'):
+        return _Column(self._file(name), typecode, len(self))
+
+    def _selected_cases(self, tags):
+        """Ids of the cases matching the tags, or None for all cases"""
+        if not tags:
+            return None
+        for key in tags:
+            if key not in self._info['tags']:
+                raise ValueError('Tag %s not found in %s'
+                                 % (key, self.tag_names))
+        tags = dict((key, _normalize(val)) for key, val in tags.items())
+        return set(idx for idx, case in enumerate(self._cases)
+                   if all(case.get(key) == val for key, val in tags.items()))
+
+    def _selection(self, case_col, run_col, cases, runs):
+        """Rows of the selected cases and runs, as a slice, a numpy array of
+        indices or a list of indices"""
+        if cases is None and runs is None:
+            return slice(0, len(self))
+        np = import_or_none('numpy')
+        if np is not None:
+            mask = np.ones(len(self), dtype=bool)
+            if cases is not None:
+                mask &= np.isin(np.frombuffer(case_col.data, dtype='int32'),
+                                sorted(cases))
+            if runs is not None:
+                mask &= np.isin(np.frombuffer(run_col.data, dtype='int32'),
+                                sorted(runs))
+            return np.flatnonzero(mask)
+        return [idx for idx in range(len(self))
+                if (cases is None or case_col.data[idx] in cases) and
+                (runs is None or run_col.data[idx] in runs)]
+
+    def _check_metrics(self, metrics):
+        if metrics is None:
+            return self.metrics
+        if isinstance(metrics, str):
+            metrics = [metrics]
+        for key in metrics:
+            if key not in self._info['metrics']:
+                raise ValueError('Metric %s not found in %s'
+                                 % (key, self.metrics))
+        return list(metrics)
+
+    def read(self, metrics=None, runs=None, **tags):
+        """Read the rows of a subset of cases
+
+        Parameters
+        ----------
+        metrics : list of str, default=None
+          metrics to read. By default, all metrics.
+        runs : list of int, default=None
+          ids of the runs to read. By default, all runs.
+        **tags : dict
+          only read the cases where the given tags are equal to the given
+          values
+
+        Returns
+        -------
+        res : ResultSet
+          indexed by the tags and the ``run`` id
+        """
+        metrics = self._check_metrics(metrics)
+        cases = self._selected_cases(tags)
+        if runs is not None:
+            runs = set(runs)
+        case_col = self._open('case.i32', _INT_TYPECODE)
+        run_col = self._open('run.i32', _INT_TYPECODE)
+        try:
+            selection = self._selection(case_col, run_col, cases, runs)
+            case_ids = case_col.take(selection)
+            columns = OrderedDict()
+            all_cases = self._cases
+            for key in self.tag_names:
+                columns[key] = [all_cases[idx].get(key) for idx in case_ids]
+            columns['run'] = list(run_col.take(selection))
+            for key in metrics:
+                col = self._open('metric_%d.f64'
+                                 % self._info['metrics'].index(key))
+                try:
+                    columns[key] = col.take(selection)
+                finally:
+                    col.close()
+        finally:
+            case_col.close()
+            run_col.close()
+        return ResultSet(columns, index=self.tag_names + ['run'])
+
+    def aggregate(self, by=None, methods='mean', metrics=None, runs=None,
+                  chunk_size=1000000, **tags):
+        """Aggregate the metrics by groups, out-of-core
+
+        Rows are processed by chunks, so that the memory usage does not
+        depend on the size of the store. Faster with numpy.
+
+        Parameters
+        ----------
+        by : {str, list of str}, default=None
+          tags and/or ``'run'`` to group by. By default, all tags.
+        methods : {str, list of str}, default='mean'
+          aggregation methods, among ``'count'``, ``'sum'``, ``'mean'``,
+          ``'var'``, ``'std'``, ``'min'`` and ``'max'``. Column names follow
+          :meth:`neurtu.resultset.GroupBy.agg`.
+        metrics : list of str, default=None
+          metrics to aggregate. By default, all metrics.
+        runs : list of int, default=None
+          ids of the runs to aggregate. By default, all runs.
+        chunk_size : int, default=1000000
+          number of rows processed at once
+        **tags : dict
+          only aggregate the cases where the given tags are equal to the
+          given values
+
+        Returns
+        -------
+        res : ResultSet
+          indexed by the ``by`` columns
+        """
+        if by is None:
+            by = self.tag_names
+        elif isinstance(by, str):
+            by = [by]
+        for key in by:
+            if key != 'run' and key not in self._info['tags']:
+                raise ValueError('Column %s not found in %s'
+                                 % (key, self.tag_names + ['run']))
+        flat = isinstance(methods, str)
+        if flat:
+            methods = [methods]
+        for method in methods:
+            if method not in AGGREGATIONS:
+                raise ValueError(('%s is not a supported out-of-core '
+                                  'aggregation method. Supported methods '
+                                  'are %s') % (method, list(AGGREGATIONS)))
+        metrics = self._check_metrics(metrics)
+        cases = self._selected_cases(tags)
+        if runs is not None:
+            runs = set(runs)
+
+        # group ids of the cases, by dictionary encoding of the tags in by
+        tag_by = [key for key in by if key != 'run']
+        case_groups = array(_INT_TYPECODE)
+        groups = OrderedDict()
+        for idx, case in enumerate(self._cases):
+            if cases is not None and idx not in cases:
+                case_groups.append(-1)
+                continue
+            values = tuple(case.get(key) for key in tag_by)
+            key = json.dumps(values)
+            if key not in groups:
+                groups[key] = (len(groups), values)
+            case_groups.append(groups[key][0])
+        n_groups = max(len(groups), 1)
+        n_runs = self._info['n_runs'] if 'run' in by else 1
+        run_groups = array(_INT_TYPECODE, [
+            (idx if 'run' in by else 0) if runs is None or idx in runs
+            else -1 for idx in range(self._info['n_runs'])])
+
+        case_col = self._open('case.i32', _INT_TYPECODE)
+        run_col = self._open('run.i32', _INT_TYPECODE)
+        stats = OrderedDict()
+        try:
+            for key in metrics:
+                col = self._open('metric_%d.f64'
+                                 % self._info['metrics'].index(key))
+                try:
+                    stats[key] = _aggregate_column(
+                        col.data, case_col.data, run_col.data, case_groups,
+                        run_groups, n_groups * n_runs, n_runs, chunk_size)
+                finally:
+                    col.close()
+        finally:
+            case_col.close()
+            run_col.close()
+
+        # only keep non empty groups
+        counts = [0] * (n_groups * n_runs)
+        for moments in stats.values():
+            for idx, count in enumerate(moments['count']):
+                counts[idx] = max(counts[idx], count)
+        group_values = [None] * len(groups)
+        for group_id, values in groups.values():
+            group_values[group_id] = values
+
+        columns = OrderedDict((key, []) for key in by)
+        for key in metrics:
+            for method in methods:
+                columns[key if flat else (key, method)] = []
+        for idx in range(n_groups * n_runs):
+            if not counts[idx] or not groups:
+                continue
+            values = dict(zip(tag_by, group_values[idx // n_runs]))
+            values['run'] = idx % n_runs
+            for key in by:
+                columns[key].append(values[key])
+            for key in metrics:
+                moments = stats[key]
+                for method in methods:
+                    columns[key if flat else (key, method)].append(
+                        _finalize(moments, method, idx))
+        return ResultSet(columns, index=by)
+
+
+def _finalize(moments, method, idx):
+    count = moments['count'][idx]
+    if method == 'count':
+        return float(count)
+    if method == 'sum':
+        return moments['sum'][idx]
+    if not count:
+        return float('nan')
+    if method == 'mean':
+        return moments['mean'][idx]
+    if method in ('var', 'std'):
+        if count < 2:
+            return float('nan')
+        var = moments['m2'][idx] / (count - 1)
+        return var if method == 'var' else math.sqrt(var)
+    return moments[method][idx]
+
+
+def _aggregate_column(data, case_data, run_data, case_groups, run_groups,
+                      n_groups, n_runs, chunk_size):
+    """Count, sum, mean, sum of squared deviations, min and max of a column
+    per group, computed by chunks and merged with Chan's parallel update"""
+    np = import_or_none('numpy')
+    if np is None:
+        return _aggregate_column_python(data, case_data, run_data,
+                                        case_groups, run_groups, n_groups,
+                                        n_runs)
+    count = np.zeros(n_groups)
+    total = np.zeros(n_groups)
+    mean = np.zeros(n_groups)
+    m2 = np.zeros(n_groups)
+    mins = np.full(n_groups, np.inf)
+    maxs = np.full(n_groups, -np.inf)
+    values = np.frombuffer(data, dtype='float64')
+    cases = np.frombuffer(case_data, dtype='int32')
+    runs = np.frombuffer(run_data, dtype='int32')
+    case_groups = np.frombuffer(case_groups, dtype='int32')
+    run_groups = np.frombuffer(run_groups, dtype='int32')
+    for start in range(0, len(values), chunk_size):
+        x = values[start:start + chunk_size]
+        case_group = case_groups[cases[start:start + chunk_size]]
+        run_group = run_groups[runs[start:start + chunk_size]]
+        keep = (case_group >= 0) & (run_group >= 0) & ~np.isnan(x)
+        x = x[keep]
+        group = case_group[keep] * n_runs + run_group[keep]
+        n_chunk = np.bincount(group, minlength=n_groups)
+        sum_chunk = np.bincount(group, weights=x, minlength=n_groups)
+        mean_chunk = sum_chunk / np.maximum(n_chunk, 1)
+        m2_chunk = np.bincount(group, weights=(x - mean_chunk[group])**2,
+                               minlength=n_groups)
+        np.fmin.at(mins, group, x)
+        np.fmax.at(maxs, group, x)
+        n_total = count + n_chunk
+        delta = mean_chunk - mean
+        ratio = np.divide(n_chunk, n_total, out=np.zeros(n_groups),
+                          where=n_total > 0)
+        mean += delta * ratio
+        m2 += m2_chunk + delta**2 * count * ratio
+        count = n_total
+        total += sum_chunk
+    return {'count': count.astype(int).tolist(), 'sum': total.tolist(),
+            'mean': mean.tolist(), 'm2': m2.tolist(),
+            'min': mins.tolist(), 'max': maxs.tolist()}
+
+
+def _aggregate_column_python(data, case_data, run_data, case_groups,
+                             run_groups, n_groups, n_runs):
+    count = [0] * n_groups
+    total = [0.0] * n_groups
+    mean = [0.0] * n_groups
+    m2 = [0.0] * n_groups
+    mins = [float('inf')] * n_groups
+    maxs = [float('-inf')] * n_groups
+    for x, case, run in zip(data, case_data, run_data):
+        case_group = case_groups[case]
+        run_group = run_groups[run]
+        if case_group < 0 or run_group < 0 or x != x:
+            continue
+        group = case_group * n_runs + run_group
+        count[group] += 1
+        total[group] += x
+        delta = x - mean[group]
+        mean[group] += delta / count[group]
+        m2[group] += delta * (x - mean[group])
+        if x < mins[group]:
+            mins[group] = x
+        if x > maxs[group]:
+            maxs[group] = x
+    return {'count': count, 'sum': total, 'mean': mean, 'm2': m2,
+            'min': mins, 'max': maxs}
@@ -0,0 +1,271 @@
+# neurtu, BSD 3 clause license
+# Authors: Roman Yurchak
+"""Control and report of the system noise sources (Linux only)"""
+
+import os
+import warnings
+from collections import OrderedDict
+
+_SYSFS_CPU = '/sys/devices/system/cpu'
+
+# nice value used when raising the priority of the benchmark process
+_HIGH_PRIORITY = -10
+
+
+def _read(path):
+    """Content of a sysfs file, or None if it cannot be read"""
+    try:
+        with open(path) as fh:
+            return fh.read().strip()
+    except (IOError, OSError):
+        return None
+
+
+def _available_cpus():
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))  # pragma: no cover
+
+
+def loadavg():
+    """1 minute load average, or None when not available"""
+    try:
+        return os.getloadavg()[0]
+    except (AttributeError, OSError):  # pragma: no cover
+        return None
+
+
+def cpu_settings(cpus=None):
+    """Read the frequency scaling settings from ``/sys/devices/system/cpu``
+
+    Parameters
+    ----------
+    cpus : list of int, default=None
+      CPUs to report the settings of. By default, all available CPUs.
+
+    Returns
+    -------
+    settings : dict
+      with the ``governor`` (comma separated if the CPUs differ), the
+      ``min_freq_mhz``, ``max_freq_mhz`` and mean ``cur_freq_mhz``
+      frequencies, whether ``turbo`` and simultaneous multithreading
+      (``smt``) are enabled. Unavailable settings are None.
+    """
+    if cpus is None:
+        cpus = _available_cpus()
+    governors, freqs = [], {'min': [], 'max': [], 'cur': []}
+    for cpu in cpus:
+        base = os.path.join(_SYSFS_CPU, 'cpu%d' % cpu, 'cpufreq')
+        governor = _read(os.path.join(base, 'scaling_governor'))
+        if governor is not None and governor not in governors:
+            governors.append(governor)
+        for key in freqs:
+            val = _read(os.path.join(base, 'scaling_%s_freq' % key))
+            if val is not None and val.isdigit():
+                freqs[key].append(int(val) / 1000.)
+
+    no_turbo = _read(os.path.join(_SYSFS_CPU, 'intel_pstate', 'no_turbo'))
+    boost = _read(os.path.join(_SYSFS_CPU, 'cpufreq', 'boost'))
+    if no_turbo is not None:
+        turbo = no_turbo == '0'
+    elif boost is not None:
+        turbo = boost == '1'
+    else:
+        turbo = None
+    smt = _read(os.path.join(_SYSFS_CPU, 'smt', 'active'))
+
+    return OrderedDict([
+        ('governor', ','.join(governors) if governors else None),
+        ('min_freq_mhz', min(freqs['min']) if freqs['min'] else None),
+        ('max_freq_mhz', max(freqs['max']) if freqs['max'] else None),
+        ('cur_freq_mhz', (sum(freqs['cur']) / len(freqs['cur'])
+                          if freqs['cur'] else None)),
+        ('turbo', turbo),
+        ('smt', smt == '1' if smt is not None else None)])
+
+
+def _writable(path):
+    return os.path.exists(path) and os.access(path, os.W_OK)
+
+
+def fixable_settings(cpus=None):
+    """Noisy settings that this process has the permissions to change
+
+    Parameters
+    ----------
+    cpus : list of int, default=None
+      CPUs to check the frequency governor of. By default, all available
+      CPUs.
+
+    Returns
+    -------
+    fixable : set of str
+      among ``'governor'`` (the ``performance`` governor is available),
+      ``'turbo'`` and ``'smt'``
+    """
+    if cpus is None:
+        cpus = _available_cpus()
+    fixable = set()
+    governors = [os.path.join(_SYSFS_CPU, 'cpu%d' % cpu, 'cpufreq')
+                 for cpu in cpus]
+    if governors and all(
+            _writable(os.path.join(base, 'scaling_governor')) and
+            'performance' in (_read(os.path.join(
+                base, 'scaling_available_governors')) or '').split()
+            for base in governors):
+        fixable.add('governor')
+    if _writable(os.path.join(_SYSFS_CPU, 'intel_pstate', 'no_turbo')) or \
+            _writable(os.path.join(_SYSFS_CPU, 'cpufreq', 'boost')):
+        fixable.add('turbo')
+    if _writable(os.path.join(_SYSFS_CPU, 'smt', 'control')):
+        fixable.add('smt')
+    return fixable
+
+
+def check_settings(settings, load=None, fixable=None, initial=None):
+    """Find system settings that make measurements noisy
+
+    Parameters
+    ----------
+    settings : dict
+      output of :func:`cpu_settings`
+    load : float, default=None
+      1 minute load average
+    fixable : set of str, default=None
+      settings that can be changed (see :func:`fixable_settings`). Noisy
+      settings that cannot be changed are not reported. By default, all
+      noisy settings are reported.
+    initial : dict, default=None
+      output of :func:`cpu_settings` at the start of the benchmark, to
+      report the settings that changed since
+
+    Returns
+    -------
+    issues : list of str
+      description of the noisy settings
+    """
+    def can_fix(key):
+        return fixable is None or key in fixable
+
+    issues = []
+    governor = settings.get('governor')
+    if governor is not None and governor != 'performance' and \
+            can_fix('governor'):
+        issue = ("CPU frequency governor is '%s' instead of 'performance'"
+                 % governor)
+        if settings.get('min_freq_mhz') is not None and \
+                settings.get('max_freq_mhz') is not None and \
+                settings['min_freq_mhz'] < settings['max_freq_mhz']:
+            issue += (', the frequency scales between %.0f and %.0f MHz'
+                      % (settings['min_freq_mhz'],
+                         settings['max_freq_mhz']))
+        issues.append(issue)
+    if settings.get('turbo') and can_fix('turbo'):
+        issues.append('turbo boost is enabled')
+    if settings.get('smt') and can_fix('smt'):
+        issues.append('simultaneous multithreading (hyper-threading) is '
+                      'enabled')
+    if initial is not None:
+        for key in ['governor', 'min_freq_mhz', 'max_freq_mhz', 'turbo',
+                    'smt']:
+            if initial.get(key) != settings.get(key):
+                issues.append('%s changed from %s to %s during the '
+                              'benchmark' % (key, initial.get(key),
+                                             settings.get(key)))
+    if load is not None and load > 1:
+        issues.append('system load average is %.2f' % load)
+    return issues
+
+
+class Isolation(object):
+    """Pin the process to a set of CPUs and optionally raise its priority
+
+    Used as a context manager, that restores the initial CPU affinity and
+    priority on exit.
+
+    Parameters
+    ----------
+    cpus : list of int, default=None
+      CPUs to pin the process to. By default, the process is not pinned,
+      so that multi-threaded code (e.g. BLAS or OpenMP) keeps all its
+      CPUs: pinning requires this parameter.
+    priority : bool, default=False
+      raise the priority of the process (requires privileges, a warning is
+      raised otherwise)
+    """
+    def __init__(self, cpus=None, priority=False):
+        if cpus is not None and not hasattr(os, 'sched_setaffinity'):
+            raise ValueError('CPU pinning is not supported on this '
+                             'platform!')
+        self.cpus = sorted(cpus) if cpus is not None else None
+        self.priority = priority
+        self._affinity = None
+        self._nice = None
+        self._initial = None
+
+    def _cpus(self):
+        return self.cpus if self.cpus is not None else _available_cpus()
+
+    def report(self):
+        """Settings of the CPUs used by the process, with the noisy ones
+
+        Only the noisy settings that can be changed with the permissions of
+        the process (see :func:`fixable_settings`), the high load, and
+        within the context manager, the settings that changed since
+        entering it, are reported as ``warnings``.
+
+        Returns
+        -------
+        report : dict
+          the ``cpus``, whether they are ``pinned``, the ``nice`` value of
+          the process, the :func:`cpu_settings`, the ``loadavg`` and the
+          list of ``warnings``
+        """
+        cpus = self._cpus()
+        settings = cpu_settings(cpus)
+        load = loadavg()
+        report = OrderedDict([('cpus', cpus),
+                              ('pinned', self.cpus is not None),
+                              ('nice', os.getpriority(os.PRIO_PROCESS, 0))])
+        report.update(settings)
+        report['loadavg'] = load
+        report['warnings'] = check_settings(
+            settings, load, fixable=fixable_settings(cpus),
+            initial=self._initial)
+        return report
+
+    def changes(self):
+        """Settings that changed since entering the context manager (e.g.
+        the governor or the turbo boost)
+
+        Returns
+        -------
+        issues : list of str
+        """
+        if self._initial is None:
+            return []
+        return check_settings(cpu_settings(self._cpus()), fixable=set(),
+                              initial=self._initial)
+
+    def __enter__(self):
+        self._initial = cpu_settings(self._cpus())
+        if self.cpus is not None:
+            self._affinity = os.sched_getaffinity(0)
+            os.sched_setaffinity(0, self.cpus)
+        if self.priority:
+            self._nice = os.getpriority(os.PRIO_PROCESS, 0)
+            try:
+                os.setpriority(os.PRIO_PROCESS, 0, _HIGH_PRIORITY)
+            except OSError:
+                warnings.warn('Insufficient privileges to raise the '
+                              'process priority.')
+                self._nice = None
+        return self
+
+    def __exit__(self, *args):
+        if self._affinity is not None:
+            os.sched_setaffinity(0, self._affinity)
+            self._affinity = None
+        if self._nice is not None:
+            os.setpriority(os.PRIO_PROCESS, 0, self._nice)
+        self._initial = None
@@ -3,12 +3,15 @@
 
 from __future__ import division
 
+import os
 import sys
 from time import sleep
 import pytest
 from pytest import approx
 
-from neurtu import timeit, memit, delayed, Benchmark
+from neurtu import timeit, memit, delayed, precompute, Benchmark
+from neurtu.delayed import _MISSING
+from neurtu.resultset import ResultSet
 from neurtu.utils import import_or_none
 
 # Timing tests
@@ -80,7 +83,7 @@ def test_dataframe_conversion(repeat, aggregate):
     metrics = ['peak_memory', 'wall_time']
 
     bench = Benchmark(wall_time=True, peak_memory=True,
-                      repeat=repeat, aggregate=aggregate)
+                      repeat=repeat, aggregate=aggregate, to_dataframe=True)
 
     res = bench(delayed(sleep, tags={'idx': idx})(0.04) for idx in range(N))
 
@@ -111,15 +114,34 @@ def test_repeat():
 
     agg = ('mean',)
     res = timeit(delayed(sleep)(0), repeat=2, aggregate=agg)
-    pd = import_or_none('pandas')
+    assert isinstance(res, ResultSet)
+    assert res.columns == [('wall_time', 'mean')]
+    assert len(res) == 1
 
-    if pd is None:
-        assert len(res) == 2
-    else:
+    pd = import_or_none('pandas')
+    if pd is not None:
+        res = timeit(delayed(sleep)(0), repeat=2, aggregate=agg,
+                     to_dataframe=True)
         assert list(res.columns) == ['wall_time']
         assert list(res.index) == list(agg)
 
 
+def test_resultset_default():
+    res = timeit((delayed(sleep, tags={'idx': idx})(0) for idx in range(2)),
+                 repeat=3, aggregate=['mean', 'median', 'p90'])
+    assert isinstance(res, ResultSet)
+    assert res.index == ['idx']
+    assert res['idx'] == [0, 1]
+    assert set(res.metrics) == {('wall_time', 'mean'),
+                                ('wall_time', 'median'),
+                                ('wall_time', 'p90')}
+
+    res = timeit((delayed(sleep, tags={'idx': idx})(0) for idx in range(2)),
+                 repeat=2, aggregate=False)
+    assert res.index == ['idx', 'runid']
+    assert len(res) == 4
+
+
 @pytest.mark.parametrize('repeat', (1, 2))
 def test_multiple_metrics(repeat):
 
@@ -171,6 +193,11 @@ def test_untaged_sequence():
                 delayed(sleep, tags={'a': 1})(0.1)])
     assert "but only 1 unique tags were found" in str(excinfo.value)
 
+    # unhashable tag values
+    with pytest.raises(ValueError, match='but only 1 unique tags'):
+        timeit([delayed(sleep, tags={'a': [1]})(0.1),
+                delayed(sleep, tags={'a': [1]})(0.1)])
+
 
 def test_progress_bar(capsys):
     timeit((delayed(sleep, tags={'N': idx})(0.1) for idx in range(2)),
@@ -198,3 +225,294 @@ def test_custom_metric():
     bench = Benchmark(custom_metric=custom_metric)
     res = bench(delayed(range)(3))
     assert res == {'custom_metric': 3}
+
+
+def test_memory_timeline():
+    np = pytest.importorskip('numpy')
+
+    N = 2000
+
+    def allocate_array():
+        X = np.ones((N, N))
+        sleep(0.1)
+        del X
+        sleep(0.05)
+
+    res = Benchmark(memory_timeline={'interval': 0.01})(
+            delayed(allocate_array)())
+    timeline = res['memory_timeline']
+    assert timeline.samples.shape[1] == 2
+    summary = timeline.summary()
+    assert summary['peak'] == approx(N**2 * 8 / 1024**2, rel=0.1)
+    assert 0 < summary['time_to_peak'] < summary['duration']
+    assert summary['final'] < summary['peak']
+    assert summary['area'] > 0
+
+
+def test_memory_timeline_downsample():
+    from neurtu.metrics import _downsample_timeline
+
+    samples = [(float(idx), float(idx % 7)) for idx in range(100)]
+    res = _downsample_timeline(samples, 10)
+    assert len(res) == 10
+    assert max(el[1] for el in res) == 6
+    assert res[-1] == samples[-1]
+
+    # peak in the last bin
+    samples = [(float(idx), 0.0) for idx in range(100)]
+    samples[95] = (95.0, 50.0)
+    res = _downsample_timeline(samples, 10)
+    assert len(res) <= 10
+    assert max(el[1] for el in res) == 50.0
+    assert res[-1] == samples[-1]
+    res = _downsample_timeline(samples, 2)
+    assert res == [samples[95], samples[-1]]
+
+    from neurtu.metrics import measure_memory_timeline
+    with pytest.raises(ValueError, match='max_samples=1 should be'):
+        measure_memory_timeline(delayed(sum)([1]), max_samples=1)
+
+
+def test_memory_timeline_properties():
+    from neurtu.metrics import MemoryTimeline
+
+    samples = [(0.0, 0.0), (1.0, 2.0), (2.0, 4.0), (3.0, 1.0)]
+    timeline = MemoryTimeline(samples)
+    summary = {'peak': 4.0, 'time_to_peak': 2.0, 'area': 6.5, 'final': 1.0,
+               'duration': 3.0}
+    assert timeline.summary() == summary
+    assert timeline.usage == [0.0, 2.0, 4.0, 1.0]
+
+    np = pytest.importorskip('numpy')
+    timeline = MemoryTimeline(np.array(samples))
+    # numpy samples are not converted to lists
+    assert isinstance(timeline.times, np.ndarray)
+    assert isinstance(timeline.usage, np.ndarray)
+    assert timeline.summary() == summary
+    assert all(type(val) is float for val in timeline.summary().values())
+
+
+def _allocate_cycles(n=20000):
+    for _ in range(n):
+        a = []
+        a.append(a)
+
+
+def test_gc_time():
+    res = Benchmark(gc_time=True)(delayed(_allocate_cycles)())
+    assert set(res) == {'gc_time', 'gc_collections_0', 'gc_collections_1',
+                        'gc_collections_2'}
+    assert res['gc_collections_0'] > 0
+    assert res['gc_time'] > 0
+
+
+@pytest.mark.parametrize('policy', ['disabled', 'enabled', 'collect-before'])
+def test_gc_policy(policy):
+    import gc
+
+    bench = Benchmark(wall_time=True, gc=policy)
+    assert bench.metrics['wall_time']['disable_gc'] == (policy == 'disabled')
+
+    def is_gc_enabled():
+        assert gc.isenabled() == (policy != 'disabled')
+
+    bench(delayed(is_gc_enabled)())
+
+    with pytest.raises(ValueError, match='gc=other should be one of'):
+        Benchmark(gc='other')
+
+
+def test_amortized_gc(monkeypatch):
+    import gc
+    from neurtu.base import _GarbageCollector
+
+    calls = []
+    monkeypatch.setattr(gc, 'collect',
+                        lambda *args: calls.append(args) or sleep(0.01))
+    collect = _GarbageCollector(ratio=0.1)
+    for _ in range(5):
+        collect()
+    # a full collection followed by young collections, until 10 times the
+    # duration of the full collection has elapsed
+    assert calls == [()] + [(0,)] * 4
+    sleep(0.1)
+    collect()
+    assert calls[-1] == ()
+
+
+def test_large_sweep():
+    res = Benchmark(metric=lambda obj: 1.0, progress_bar=False)(
+        delayed(sum, tags={'idx': idx})([]) for idx in range(10000))
+    assert len(res) == 10000
+    assert list(res['idx'][-2:]) == [9998, 9999]
+    assert set(res['metric']) == {1.0}
+
+
+def _write_read_file(path):
+    with open(path, 'wb') as fh:
+        fh.write(b'0' * 1024**2)
+        fh.flush()
+        os.fsync(fh.fileno())
+    with open(path, 'rb') as fh:
+        fh.read()
+
+
+def test_io_counters(tmpdir):
+    pytest.importorskip('resource')
+    path = str(tmpdir.join('data.bin'))
+    res = Benchmark(io_counters=True)(delayed(_write_read_file)(path))
+    for key in ['minflt', 'majflt', 'nvcsw', 'nivcsw', 'inblock', 'oublock']:
+        assert res[key] >= 0
+    if os.path.exists('/proc/self/io'):
+        assert res['syscw'] >= 1
+        assert res['syscr'] >= 1
+        assert res['write_bytes'] >= 0
+
+
+def _busy_loop(duration):
+    from time import perf_counter
+    t0 = perf_counter()
+    while perf_counter() - t0 < duration:
+        pass
+
+
+def _run_in_pool(pool, duration):
+    pool.apply(_busy_loop, (duration,))
+
+
+def _run_in_subprocess(duration):
+    import multiprocessing
+    proc = multiprocessing.Process(target=_busy_loop, args=(duration,))
+    proc.start()
+    proc.join()
+
+
+def test_cpu_time_include_children():
+    pytest.importorskip('resource')
+    import multiprocessing
+
+    bench = Benchmark(cpu_time=True, include_children=True)
+    assert bench.metrics['cpu_time']['include_children']
+
+    res = bench(delayed(_run_in_subprocess)(0.2))
+    assert res['cpu_time'] > 0.15
+
+    # persistent worker pool created before the measurement
+    with multiprocessing.Pool(1) as pool:
+        pool.apply(_busy_loop, (0.1,))
+        res = bench(delayed(_run_in_pool)(pool, 0.2))
+        assert res['cpu_time'] == approx(0.2, abs=0.08)
+
+        # the time spent in the pool is not accounted for by default
+        from neurtu.metrics import measure_cpu_time
+        assert measure_cpu_time(delayed(_run_in_pool)(pool, 0.2)) < 0.1
+
+
+def test_cpu_time_include_children_monotonic(monkeypatch):
+    pytest.importorskip('resource')
+    from neurtu import metrics
+
+    # the CPU time of a child that exits without being waited for is lost
+    times = iter([1.0, 0.0])
+    monkeypatch.setattr(metrics, '_descendants_user_time',
+                        lambda: next(times))
+    res = metrics.measure_cpu_time(delayed(sum)([1, 2]),
+                                   include_children=True)
+    assert res == 0
+
+
+def _allocate(size):
+    data = bytearray(size * 2**20)
+    sleep(0.3)
+    return len(data)
+
+
+def _allocate_in_subprocess(size):
+    import multiprocessing
+    proc = multiprocessing.Process(target=_allocate, args=(size,))
+    proc.start()
+    proc.join()
+
+
+def test_peak_memory_include_children():
+    pytest.importorskip('psutil')
+
+    bench = Benchmark(peak_memory={'interval': 0.01}, include_children=True)
+    res = bench(delayed(_allocate_in_subprocess)(50))
+    assert res['peak_memory'] > 40
+    assert res['peak_memory_child_max'] > 40
+    assert res['peak_memory_child_sum'] >= res['peak_memory_child_max']
+
+    from neurtu.metrics import measure_peak_memory
+    with pytest.raises(ValueError, match='backend of measure_peak_memory'):
+        measure_peak_memory(delayed(sum)([1]), include_children=True,
+                            interval=0.01, backend='psutil')
+
+
+class _Model(object):
+    n_fits = 0
+
+    def fit(self, n):
+        _Model.n_fits += 1
+        sleep(0.05)
+        self.data = list(range(n))
+        return self
+
+    def predict(self, scale):
+        return [scale * el for el in self.data]
+
+
+def test_precompute():
+    _Model.n_fits = 0
+    models = [precompute(delayed(_Model)().fit(n)) for n in [10, 20]]
+    cases = [delayed(model, tags={'n': n, 'scale': scale}).predict(scale)
+             for n, model in zip([10, 20], models)
+             for scale in [1, 2, 3]]
+    bench = Benchmark(wall_time=True, cpu_time=True, repeat=2)
+    res = bench(cases)
+    # each prefix is computed once, and not timed
+    assert _Model.n_fits == 2
+    assert max(res[('wall_time', 'max')]) < 0.05
+    # and released after the last case using it
+    assert bench._refcounts == {}
+    for model in models:
+        assert model._Delayed__value is _MISSING
+
+    # all runs of a case are evaluated before the next case, so that only
+    # one prefix is alive at a time
+    alive = []
+
+    def n_alive(obj):
+        alive.append(sum(model._Delayed__value is not _MISSING
+                         for model in models))
+        return alive[-1]
+
+    bench = Benchmark(n_alive=n_alive, repeat=3, aggregate=False)
+    res = bench(cases)
+    assert alive == [1] * 18
+    assert _Model.n_fits == 4
+    assert list(res['runid']) == [0] * 6 + [1] * 6 + [2] * 6
+    assert list(res['scale'][:6]) == [1, 2, 3, 1, 2, 3]
+    assert list(res['n'][:6]) == [10, 10, 10, 20, 20, 20]
+
+    # node ids are not shared with other processes
+    bench = Benchmark(wall_time=True, repeat=2, timeout=10)
+    bench(cases)
+    assert bench._refcounts == {}
+
+
+def _getenv(name):
+    return os.environ.get(name, 'none')
+
+
+def test_precompute_env():
+    # the shared prefix is computed with the environment of the case
+    prefix = precompute(delayed(_getenv)('NEURTU_PRECOMPUTE'))
+    obj = delayed(prefix, env={'NEURTU_PRECOMPUTE': 'bar'}).upper()
+    assert obj.compute() == 'BAR'
+
+    values = []
+    bench = Benchmark(value=lambda obj: values.append(obj.compute()) or 0)
+    bench([obj])
+    assert values == ['BAR']
+    assert 'NEURTU_PRECOMPUTE' not in os.environ
@@ -0,0 +1,78 @@
+# neurtu, BSD 3 clause license
+# Authors: Roman Yurchak
+
+import os
+
+import pytest
+
+from neurtu import Benchmark, delayed
+from neurtu import cache as cache_module
+from neurtu.cache import detect_files, evict_files, flush_cpu_caches, llc_size
+
+
+def _read_file(path):
+    with open(path, 'rb') as fh:
+        return len(fh.read())
+
+
+def test_llc_size():
+    assert llc_size() > 0
+
+
+def test_flush_cpu_caches():
+    size = 3 * 1024**2 + 10
+    assert flush_cpu_caches(size=size) is None
+    buf = cache_module._FLUSH_BUFFER[0]
+    assert len(buf) == size
+    # the whole buffer is written, including the last partial chunk
+    value = buf[0]
+    assert buf.count(value) == size
+    flush_cpu_caches(size=size)
+    assert cache_module._FLUSH_BUFFER[0] is buf
+    assert buf.count((value + 1) % 256) == size
+
+    flush_cpu_caches(size=1024)
+    assert len(cache_module._FLUSH_BUFFER) == 1
+    assert len(cache_module._FLUSH_BUFFER[0]) == 1024
+
+
+def test_benchmark_cold_cases():
+    bench = Benchmark(wall_time=True, cpu_time=True, cache='cold',
+                      repeat=2, aggregate=False, to_dataframe=False)
+    cases = [delayed(sum, tags={'N': N})(range(N)) for N in [10, 1000]]
+    res = bench(cases)
+    assert len(res) == 4
+    assert sorted((row['N'], row['runid']) for row in res) == [
+        (10, 0), (10, 1), (1000, 0), (1000, 1)]
+    for row in res:
+        assert set(row) == {'N', 'runid', 'wall_time', 'cpu_time'}
+        assert row['wall_time'] > 0
+
+
+def test_detect_evict_files(tmpdir):
+    path = tmpdir.join('data.bin')
+    path.write(b'0' * 1024)
+    obj = delayed(_read_file)(str(path))
+    assert detect_files(obj) == [str(path)]
+    assert detect_files(delayed(_read_file)(path=path)) == [str(path)]
+    assert detect_files(delayed(_read_file)('not_a_file')) == []
+
+    if hasattr(os, 'posix_fadvise'):
+        assert evict_files([str(path), 'not_a_file']) == 1
+
+
+@pytest.mark.parametrize('cache', ['cold', 'both'])
+def test_benchmark_cache(tmpdir, cache):
+    path = tmpdir.join('data.bin')
+    path.write(b'0' * 1024**2)
+    bench = Benchmark(wall_time=True, cpu_time=True, cache=cache,
+                      cache_files=lambda tags: [str(path)])
+    res = bench(delayed(_read_file, tags={'a': 1})(str(path)))
+    if cache == 'both':
+        assert set(res) == {'a', 'wall_time', 'cpu_time', 'wall_time_cold',
+                            'cpu_time_cold'}
+    else:
+        assert set(res) == {'a', 'wall_time', 'cpu_time'}
+
+    with pytest.raises(ValueError, match='cache=other should be one of'):
+        Benchmark(cache='other')
@@ -0,0 +1,72 @@
+# neurtu, BSD 3 clause license
+# Authors: Roman Yurchak
+
+import math
+from time import sleep
+
+import pytest
+
+from neurtu import compare_impls, delayed
+from neurtu.compare import _interim_looks, _median_ci
+from neurtu.stats import median
+
+pytest.importorskip('numpy')
+
+
+def test_compare_impls():
+    a_cases = [delayed(sleep, tags={'N': N, 'impl': 'a'})(0.002 * N)
+               for N in [1, 2]]
+    b_cases = [delayed(sleep, tags={'N': N, 'impl': 'b'})(0.001 * N)
+               for N in [2, 1]]
+    res = compare_impls(a_cases, b_cases, min_time=0.01)
+    # the impl tag differs between A and B and is not used for pairing
+    assert res.index == ['N']
+    assert res['N'] == [1, 2]
+    assert res['significant'] == [True, True]
+    for row in res:
+        assert row['ci_low'] <= row['speedup'] <= row['ci_high']
+        assert row['speedup'] > 1.3
+        assert row['time_a'] > row['time_b']
+        # stopped at the first look
+        assert row['n_rounds'] == 8
+
+
+def test_compare_impls_same():
+    obj = delayed(sum, tags={'N': 1})(range(100))
+    res = compare_impls([obj], [obj], min_rounds=2, max_rounds=10,
+                        min_time=0.001)
+    assert res['significant'] == [False]
+    # the interval is finite, but includes 1
+    assert res['ci_low'][0] <= 1 <= res['ci_high'][0]
+    assert res['n_rounds'][0] == 10
+    assert isinstance(res['n_rounds'][0], int)
+
+
+def test_median_ci():
+    values = [1.1, 0.9, 1.2, 1.0, 1.3, 0.8, 1.05, 0.95]
+    low, high = _median_ci(values, alpha=0.1)
+    assert low <= median(values) <= high
+    assert _median_ci(values, alpha=0.2)[0] >= low
+    # too few values for this confidence level
+    assert all(math.isnan(val) for val in _median_ci([1, 2, 3], 0.05))
+    # looks where the interval cannot exclude 1 are skipped
+    assert _interim_looks(3, 20, 0.95) == [8, 16, 20]
+    assert _interim_looks(3, 100, 0.95) == [9, 18, 36, 72, 100]
+    assert _interim_looks(8, 8, 0.95) == [8]
+    for confidence in [0.9, 0.95, 0.99]:
+        looks = _interim_looks(3, 20, confidence)
+        alpha = (1 - confidence) / len(looks)
+        assert not math.isnan(_median_ci(range(looks[0]), alpha)[0])
+
+
+def test_compare_impls_errors():
+    a_cases = [delayed(sleep, tags={'N': 1})(0)]
+    with pytest.raises(ValueError, match='No B case found'):
+        compare_impls(a_cases, [delayed(sleep, tags={'N': 2})(0)],
+                      pair_on=['N'])
+    with pytest.raises(ValueError, match='does not uniquely identify B'):
+        compare_impls(a_cases, [delayed(sleep, tags={'N': 1})(0)] * 2)
+    with pytest.raises(ValueError, match='Tag .other. used in pair_on'):
+        compare_impls(a_cases, a_cases, pair_on=['other'])
+    with pytest.raises(ValueError, match='max_rounds=5 is too small'):
+        compare_impls(a_cases, a_cases, max_rounds=5)
@@ -1,8 +1,13 @@
 # neurtu, BSD 3 clause license
 # Authors: Roman Yurchak
+import copy
 import os
+import pickle
 
-from neurtu import delayed
+import pytest
+
+from neurtu import delayed, precompute
+from neurtu.delayed import _MISSING
 
 
 def test_set_env():
@@ -23,3 +28,68 @@ def test_get_args_kwargs():
     delayed_obj = delayed(func)('arg', key_arg='kwarg')
     assert delayed_obj.get_args()[0] == 'arg'
     assert delayed_obj.get_kwargs()[0] == {'key_arg': 'kwarg'}
+
+
+def test_pickle():
+    obj = delayed(sorted, tags={'a': 1}, env={'NEURTU_TEST': 'true'})(
+        [3, 1, 2], reverse=True)
+    obj2 = pickle.loads(pickle.dumps(obj))
+    assert obj2.compute() == [3, 2, 1]
+    assert obj2.get_tags() == {'a': 1}
+    assert obj2.get_env() == {'NEURTU_TEST': 'true'}
+
+
+def test_special_attributes():
+    # special attributes are delayed, except the ones used by pickle and
+    # copy
+    obj = delayed([3, 1, 2])
+    assert obj.__len__().compute() == 3
+    assert obj.__getitem__(1).compute() == 1
+    assert obj.__class__ is type(obj)
+    obj2 = copy.deepcopy(obj.__contains__(2))
+    assert obj2.compute() is True
+    assert copy.copy(obj).compute() == [3, 1, 2]
+    with pytest.raises(AttributeError):
+        obj.__getnewargs_ex__
+
+
+def test_slots_root():
+    root = delayed([3, 1, 2], tags={'a': 1}, env={'NEURTU_TEST': 'true'},
+                   work={'items': 3})
+    obj = root.copy().sort()
+    assert not hasattr(obj, '__dict__')
+    assert obj._Delayed__root is root
+    assert obj.get_tags() is root.get_tags()
+    assert obj.get_env() == {'NEURTU_TEST': 'true'}
+    assert obj.get_work() == {'items': 3}
+
+
+def test_precompute():
+    calls = []
+
+    def load(n):
+        calls.append(n)
+        return list(range(n))
+
+    data = precompute(delayed(load)(3))
+    obj = data[-1]
+    # computed with each evaluation, until it is precomputed
+    assert obj.compute() == 2
+    assert calls == [3]
+    data._precompute()
+    assert obj.compute() == 2
+    assert data[0].compute() == 0
+    assert calls == [3, 3]
+    assert obj._precomputed_nodes() == [data]
+    # precomputed values are not pickled
+    node = precompute(delayed(sorted)([2, 1]))
+    node._precompute()
+    node2 = pickle.loads(pickle.dumps(node))
+    assert node2._Delayed__value is _MISSING
+    assert node2.compute() == [1, 2]
+    data._release()
+    assert obj.compute() == 2
+    assert calls == [3, 3, 3]
+
+    with pytest.raises(ValueError):
+        precompute([1, 2])
@@ -0,0 +1,100 @@
+# neurtu, BSD 3 clause license
+# Authors: Roman Yurchak
+
+import json
+import socket
+
+import pytest
+
+from neurtu import Benchmark, delayed
+from neurtu.events import JSONLinesEmitter, PrometheusEmitter, StatsdEmitter
+
+
+def _raise_error():
+    raise ValueError('some error')
+
+
+def test_benchmark_events():
+    events = []
+    bench = Benchmark(wall_time=True, peak_memory=True, events=[events.append])
+    bench(delayed(sum, tags={'N': N})(range(N)) for N in [10, 20])
+
+    assert [ev['event'] for ev in events[:5]] == [
+        'case_started', 'calibration_done', 'measurement', 'measurement',
+        'case_finished']
+    assert events[0]['tags'] == {'N': 10}
+    assert events[1]['number'] > 1
+    assert events[2]['metric'] == 'wall_time'
+    assert events[3]['metric'] == 'peak_memory'
+    assert events[4]['duration'] > 0
+    assert events[5]['tags'] == {'N': 20}
+    assert all(ev['time'] <= events[-1]['time'] for ev in events)
+
+    events[:] = []
+    with pytest.raises(ValueError):
+        bench(delayed(_raise_error)())
+    assert [ev['event'] for ev in events] == ['case_started', 'error']
+    assert 'some error' in events[-1]['error']
+
+
+def test_isolated_executor_events():
+    events = []
+    bench = Benchmark(wall_time=True, timeout=10, events=[events.append])
+    bench([delayed(sum, tags={'case': 'ok'})(range(10)),
+           delayed(_raise_error, tags={'case': 'error'})()])
+    assert [ev['event'] for ev in events] == [
+        'case_started', 'measurement', 'case_finished',
+        'case_started', 'error']
+
+
+def test_emitter_failure():
+    def emitter(event):
+        raise IOError('disk full')
+
+    with pytest.warns(UserWarning, match='disk full'):
+        Benchmark(events=[emitter])(delayed(sum)(range(10)))
+
+
+def test_jsonl_emitter(tmpdir):
+    path = str(tmpdir.join('events.jsonl'))
+    Benchmark(events=[JSONLinesEmitter(path)])(
+        delayed(sum, tags={'N': 10})(range(10)))
+    with open(path) as fh:
+        events = [json.loads(line) for line in fh]
+    assert events[0]['event'] == 'case_started'
+    assert events[0]['tags'] == {'N': 10}
+    assert events[-1]['event'] == 'case_finished'
+
+
+def test_prometheus_emitter(tmpdir):
+    path = str(tmpdir.join('neurtu.prom'))
+    bench = Benchmark(events=[PrometheusEmitter(path,
+                                                labels={'job': 'test'})])
+    bench(delayed(sum, tags={'N': N})(range(N)) for N in [10, 20])
+    with open(path) as fh:
+        content = fh.read()
+    assert 'neurtu_events_total{job="test",event="case_finished"} 2' \
+        in content
+    assert 'neurtu_cases_in_progress{job="test"} 0' in content
+    assert 'neurtu_measurement{job="test",metric="wall_time"}' in content
+
+
+def test_statsd_emitter():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', 0))
+    sock.settimeout(5)
+    emitter = StatsdEmitter(port=sock.getsockname()[1], prefix='bench')
+    try:
+        Benchmark(events=[emitter])(delayed(sum)(range(10)))
+        packets = set()
+        while not any(packet.endswith('|ms') for packet in packets):
+            packets.add(sock.recv(1024).decode('utf-8'))
+    finally:
+        emitter.close()
+        sock.close()
+    assert 'bench.case_started:1|c' in packets
+    assert 'bench.case_finished:1|c' in packets
+    assert any(packet.startswith('bench.wall_time:') and
+               packet.endswith('|g') for packet in packets)
+    assert any(packet.startswith('bench.case_duration:') and
+               packet.endswith('|ms') for packet in packets)
@@ -0,0 +1,191 @@
+# neurtu, BSD 3 clause license
+# Authors: Roman Yurchak
+
+import os
+import subprocess
+import sys
+from time import sleep
+
+import pytest
+
+from neurtu import Benchmark, delayed
+from neurtu.compare import speedup_table
+from neurtu.executors import RemoteExecutor, _Scheduler, serve
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+
+AUTHKEY = b'test-secret'
+
+
+@pytest.fixture
+def workers():
+    procs, hosts = [], []
+    for _ in range(2):
+        proc = subprocess.Popen(
+            [sys.executable, '-m', 'neurtu', 'worker', '--heartbeat', '0.1',
+             '--authkey', AUTHKEY.decode('utf-8')],
+            stdout=subprocess.PIPE, cwd=ROOT_DIR, universal_newlines=True)
+        line = proc.stdout.readline()
+        assert line.startswith('neurtu worker listening on')
+        hosts.append(line.split()[-1])
+        procs.append(proc)
+    yield hosts
+    for proc in procs:
+        proc.kill()
+        proc.wait()
+        proc.stdout.close()
+
+
+def _crash_once(path):
+    if not os.path.exists(path):
+        open(path, 'w').close()
+        os._exit(1)
+
+
+def test_scheduler_longest_first():
+    cases = [delayed(sleep, work={'items': N})(0) for N in [1, 3, 2]]
+    scheduler = _Scheduler(cases, lambda obj: obj.get_work()['items'], 1)
+    order = []
+    while True:
+        item = scheduler.get()
+        if item is None:
+            break
+        order.append(item[1])
+        scheduler.done(item[1], {})
+    assert order == [1, 2, 0]
+
+
+def test_remote_executor(workers):
+    bench = Benchmark(wall_time=True,
+                      executor=RemoteExecutor(workers, authkey=AUTHKEY),
+                      repeat=2, aggregate=False)
+    res = bench(delayed(sleep, tags={'N': N})(0.05) for N in range(6))
+    assert res['N'] == list(range(6)) * 2
+    assert res['runid'] == [0] * 6 + [1] * 6
+    assert set(res['host']) == set(workers)
+    assert min(res['wall_time']) > 0.04
+
+
+def test_remote_executor_requeue(workers, tmpdir):
+    path = str(tmpdir.join('crashed'))
+    bench = Benchmark(wall_time=True,
+                      executor=RemoteExecutor(workers, authkey=AUTHKEY))
+    res = bench([delayed(sleep, tags={'N': N})(0.05) for N in range(4)] +
+                [delayed(_crash_once, tags={'N': 4})(path)])
+    assert os.path.exists(path)
+    assert res['N'] == list(range(5))
+    assert res[4]['host'] in workers
+
+
+def test_remote_executor_errors(workers):
+    bench = Benchmark(wall_time=True,
+                      executor=RemoteExecutor(workers, authkey=AUTHKEY))
+    with pytest.raises(RuntimeError, match='ZeroDivisionError'):
+        bench(delayed(divmod)(1, 0))
+
+    bench = Benchmark(wall_time=True,
+                      executor=RemoteExecutor(['127.0.0.1:1'],
+                                              authkey=AUTHKEY))
+    with pytest.raises(RuntimeError, match='All workers died'):
+        bench(delayed(sleep)(0))
+
+
+def test_remote_authkey_required(workers, monkeypatch):
+    monkeypatch.delenv('NEURTU_AUTHKEY', raising=False)
+    with pytest.raises(ValueError, match='authentication key is required'):
+        RemoteExecutor(workers)
+    with pytest.raises(ValueError, match='authentication key is required'):
+        serve(host='0.0.0.0')
+
+    env = dict(os.environ)
+    env.pop('NEURTU_AUTHKEY', None)
+    proc = subprocess.Popen([sys.executable, '-m', 'neurtu', 'worker'],
+                            stderr=subprocess.PIPE, cwd=ROOT_DIR, env=env,
+                            universal_newlines=True)
+    _, err = proc.communicate()
+    assert proc.returncode != 0
+    assert 'authentication key is required' in err
+
+    # clients with a different key are rejected
+    bench = Benchmark(wall_time=True,
+                      executor=RemoteExecutor(workers, authkey=b'other'))
+    with pytest.raises(RuntimeError, match='Authentication with .* failed'):
+        bench(delayed(sleep)(0))
+
+
+def _allocate(size):
+    return bytearray(size * 1024**2)
+
+
+def _raise_error():
+    raise ValueError('some error')
+
+
+def test_isolated_executor():
+    pytest.importorskip('resource')
+    bench = Benchmark(wall_time=True, timeout=2, memory_limit=200)
+    res = bench([delayed(sleep, tags={'case': 'ok'})(0.01),
+                 delayed(sleep, tags={'case': 'timeout'})(10),
+                 delayed(_allocate, tags={'case': 'memory'})(1000),
+                 delayed(_raise_error, tags={'case': 'error'})()])
+    assert res['case'] == ['ok', 'timeout', 'memory', 'error']
+    assert res['status'] == ['ok', 'timeout', 'memory_error', 'error']
+    assert res['wall_time'][0] > 0
+    assert res['error'][0] is None
+    assert res['error'][3] == 'ValueError: some error'
+    assert res[1]['wall_time'] != res[1]['wall_time']  # NaN
+
+    with pytest.raises(ValueError, match='cannot be used with a custom'):
+        Benchmark(timeout=1,
+                  executor=RemoteExecutor(['127.0.0.1:1'], authkey=AUTHKEY))
+
+
+def test_isolated_executor_shared_inputs():
+    np = pytest.importorskip('numpy')
+    X = np.ones((1000, 1000))
+    bench = Benchmark(wall_time=True, timeout=10, memory_limit=4,
+                      to_dataframe=False)
+    # X[:N] are passed in shared memory, below the memory limit
+    res = bench(delayed(np.sum, tags={'N': N})(X[:N]) for N in [10, 1000])
+    assert [row['status'] for row in res] == ['ok', 'ok']
+
+
+def test_environment_executor():
+    bench = Benchmark(wall_time=True, environments={'a': sys.executable,
+                                                    'b': sys.executable},
+                      repeat=2, aggregate=False)
+    res = bench(delayed(sum, tags={'N': N})(range(N)) for N in [10, 100])
+    assert res.index == ['N', 'environment', 'runid']
+    assert len(res) == 8
+    assert list(res['environment'][:4]) == ['a', 'b', 'a', 'b']
+    assert list(res['runid']) == [0] * 4 + [1] * 4
+    assert set(res['python']) == {'%s.%s.%s' % sys.version_info[:3]}
+
+    table = speedup_table(res)
+    assert table.index == ['N']
+    assert table.columns == ['N', 'a', 'b']
+    assert list(table['a']) == [1.0, 1.0]
+
+    with pytest.raises(RuntimeError, match='some error'):
+        bench(delayed(_raise_error)())
+
+    with pytest.raises(ValueError, match='No Python interpreter'):
+        Benchmark(environments=[ROOT_DIR])
+
+
+def _result(obj):
+    return obj.compute()
+
+
+def _pythonpath():
+    return os.environ.get('PYTHONPATH')
+
+
+def test_environment_executor_pythonpath():
+    bench = Benchmark(environments=[sys.executable], result=_result)
+    res = bench(delayed(_pythonpath)())
+    path = res['result'].split(os.pathsep)[0]
+    # only the neurtu package is exposed, in a removed temporary directory
+    assert path != ROOT_DIR
+    assert not os.path.exists(path)
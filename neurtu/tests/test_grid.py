@@ -0,0 +1,72 @@
+# neurtu, BSD 3 clause license
+# Authors: Roman Yurchak
+
+import pytest
+
+from neurtu import Benchmark, grid
+
+
+def _sum_slice(X, N, solver):
+    return sum(X[:N])
+
+
+def test_grid_memoized_inputs():
+    calls = []
+
+    def make_X(N):
+        calls.append(N)
+        return list(range(N))
+
+    cases = grid(_sum_slice, N=[10, 20, 30], solver=['a', 'b', 'c'],
+                 inputs={'X': make_X})
+    assert len(cases) == 9
+    assert cases.tag_names == ['N', 'solver']
+    res = [obj.compute() for obj in cases]
+    assert res == [45] * 3 + [190] * 3 + [435] * 3
+    assert calls == [10, 20, 30]
+    assert cases.cache.n_misses == 3
+
+
+def test_grid_max_bytes():
+    np = pytest.importorskip('numpy')
+
+    def make_X(N):
+        return np.ones(N)
+
+    cases = grid(lambda X, solver: X.sum(), N=[1000, 2000],
+                 solver=['a', 'b'], inputs={'X': make_X}, max_bytes=20000)
+    res = Benchmark(wall_time=True, repeat=2, aggregate=False)(cases)
+    assert res.index == ['N', 'solver', 'runid']
+    assert res['N'] == [1000, 1000, 2000, 2000] * 2
+    assert res['runid'] == [0] * 4 + [1] * 4
+    # only one input fits in the cache, so inputs are generated again
+    # for the second run
+    assert cases.cache.n_misses == 4
+    assert cases.cache.nbytes <= 20000
+
+    # inputs larger than the budget are not memoized
+    cases = grid(lambda X, solver: X.sum(), N=[1000, 4000],
+                 solver=['a', 'b'], inputs={'X': make_X}, max_bytes=20000)
+    [obj.compute() for obj in cases]
+    assert cases.cache.n_misses == 3
+    assert cases.cache.nbytes == 8000
+    assert len(cases.cache.data) == 1
+
+
+def test_grid_kwargs():
+    cases = grid(lambda **kwargs: sorted(kwargs), a=[1], b=[2],
+                 inputs={'c': lambda: 3})
+    assert [obj.compute() for obj in cases] == [['a', 'b', 'c']]
+
+
+def test_grid_errors():
+    with pytest.raises(ValueError, match='should be a list of values'):
+        grid(sum, N=10)
+    with pytest.raises(ValueError, match='is not a grid parameter'):
+        grid(sum, N=[10], inputs={'X': lambda M: M})
+    with pytest.raises(ValueError, match='conflicts with a parameter'):
+        grid(sum, N=[10], inputs={'N': lambda: 1})
+    with pytest.raises(ValueError, match='are not unique'):
+        grid(sum, N=[10, 20, 10])
+    with pytest.raises(ValueError, match='are not unique'):
+        grid(sum, X=[[1], [1]])
@@ -0,0 +1,110 @@
+# neurtu, BSD 3 clause license
+# Authors: Roman Yurchak
+
+import random
+import subprocess
+import sys
+
+import pytest
+
+from neurtu import ResultSet
+from neurtu.history import (detect_changes, history_report, pelt,
+                            time_series)
+from neurtu.store import ResultStore
+
+
+def test_pelt():
+    rng = random.Random(0)
+    values = [1 + rng.gauss(0, 0.01) for _ in range(20)] + \
+        [1.1 + rng.gauss(0, 0.01) for _ in range(20)]
+    assert pelt(values) == [20]
+    assert pelt(values[:20]) == []
+    assert pelt([1, 1, 2, 2, 1, 1]) == [2, 4]
+    assert pelt([1, 1, 1, 2], min_size=3) == []
+    assert pelt([1, 1, 1, 2], min_size=1) == [3]
+    assert pelt([]) == []
+    # a higher penalty finds fewer changepoints
+    assert pelt(values, penalty=1e6) == []
+    with pytest.raises(ValueError, match='min_size'):
+        pelt(values, min_size=0)
+
+
+def test_pelt_noise():
+    # no changes are detected in noise
+    rng = random.Random(42)
+    values = [1 + rng.gauss(0, 0.01) for _ in range(30)]
+    assert pelt(values) == []
+    n_false = 0
+    for _ in range(100):
+        values = [1 + rng.gauss(0, 0.01) for _ in range(20)]
+        n_false += bool(pelt(values))
+    assert n_false <= 10
+
+
+@pytest.fixture
+def store(tmpdir):
+    """Store with 12 runs of 2 cases, where the 'slow' case regresses by
+    20% at the 8th run"""
+    store = ResultStore(str(tmpdir.join('store')))
+    rng = random.Random(0)
+    for run in range(12):
+        columns = {'algo': [], 'wall_time': []}
+        for algo in ['fast', 'slow']:
+            mean = 1.2 if algo == 'slow' and run >= 8 else 1.0
+            for _ in range(5):
+                columns['algo'].append(algo)
+                columns['wall_time'].append(mean + rng.gauss(0, 0.01))
+        metadata = {'timestamp': '2024-01-%02dT00:00:00Z' % (run + 1),
+                    'git': {'sha': '%040x' % run, 'dirty': run == 11}}
+        store.append(ResultSet(columns, index=['algo'], metadata=metadata))
+    return store
+
+
+def test_time_series(store):
+    series = time_series(store, algo='slow')
+    assert series.index == ['algo', 'run']
+    assert list(series['run']) == list(range(12))
+    assert series['commit'][0] == '0' * 40
+    assert series['commit'][11] == '%040x' % 11 + '+dirty'
+    assert series['date'][1] == '2024-01-02T00:00:00Z'
+    assert series['wall_time'][9] == pytest.approx(1.2, rel=0.05)
+
+
+def test_detect_changes(store):
+    changes = detect_changes(store)
+    assert changes.to_records() == [
+        {'algo': 'slow', 'run': 8, 'commit': '%040x' % 8,
+         'date': '2024-01-09T00:00:00Z', 'before': changes['before'][0],
+         'after': changes['after'][0], 'change': changes['change'][0],
+         'kind': 'regression'}]
+    assert changes['change'][0] == pytest.approx(0.2, abs=0.02)
+
+    assert len(detect_changes(store, min_change=0.5)) == 0
+    assert len(detect_changes(store, algo='fast')) == 0
+
+
+def test_history_report(store, tmpdir):
+    path = str(tmpdir.join('report.html'))
+    changes = history_report(store, path)
+    assert len(changes) == 1
+    report = tmpdir.join('report.html').read()
+    assert report.startswith('<!DOCTYPE html>')
+    assert report.count('<svg') == 2
+    assert 'algo=slow' in report
+    assert 'regression' in report
+    assert '%010x' % 8 in report
+
+
+def test_history_cli(store, tmpdir):
+    path = str(tmpdir.join('report.html'))
+    out = subprocess.check_output(
+        [sys.executable, '-m', 'neurtu', 'history', store.path,
+         '--output', path]).decode('utf-8')
+    assert 'regression' in out
+    assert 'Report written to' in out
+    assert tmpdir.join('report.html').check()
+
+    out = subprocess.check_output(
+        [sys.executable, '-m', 'neurtu', 'history', store.path,
+         '--min-change', '0.5']).decode('utf-8')
+    assert 'No changes detected in 12 runs' in out
@@ -0,0 +1,162 @@
+# neurtu, BSD 3 clause license
+# Authors: Roman Yurchak
+
+import importlib
+import sys
+
+import pytest
+
+from neurtu import Benchmark, delayed
+from neurtu.incremental import (IncrementalCache, fingerprint,
+                                trace_dependencies)
+
+
+@pytest.fixture
+def modules(tmpdir, monkeypatch):
+    """Two modules under test, with a shared helper module"""
+    tmpdir.join('helpers.py').write('def double(x):\n    return 2 * x\n')
+    tmpdir.join('mod_a.py').write(
+        'from helpers import double\n\n'
+        'def func_a(x):\n    return double(x)\n')
+    tmpdir.join('mod_b.py').write('def func_b(x):\n    return x + 1\n')
+    monkeypatch.syspath_prepend(str(tmpdir))
+    yield tmpdir
+    for name in ['helpers', 'mod_a', 'mod_b']:
+        sys.modules.pop(name, None)
+
+
+def _cases():
+    mod_a = importlib.import_module('mod_a')
+    mod_b = importlib.import_module('mod_b')
+    return [delayed(mod_a.func_a, tags={'func': 'a', 'N': N})(N)
+            for N in [1, 2]] + \
+        [delayed(mod_b.func_b, tags={'func': 'b', 'N': 1})(1)]
+
+
+def test_trace_dependencies(modules):
+    deps = trace_dependencies(_cases()[0])
+    assert deps == {str(modules.join('mod_a.py')): ['func_a'],
+                    str(modules.join('helpers.py')): ['double']}
+
+
+def test_incremental(modules):
+    path = str(modules.join('cache.json'))
+    calls = []
+
+    def metric(obj):
+        calls.append(obj.get_tags())
+        return obj.compute()
+
+    bench = Benchmark(progress_bar=False, metadata=False, incremental=path,
+                      result=metric)
+    res = bench(_cases())
+    assert len(calls) == 3
+    assert res.metadata['incremental']['measured'] == 3
+    assert list(res['result']) == [2, 4, 2]
+
+    # nothing changed
+    del calls[:]
+    res = bench(_cases())
+    assert calls == []
+    assert res.metadata['incremental']['reused'] == 3
+    assert list(res['result']) == [2, 4, 2]
+
+    # a dependency of the a cases changed
+    modules.join('helpers.py').write('def double(x):\n    return x + x\n')
+    res = bench(_cases())
+    assert calls == [{'func': 'a', 'N': 1}, {'func': 'a', 'N': 2}]
+    assert res.metadata['incremental'] == {'path': path, 'reused': 1,
+                                           'measured': 2}
+    assert list(res['result']) == [2, 4, 2]
+    assert list(res['func']) == ['a', 'a', 'b']
+
+    # the benchmark parameters changed
+    del calls[:]
+    bench = Benchmark(progress_bar=False, metadata=False, incremental=path,
+                      result=metric, repeat=2, aggregate=False)
+    res = bench(_cases())
+    assert len(calls) == 6
+    res = bench(_cases())
+    assert len(calls) == 6
+    assert list(res['runid']) == [0, 0, 0, 1, 1, 1]
+
+    # the arguments of a case changed, with the same tags
+    del calls[:]
+    bench = Benchmark(progress_bar=False, metadata=False, incremental=path,
+                      result=metric)
+    bench(_cases())
+    cases = _cases()
+    cases[2] = delayed(importlib.import_module('mod_b').func_b,
+                       tags={'func': 'b', 'N': 1})(2)
+    del calls[:]
+    res = bench(cases)
+    assert calls == [{'func': 'b', 'N': 1}]
+    assert list(res['result']) == [2, 4, 3]
+
+    # results that cannot be stored in JSON are not cached
+    bench = Benchmark(progress_bar=False, metadata=False, incremental=path,
+                      result=lambda obj: object())
+    bench(_cases())
+    assert IncrementalCache(
+        path, bench._incremental_config(1, _cases())).entries == {}
+
+    with pytest.raises(ValueError, match='default local executor'):
+        Benchmark(incremental=path, timeout=10)
+
+
+def test_incremental_environment(tmpdir, monkeypatch):
+    from neurtu import metadata
+    path = str(tmpdir.join('cache.json'))
+    bench = Benchmark(progress_bar=False, metadata=False, incremental=path)
+    # builtins have no source file to trace
+    cases = [delayed(sorted, tags={'N': N})(range(N)) for N in [10, 100]]
+    bench(cases)
+    res = bench(cases)
+    assert res.metadata['incremental']['reused'] == 2
+
+    # cached results are not reused on another host or interpreter
+    static = metadata._static_metadata().copy()
+    static['hostname'] = 'other-host'
+    monkeypatch.setattr(metadata, '_STATIC_METADATA', static)
+    res = bench(cases)
+    assert res.metadata['incremental']['measured'] == 2
+    res = bench(cases)
+    assert res.metadata['incremental']['reused'] == 2
+    monkeypatch.setattr(sys, 'version', sys.version + ' other')
+    res = bench(cases)
+    assert res.metadata['incremental']['measured'] == 2
+
+    # or with other versions of the packages under test
+    np = pytest.importorskip('numpy')
+    cases = [delayed(np.sort, tags={'N': N})(np.arange(N))
+             for N in [10, 100]]
+    bench(cases)
+    monkeypatch.setattr('importlib.metadata.version',
+                        lambda name: '0.0.1')
+    res = bench(cases)
+    assert res.metadata['incremental']['measured'] == 2
+
+
+def test_fingerprint():
+    np = pytest.importorskip('numpy')
+    X = np.zeros(10000)
+    assert fingerprint(delayed(np.sum)(X)) == fingerprint(delayed(np.sum)(X))
+    Y = X.copy()
+    Y[5000] = 1
+    assert fingerprint(delayed(np.sum)(X)) != fingerprint(delayed(np.sum)(Y))
+    assert fingerprint(delayed(np.sum)(X)) != fingerprint(delayed(np.max)(X))
+    # default object representations contain memory addresses
+    assert fingerprint(delayed(id)(object())) == \
+        fingerprint(delayed(id)(object()))
+
+
+def test_incremental_cache(tmpdir):
+    path = str(tmpdir.join('cache.json'))
+    tmpdir.join('cache.json').write('not json')
+    cache = IncrementalCache(path, config='a')
+    assert cache.entries == {}
+    cache.entries['key'] = {'hashes': {str(tmpdir.join('missing')): 'x'},
+                            'functions': {}, 'runs': [[{'a': 1}]]}
+    cache.save()
+    assert not IncrementalCache(path, config='a').is_fresh('key')
+    assert IncrementalCache(path, config='b').entries == {}
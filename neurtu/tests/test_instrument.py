@@ -0,0 +1,84 @@
+# neurtu, BSD 3 clause license
+# Authors: Roman Yurchak
+
+import threading
+import tracemalloc
+
+import pytest
+
+from neurtu import instrument
+
+
+def test_instrument_decorator():
+    metrics = instrument(tags={'model': 'a'}, cpu_time=True,
+                         traced_memory=True)
+
+    @metrics
+    def allocate(n):
+        return bytearray(n * 1024**2)
+
+    for n in [1, 2]:
+        allocate(n)
+    assert allocate.__name__ == 'allocate'
+
+    res = metrics.flush()
+    assert res.index == ['model', 'function']
+    assert res.columns == ['model', 'function', 'wall_time', 'cpu_time',
+                           'traced_memory', 'timestamp']
+    assert list(res['function']) == ['test_instrument_decorator.'
+                                     '<locals>.allocate'] * 2
+    assert res['traced_memory'][1] == pytest.approx(2, rel=0.1)
+    assert all(val >= 0 for val in res['wall_time'])
+    # buffers are cleared
+    assert len(metrics.flush()) == 0
+    # tracemalloc is stopped, as it was not tracing before
+    assert not tracemalloc.is_tracing()
+    tracemalloc.start()
+    try:
+        allocate(1)
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+
+
+def test_instrument_sampling_threads():
+    metrics = instrument(sample=5)
+
+    @metrics
+    def func():
+        pass
+
+    def run():
+        for _ in range(50):
+            func()
+
+    threads = [threading.Thread(target=run) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(metrics._buffers) == 4
+    res = metrics.flush()
+    assert len(res) == 4 * 10
+    assert list(res['timestamp']) == sorted(res['timestamp'])
+    # buffers of finished threads are dropped once flushed
+    assert metrics._buffers == []
+    func()
+    assert len(metrics.flush()) == 1
+    assert len(metrics._buffers) == 1
+
+
+def test_instrument_context_manager():
+    metrics = instrument(tags={'step': 'fit'}, buffer_size=3)
+    for _ in range(5):
+        with metrics:
+            with metrics:
+                pass
+    res = metrics.flush()
+    assert len(res) == 3
+    assert res.index == ['step']
+    assert res.groupby('step').agg('count')['wall_time'][0] == 3
+
+    with pytest.raises(ValueError, match='positive'):
+        instrument(sample=0)
@@ -0,0 +1,130 @@
+# neurtu, BSD 3 clause license
+# Authors: Roman Yurchak
+
+import json
+import os
+import subprocess
+
+import pytest
+
+from neurtu import Benchmark, delayed, grid
+from neurtu import metadata as metadata_module
+from neurtu.metadata import (collect_metadata, git_commit, package_versions,
+                             threadpools, _code_under_test)
+
+
+def test_collect_metadata():
+    metadata = collect_metadata(['pytest'])
+    for key in ['neurtu_version', 'hostname', 'platform', 'cpu', 'memory',
+                'python', 'timestamp', 'packages', 'threadpools', 'git']:
+        assert key in metadata
+    assert metadata['cpu']['n_threads'] == os.cpu_count()
+    assert metadata['python']['version']
+    assert metadata['packages']['pytest'] == pytest.__version__
+    # can be stored as JSON
+    json.dumps(metadata)
+
+    # static metadata is cached, but not shared between runs
+    metadata['cpu']['model'] = 'other'
+    assert collect_metadata()['cpu']['model'] != 'other'
+
+
+def test_package_versions():
+    versions = package_versions(['pytest', '_pytest', 'builtins',
+                                 '__main__', 'not_a_package'])
+    assert versions['pytest'] == pytest.__version__
+    # version of the distribution providing the package
+    assert versions['_pytest'] == pytest.__version__
+    assert 'builtins' not in versions
+    assert 'not_a_package' not in versions
+
+
+def test_package_versions_old_python(monkeypatch):
+    # packages_distributions is not available with Python < 3.10
+    from importlib import metadata as importlib_metadata
+    monkeypatch.delattr(importlib_metadata, 'packages_distributions',
+                        raising=False)
+    monkeypatch.setattr(metadata_module, '_DISTRIBUTIONS', None)
+    versions = package_versions(['pytest'])
+    assert versions['pytest'] == pytest.__version__
+
+
+def test_threadpools(monkeypatch):
+    monkeypatch.setenv('OMP_NUM_THREADS', '2')
+    info = threadpools()
+    assert isinstance(info['libraries'], list)
+    assert info['env'] == {'OMP_NUM_THREADS': '2'}
+
+
+def test_git_commit(tmpdir, monkeypatch):
+    monkeypatch.setattr(metadata_module, '_GIT_TOPLEVELS', {})
+    monkeypatch.setattr(metadata_module, '_GIT_COMMITS', {})
+    assert git_commit(str(tmpdir)) is None
+    try:
+        subprocess.check_call(['git', 'init', '-q', str(tmpdir)])
+    except (OSError, subprocess.CalledProcessError):
+        pytest.skip('git is not available')
+    # the lookup is cached
+    assert git_commit(str(tmpdir)) is None
+    metadata_module._GIT_TOPLEVELS.clear()
+    tmpdir.join('a.py').write('a = 1\n')
+    subprocess.check_call(
+        ['git', '-c', 'user.name=a', '-c', 'user.email=a@a', 'commit', '-q',
+         '--allow-empty', '-m', 'init'], cwd=str(tmpdir))
+    commit = git_commit(str(tmpdir))
+    assert len(commit['sha']) == 40
+    assert not commit['dirty']
+    assert git_commit(str(tmpdir), toplevel=True) == commit
+
+    # e.g. a site-packages directory inside a repository
+    subdir = tmpdir.mkdir('lib').mkdir('site-packages')
+    assert git_commit(str(subdir)) == commit
+    assert git_commit(str(subdir), toplevel=True) is None
+    assert git_commit(str(tmpdir.mkdir('src')), toplevel=True) == commit
+
+    # git is only called once per repository
+    calls = []
+    check_output = subprocess.check_output
+
+    def counting_check_output(*args, **kwargs):
+        calls.append(args[0])
+        return check_output(*args, **kwargs)
+
+    monkeypatch.setattr(subprocess, 'check_output', counting_check_output)
+    assert git_commit(str(tmpdir)) == commit
+    assert git_commit(str(tmpdir), toplevel=True) == commit
+    assert calls == []
+
+    # code under test outside of the top level of a repository
+    assert collect_metadata(path=str(subdir))['git'] is None
+
+
+def test_code_under_test():
+    cases = [delayed(json.dumps, tags={'N': 1})([1]),
+             delayed(delayed(pytest.approx)(1), tags={'N': 2}),
+             delayed(os.path, tags={'N': 3}).join('a', 'b')]
+    packages, path = _code_under_test(cases)
+    assert packages == ['json', '_pytest', 'posixpath']
+    # directory from which the json package is imported
+    assert path == os.path.dirname(os.path.dirname(json.__file__))
+
+    packages, _ = _code_under_test(grid(json.dumps, obj=[1]))
+    assert packages == ['json']
+
+
+def test_benchmark_metadata():
+    cases = [delayed(json.dumps, tags={'N': N})([1] * N) for N in [1, 2]]
+    bench = Benchmark(wall_time=True, progress_bar=False)
+    res = bench(cases)
+    assert res.metadata['packages']['json']
+    assert res.metadata['cpu'] is not None
+
+    pd = pytest.importorskip('pandas')
+    df = Benchmark(wall_time=True, progress_bar=False, repeat=2,
+                   to_dataframe=True)(cases)
+    assert isinstance(df, pd.DataFrame)
+    assert df.attrs['python'] == res.metadata['python']
+
+    res = Benchmark(wall_time=True, progress_bar=False,
+                    metadata=False)(cases)
+    assert res.metadata == {}
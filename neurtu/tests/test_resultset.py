@@ -0,0 +1,111 @@
+# neurtu, BSD 3 clause license
+# Authors: Roman Yurchak
+
+import math
+from array import array
+
+import pytest
+from pytest import approx
+
+from neurtu.resultset import ResultSet
+
+
+def make_resultset():
+    return ResultSet.from_records(
+        [{'N': N, 'solver': solver, 'runid': runid,
+          'wall_time': N * (runid + 1) * (2 if solver == 'b' else 1)}
+         for N in [10, 100] for solver in ['a', 'b'] for runid in range(3)],
+        index=['N', 'solver', 'runid'])
+
+
+def test_resultset_columns():
+    res = make_resultset()
+    assert len(res) == 12
+    assert res.columns == ['N', 'solver', 'runid', 'wall_time']
+    assert res.metrics == ['wall_time']
+    assert isinstance(res['wall_time'], array)
+    assert res['N'][:3] == [10, 10, 10]
+    assert res[0] == {'N': 10, 'solver': 'a', 'runid': 0,
+                      'wall_time': 10.0}
+    assert res[-1]['wall_time'] == 600.0
+    assert [row['runid'] for row in res][:4] == [0, 1, 2, 0]
+
+    with pytest.raises(ValueError, match='same length'):
+        ResultSet({'a': [1, 2], 'b': [1]})
+    with pytest.raises(ValueError, match='Index column c not found'):
+        ResultSet({'a': [1, 2]}, index=['c'])
+
+
+def test_resultset_missing_values():
+    res = ResultSet.from_records([{'a': 1, 'b': 2.0}, {'a': 2}],
+                                 index=['a'])
+    assert math.isnan(res['b'][1])
+    assert res.agg('count')['b'][0] == 1
+
+
+def test_resultset_filter():
+    res = make_resultset()
+    assert len(res.filter(solver='a')) == 6
+    assert len(res.filter(solver='a', N=10)) == 3
+    assert len(res.filter(lambda row: row['wall_time'] > 100)) == 5
+    with pytest.raises(ValueError, match='Column other not found'):
+        res.filter(other=1)
+
+
+def test_resultset_groupby():
+    res = make_resultset()
+    agg = res.groupby(['N', 'solver']).agg(['mean', 'median', 'std',
+                                            'min', 'max', 'p75'])
+    assert agg.index == ['N', 'solver']
+    assert len(agg) == 4
+    row = agg.filter(N=100, solver='b')[0]
+    assert row[('wall_time', 'mean')] == approx(400)
+    assert row[('wall_time', 'median')] == approx(400)
+    assert row[('wall_time', 'std')] == approx(200)
+    assert row[('wall_time', 'min')] == approx(200)
+    assert row[('wall_time', 'max')] == approx(600)
+    assert row[('wall_time', 'p75')] == approx(500)
+
+    mean = res.groupby('solver').mean()
+    assert mean.columns == ['solver', 'wall_time']
+    assert list(mean['wall_time']) == approx([110, 220])
+    assert list(res.groupby('solver').percentile(50)['wall_time']) == \
+        approx([65, 130])
+
+    groups = dict(res.groupby('N'))
+    assert set(groups) == {(10,), (100,)}
+    assert len(groups[(10,)]) == 6
+
+    with pytest.raises(ValueError, match='not a supported aggregation'):
+        res.groupby('N').agg(['other'])
+
+
+def test_resultset_to_pandas():
+    pd = pytest.importorskip('pandas')
+    res = make_resultset()
+    df = res.to_pandas()
+    assert isinstance(df, pd.DataFrame)
+    assert df.index.names == ['N', 'solver', 'runid']
+    assert list(df.columns) == ['wall_time']
+
+    df = res.groupby(['N', 'solver']).agg(['mean', 'max']).to_pandas()
+    assert isinstance(df.columns, pd.MultiIndex)
+    assert df.loc[(100, 'b'), ('wall_time', 'max')] == 600
+
+
+def test_resultset_to_numpy():
+    np = pytest.importorskip('numpy')
+    res = make_resultset()
+    X = res.to_numpy('wall_time')
+    assert isinstance(X, np.ndarray)
+    # zero copy
+    X[0] = -1
+    assert res['wall_time'][0] == -1
+
+
+def test_resultset_to_arrow():
+    pa = pytest.importorskip('pyarrow')
+    res = make_resultset().groupby('N').agg(['mean'])
+    table = res.to_arrow()
+    assert isinstance(table, pa.Table)
+    assert table.column_names == ['N', 'wall_time.mean']
@@ -0,0 +1,57 @@
+# neurtu, BSD 3 clause license
+# Authors: Roman Yurchak
+
+import math
+
+import pytest
+from pytest import approx
+
+from neurtu import Benchmark, delayed
+from neurtu.roofline import machine_peaks, throughput
+
+
+def test_throughput():
+    res = throughput({'flops': 1e9, 'items': 10, 'rows': 5}, 0.5)
+    assert res == approx({'gflops': 2.0, 'items_per_s': 20.,
+                          'rows_per_s': 10.})
+
+    peaks = {'peak_gflops': 10., 'bandwidth_gbs': 4.}
+    # memory bound
+    res = throughput({'flops': 1e9, 'bytes': 1e9}, 1.0, peaks)
+    assert res['roofline_fraction'] == approx(0.25)
+    # compute bound
+    res = throughput({'flops': 1e10, 'bytes': 1e8}, 2.0, peaks)
+    assert res['roofline_fraction'] == approx(0.5)
+    res = throughput({'bytes': 2e9}, 1.0, peaks)
+    assert res['roofline_fraction'] == approx(0.5)
+
+    # wall time below the timer resolution
+    res = throughput({'flops': 1e9, 'items': 10}, 0.0, peaks)
+    assert all(math.isnan(val) for val in res.values())
+
+
+def test_machine_peaks():
+    pytest.importorskip('numpy')
+    peaks = machine_peaks(n_flops=128, n_bytes=2**20, repeat=1)
+    assert peaks['peak_gflops'] > 0
+    assert peaks['bandwidth_gbs'] > 0
+    assert machine_peaks(n_flops=128, n_bytes=2**20, repeat=1) is peaks
+    # the cache depends on the probe parameters
+    other = machine_peaks(n_flops=64, n_bytes=2**20, repeat=1)
+    assert other is not peaks
+
+
+def test_benchmark_work():
+    peaks = {'peak_gflops': 10., 'bandwidth_gbs': 4.}
+    res = Benchmark(roofline=peaks)(
+        delayed(sum, tags={'N': N}, work=lambda tags: {'items': tags['N'],
+                                                       'flops': tags['N']})(
+            range(N)) for N in [1000, 2000])
+    assert set(res.metrics) == {'wall_time', 'items_per_s', 'gflops',
+                                'roofline_fraction'}
+    row = res[0]
+    assert row['items_per_s'] == approx(1000 / row['wall_time'])
+
+    res = Benchmark(cpu_time=True)(
+        delayed(sum, work={'items': 10})(range(10)))
+    assert 'items_per_s' not in res
@@ -0,0 +1,85 @@
+# neurtu, BSD 3 clause license
+# Authors: Roman Yurchak
+
+import json
+import subprocess
+import sys
+
+import pytest
+
+from neurtu import delayed
+from neurtu.serialize import dump, dumps, load, loads, read_header
+from neurtu.serialize import FORMAT_VERSION
+
+
+class Model(object):
+    def __init__(self, scale=1):
+        self.scale = scale
+
+    def predict(self, x):
+        return [self.scale * el for el in x]
+
+
+def test_roundtrip(tmpdir):
+    obj = delayed(Model, tags={'scale': 2}, env={'NEURTU_TEST': '1'},
+                  work={'items': 3})(scale=2).predict([1, 2, 3])
+    path = str(tmpdir.join('case.nrt'))
+    dump(obj, path)
+
+    header = read_header(path)
+    assert header['version'] == FORMAT_VERSION
+    assert header['root'] == 'neurtu.tests.test_serialize:Model'
+    assert header['tags'] == {'scale': 2}
+    assert header['repr'] == repr(obj)
+
+    obj2 = load(path)
+    assert repr(obj2) == repr(obj)
+    assert obj2.get_tags() == {'scale': 2}
+    assert obj2.get_env() == {'NEURTU_TEST': '1'}
+    assert obj2.get_work() == {'items': 3}
+    assert obj2.compute() == [2, 4, 6]
+
+
+def test_out_of_band_buffers():
+    np = pytest.importorskip('numpy')
+    X = np.arange(10**5, dtype='float64')
+    data = dumps(delayed(np.sum)(X, axis=0))
+    header = json.loads(data[17:17 + int.from_bytes(data[9:17], 'big')])
+    assert header['root'] == 'numpy:sum'
+    assert header['buffer_sizes'] == [X.nbytes]
+
+    obj = loads(bytearray(data))
+    assert obj.compute() == X.sum()
+    X2, = obj.get_args()
+    # the array data is backed by the serialized buffer
+    assert not X2.flags.owndata
+
+
+def test_errors():
+    with pytest.raises(ValueError, match='must be a Delayed'):
+        dumps([1, 2])
+    with pytest.raises(ValueError, match='Failed to serialize'):
+        dumps(delayed(lambda: None)())
+    with pytest.raises(ValueError, match='Not a neurtu case'):
+        loads(b'some data' * 3)
+    data = bytearray(dumps(delayed(sum)([1])))
+    data[8] = FORMAT_VERSION + 1
+    with pytest.raises(ValueError, match='not supported'):
+        loads(data)
+
+
+def test_replay_cli(tmpdir):
+    path = str(tmpdir.join('case.nrt'))
+    dump(delayed(sorted, tags={'N': 3})([3, 1, 2]), path)
+    out = subprocess.check_output(
+        [sys.executable, '-m', 'neurtu', 'replay', path, '--json',
+         '--metric', 'wall_time', '--metric', 'cpu_time'])
+    row, = json.loads(out.decode('utf-8'))
+    assert row['N'] == 3
+    assert row['wall_time'] > 0
+    assert 'cpu_time' in row
+
+    out = subprocess.check_output(
+        [sys.executable, '-m', 'neurtu', 'replay', path])
+    assert b'sorted' in out
+    assert b'wall_time' in out
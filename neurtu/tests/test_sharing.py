@@ -0,0 +1,72 @@
+# neurtu, BSD 3 clause license
+# Authors: Roman Yurchak
+
+import multiprocessing
+import pickle
+
+import pytest
+
+from neurtu import delayed
+from neurtu.sharing import SharedInputs, loads
+
+
+def _load_and_sum(data, queue):
+    obj = loads(data)
+    queue.put(obj.compute())
+
+
+def test_shared_inputs_subprocess():
+    np = pytest.importorskip('numpy')
+    X = np.arange(300000, dtype='float64').reshape((3000, 100))
+
+    with SharedInputs() as shared:
+        data = shared.dumps(delayed(np.sum)(X[:1000]))
+        # the array is not serialized in the pickle
+        assert len(data) < 10000
+        assert len(shared.segments) == 1
+
+        ctx = multiprocessing.get_context('spawn')
+        queue = ctx.Queue()
+        proc = ctx.Process(target=_load_and_sum, args=(data, queue))
+        proc.start()
+        res = queue.get(timeout=60)
+        proc.join()
+    assert res == X[:1000].sum()
+
+
+def test_shared_inputs_views():
+    np = pytest.importorskip('numpy')
+    X = np.random.RandomState(0).rand(2000, 100)
+
+    with SharedInputs() as shared:
+        views = [X[:10], X[5:20, ::2], X.T, X[-1]]
+        data = shared.dumps(views)
+        assert len(shared.segments) == 1
+        res = loads(data)
+        for X_ref, X_shared in zip(views, res):
+            np.testing.assert_array_equal(X_ref, X_shared)
+        del res
+
+
+def test_shared_inputs_small_arrays():
+    np = pytest.importorskip('numpy')
+    X = np.ones(10)
+    with SharedInputs() as shared:
+        data = shared.dumps(X)
+        assert not shared.segments
+    np.testing.assert_array_equal(pickle.loads(data), X)
+
+
+def test_shared_inputs_memmap(tmpdir):
+    np = pytest.importorskip('numpy')
+    path = str(tmpdir.join('X.dat'))
+    X = np.memmap(path, dtype='float64', mode='w+', shape=(1000, 200))
+    X[:] = np.arange(200)
+    X.flush()
+
+    with SharedInputs() as shared:
+        data = shared.dumps(X[10:20, 5:])
+        assert not shared.segments
+        assert len(data) < 1000
+        res = loads(data)
+    np.testing.assert_array_equal(res, X[10:20, 5:])
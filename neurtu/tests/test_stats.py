@@ -0,0 +1,82 @@
+# neurtu, BSD 3 clause license
+# Authors: Roman Yurchak
+
+import math
+
+import pytest
+from pytest import approx
+
+from neurtu import Benchmark, delayed
+from neurtu.resultset import ResultSet
+
+np = pytest.importorskip('numpy')
+
+from neurtu import stats  # noqa
+
+
+def test_robust_statistics():
+    values = [1.0, 1.1, 0.9, 1.0, 1.05, 0.95, 10.0]
+    assert stats.median(values) == approx(1.0)
+    assert stats.mad(values) == approx(0.05)
+    assert stats.trimmed_mean(values, proportion=0.2) == approx(1.02)
+    assert stats.n_outliers(values) == 1
+    assert stats.iqr_outliers(values).tolist() == [False] * 6 + [True]
+
+    assert math.isnan(stats.median([]))
+    assert stats.n_outliers([float('nan')]) == 0
+
+
+def test_bootstrap_ci():
+    rng = np.random.RandomState(42)
+    values = rng.normal(loc=1.0, scale=0.1, size=200)
+    low, high = stats.bootstrap_ci(values)
+    assert low < np.median(values) < high
+    assert high - low < 0.1
+    assert stats.bootstrap_ci(values) == (low, high)
+
+    low_mean, high_mean = stats.bootstrap_ci(values, statistic='mean',
+                                             confidence=0.5)
+    assert low_mean < np.mean(values) < high_mean
+    assert high_mean - low_mean < high - low
+
+    with pytest.raises(ValueError, match='statistic=max should be'):
+        stats.bootstrap_ci(values, statistic='max')
+
+
+def test_resultset_robust_aggregation():
+    res = ResultSet({'N': [1] * 7, 'wall_time': [1.0, 1.1, 0.9, 1.0, 1.05,
+                                                 0.95, 10.0]}, index=['N'])
+    agg = res.groupby('N').agg('robust')
+    assert agg.metrics == [('wall_time', 'median'), ('wall_time', 'mad'),
+                           ('wall_time', 'ci_low'), ('wall_time', 'ci_high'),
+                           ('wall_time', 'n_outliers')]
+    row = agg[0]
+    assert row[('wall_time', 'n_outliers')] == 1
+    assert (row[('wall_time', 'ci_low')] <= 1.0 <=
+            row[('wall_time', 'ci_high')])
+
+
+@pytest.mark.parametrize('to_dataframe', [None, True])
+def test_benchmark_robust_aggregation(to_dataframe, monkeypatch):
+    if to_dataframe:
+        pytest.importorskip('pandas')
+    # the bootstrap is computed once per group and per metric
+    calls = []
+    bootstrap_ci = stats.bootstrap_ci
+
+    def counting_bootstrap_ci(values, **kwargs):
+        calls.append(len(values))
+        return bootstrap_ci(values, **kwargs)
+
+    monkeypatch.setattr(stats, 'bootstrap_ci', counting_bootstrap_ci)
+    monkeypatch.setattr(stats, '_CI_CACHE', stats.OrderedDict())
+    res = Benchmark(repeat=5, aggregate='robust', to_dataframe=to_dataframe)(
+        delayed(sum, tags={'N': N})(range(N)) for N in [10, 20])
+    if to_dataframe:
+        assert set(res.columns.levels[1]) == {
+            'median', 'mad', 'ci_low', 'ci_high', 'n_outliers'}
+        assert list(res.index) == [10, 20]
+    else:
+        assert ('wall_time', 'ci_high') in res.metrics
+        assert res['N'] == [10, 20]
+    assert calls == [5, 5]
@@ -0,0 +1,151 @@
+# neurtu, BSD 3 clause license
+# Authors: Roman Yurchak
+
+import math
+import os
+
+import pytest
+
+from neurtu import ResultSet
+from neurtu import store as store_module
+from neurtu.store import ResultStore
+
+
+def _results(n_samples=5, offset=0.0, **metadata):
+    columns = {'algo': [], 'N': [], 'runid': [], 'wall_time': []}
+    for algo in ['a', 'b']:
+        for N in [10, 100]:
+            for runid in range(n_samples):
+                columns['algo'].append(algo)
+                columns['N'].append(N)
+                columns['runid'].append(runid)
+                columns['wall_time'].append(N * (1 + runid) + offset)
+    return ResultSet(columns, index=['algo', 'N', 'runid'],
+                     metadata=metadata)
+
+
+@pytest.fixture(params=['numpy', 'python'])
+def backend(request, monkeypatch):
+    if request.param == 'numpy':
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(store_module, 'import_or_none',
+                            lambda name: None)
+    return request.param
+
+
+def test_store_append_read(tmpdir, backend):
+    path = str(tmpdir.join('store'))
+    store = ResultStore(path)
+    assert len(store) == 0
+    assert len(store.read()) == 0
+    assert store.append(_results(commit='abc')) == 0
+    assert store.append(_results(offset=1)) == 1
+
+    # reopened from disk
+    store = ResultStore(path)
+    assert len(store) == 40
+    assert store.tag_names == ['algo', 'N']
+    # the runid is not stored
+    assert store.metrics == ['wall_time']
+    assert store.cases() == [{'algo': 'a', 'N': 10}, {'algo': 'a', 'N': 100},
+                             {'algo': 'b', 'N': 10}, {'algo': 'b', 'N': 100}]
+    runs = store.runs()
+    assert [run['run'] for run in runs] == [0, 1]
+    assert runs[0]['metadata'] == {'commit': 'abc'}
+    assert runs[0]['rows'] == 20
+
+    res = store.read()
+    assert res.index == ['algo', 'N', 'run']
+    expected = []
+    for run in [0, 1]:
+        for row in _results(offset=run).to_records():
+            del row['runid']
+            expected.append(dict(row, run=run))
+    assert res.to_records() == expected
+
+    res = store.read(metrics=['wall_time'], runs=[1], algo='b', N=10)
+    assert res.columns == ['algo', 'N', 'run', 'wall_time']
+    assert list(res['wall_time']) == [11, 21, 31, 41, 51]
+
+    with pytest.raises(ValueError, match='Tag other not found'):
+        store.read(other=1)
+    with pytest.raises(ValueError, match='Metric other not found'):
+        store.read(metrics='other')
+
+
+def test_store_numpy_tags(tmpdir):
+    np = pytest.importorskip('numpy')
+    store = ResultStore(str(tmpdir))
+    store.append(ResultSet({'N': list(np.array([10, 100])),
+                            'alpha': list(np.array([0.5, 1.5])),
+                            'wall_time': [0.1, 0.2]}, index=['N', 'alpha']))
+    store = ResultStore(str(tmpdir))
+    assert store.cases() == [{'N': 10, 'alpha': 0.5},
+                             {'N': 100, 'alpha': 1.5}]
+    assert list(store.read(N=10)['wall_time']) == [0.1]
+    assert list(store.read(N=np.int64(100))['wall_time']) == [0.2]
+    res = store.aggregate(by='N', metrics='wall_time')
+    assert list(res['N']) == [10, 100]
+
+
+def test_store_schema_changes(tmpdir):
+    store = ResultStore(str(tmpdir))
+    store.append(ResultSet({'N': [1, 2], 'wall_time': [0.1, 0.2]},
+                           index=['N']))
+    store.append(ResultSet({'N': [1], 'algo': ['x'], 'cpu_time': [0.3],
+                            'error': ['']}, index=['N', 'algo']))
+    store = ResultStore(str(tmpdir))
+    assert store.tag_names == ['N', 'algo']
+    assert store.metrics == ['wall_time', 'cpu_time']
+    res = store.read()
+    assert list(res['algo']) == [None, None, 'x']
+    assert list(res['N']) == [1, 2, 1]
+    assert math.isnan(res['cpu_time'][0])
+    assert res['cpu_time'][2] == 0.3
+    assert math.isnan(res['wall_time'][2])
+
+
+def test_store_interrupted_append(tmpdir):
+    store = ResultStore(str(tmpdir))
+    store.append(_results())
+    # rows written without updating store.json are ignored
+    with open(str(tmpdir.join('metric_0.f64')), 'ab') as fh:
+        fh.write(b'\x00' * 24)
+    with open(str(tmpdir.join('cases.jsonl')), 'a') as fh:
+        fh.write('{"algo": "c"')
+    store = ResultStore(str(tmpdir))
+    assert len(store.read()) == 20
+    store.append(_results())
+    store = ResultStore(str(tmpdir))
+    assert len(store.read()) == 40
+    assert len(store.cases()) == 4
+    assert os.path.getsize(str(tmpdir.join('metric_0.f64'))) == 40 * 8
+
+    tmpdir.join('store.json').write('{"format": "other"}')
+    with pytest.raises(ValueError, match='not a neurtu result store'):
+        ResultStore(str(tmpdir))
+
+
+@pytest.mark.parametrize('chunk_size', [3, 1000])
+def test_store_aggregate(tmpdir, backend, chunk_size):
+    store = ResultStore(str(tmpdir))
+    store.append(_results())
+    store.append(_results(offset=1))
+    methods = ['count', 'sum', 'mean', 'var', 'std', 'min', 'max']
+
+    res = store.aggregate(by=['algo', 'N'], methods=methods,
+                          metrics='wall_time', chunk_size=chunk_size)
+    expected = store.read().groupby(['algo', 'N']).agg(methods)
+    assert res.index == ['algo', 'N']
+    for key in res.columns:
+        assert list(res[key]) == pytest.approx(list(expected[key]))
+
+    res = store.aggregate(by=['run', 'N'], metrics='wall_time',
+                          chunk_size=chunk_size, algo='a', runs=[1])
+    assert res.to_records() == [{'run': 1, 'N': 10, 'wall_time': 31},
+                                {'run': 1, 'N': 100, 'wall_time': 301}]
+
+    assert len(store.aggregate(algo='c')) == 0
+    with pytest.raises(ValueError, match='not a supported out-of-core'):
+        store.aggregate(methods='median')
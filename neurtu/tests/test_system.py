@@ -0,0 +1,128 @@
+# neurtu, BSD 3 clause license
+# Authors: Roman Yurchak
+
+import os
+import warnings
+
+import pytest
+
+from neurtu import Benchmark, delayed
+from neurtu import system
+from neurtu.system import (Isolation, check_settings, cpu_settings,
+                           fixable_settings)
+
+pytestmark = pytest.mark.skipif(not hasattr(os, 'sched_setaffinity'),
+                                reason='requires sched_setaffinity')
+
+
+@pytest.fixture
+def sysfs(tmpdir, monkeypatch):
+    for cpu, (governor, cur) in enumerate([('powersave', '1000000'),
+                                           ('performance', '3000000')]):
+        base = tmpdir.mkdir('cpu%d' % cpu).mkdir('cpufreq')
+        base.join('scaling_governor').write(governor + '\n')
+        base.join('scaling_min_freq').write('800000\n')
+        base.join('scaling_max_freq').write('4000000\n')
+        base.join('scaling_cur_freq').write(cur + '\n')
+    tmpdir.mkdir('intel_pstate').join('no_turbo').write('0\n')
+    monkeypatch.setattr(system, '_SYSFS_CPU', str(tmpdir))
+    return tmpdir
+
+
+def test_cpu_settings(sysfs):
+    settings = cpu_settings([0, 1])
+    assert settings == {'governor': 'powersave,performance',
+                        'min_freq_mhz': 800, 'max_freq_mhz': 4000,
+                        'cur_freq_mhz': 2000, 'turbo': True, 'smt': None}
+    assert cpu_settings([1])['governor'] == 'performance'
+
+    issues = check_settings(settings, load=2.5)
+    assert len(issues) == 3
+    assert 'powersave' in issues[0]
+    assert 'between 800 and 4000 MHz' in issues[0]
+    assert 'turbo' in issues[1]
+    assert '2.50' in issues[2]
+
+    assert check_settings(cpu_settings([1])) == ['turbo boost is enabled']
+
+
+def test_fixable_settings(sysfs):
+    # the performance governor is not available
+    assert fixable_settings([0, 1]) == {'turbo'}
+    for cpu in [0, 1]:
+        sysfs.join('cpu%d' % cpu, 'cpufreq',
+                   'scaling_available_governors').write(
+                       'performance powersave\n')
+    assert fixable_settings([0, 1]) == {'governor', 'turbo'}
+
+    settings = cpu_settings([0, 1])
+    assert check_settings(settings, fixable=set()) == []
+    assert check_settings(settings, fixable={'turbo'}) == [
+        'turbo boost is enabled']
+
+    initial = cpu_settings([0, 1])
+    sysfs.join('intel_pstate', 'no_turbo').write('1\n')
+    assert check_settings(cpu_settings([0, 1]), fixable=set(),
+                          initial=initial) == [
+        'turbo changed from True to False during the benchmark']
+
+
+def test_isolation():
+    affinity = os.sched_getaffinity(0)
+    cpu = sorted(affinity)[-1]
+    with Isolation(cpus=[cpu]) as isolation:
+        assert os.sched_getaffinity(0) == {cpu}
+        assert isolation.report()['cpus'] == [cpu]
+        assert isolation.report()['pinned']
+    assert os.sched_getaffinity(0) == affinity
+
+    # the process is only pinned to the given CPUs
+    with Isolation() as isolation:
+        assert os.sched_getaffinity(0) == affinity
+        assert isolation.report()['cpus'] == sorted(affinity)
+        assert not isolation.report()['pinned']
+    assert os.sched_getaffinity(0) == affinity
+
+
+def test_benchmark_isolated(sysfs):
+    affinity = os.sched_getaffinity(0)
+
+    def n_cpus(obj):
+        return len(os.sched_getaffinity(0))
+
+    bench = Benchmark(system='isolated', n_cpus=n_cpus)
+    with pytest.warns(UserWarning, match='Noisy system: turbo') as record:
+        res = bench([delayed(sum, tags={'N': N})(range(N))
+                     for N in [10, 20]])
+    # the governor cannot be changed
+    assert not any('governor' in str(el.message) for el in record)
+    # multi-threaded cases keep all available CPUs by default
+    assert list(res['n_cpus']) == [len(affinity)] * 2
+    assert all(val >= 0 for val in res['loadavg_before'])
+    assert all(val >= 0 for val in res['loadavg_after'])
+    assert res.metadata['system']['cpus'] == sorted(affinity)
+    assert res.metadata['system']['warnings']
+    assert os.sched_getaffinity(0) == affinity
+
+    # settings that changed during the benchmark
+    def disable_turbo(obj):
+        sysfs.join('intel_pstate', 'no_turbo').write('1\n')
+        return 0
+
+    bench = Benchmark(system='isolated', disable_turbo=disable_turbo)
+    with pytest.warns(UserWarning) as record:
+        res = bench([delayed(sum, tags={'N': N})(range(N))
+                     for N in [10, 20]])
+    assert any('turbo changed from True to False' in str(el.message)
+               for el in record)
+    assert 'turbo changed from True to False during the benchmark' in \
+        res.metadata['system']['warnings']
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        # the default benchmark does not check the system
+        row = Benchmark()(delayed(sum)(range(10)))
+    assert 'loadavg_before' not in row
+
+    with pytest.raises(ValueError, match='system=other'):
+        Benchmark(system='other')